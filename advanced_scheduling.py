@@ -1,8 +1,12 @@
+import math
 import random
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import json
 import os
+from availability import AvailabilityMatrix
 
 class AdvancedScheduler:
     def __init__(self):
@@ -27,6 +31,8 @@ class AdvancedScheduler:
             }
         }
         self.current_language = 'ar'
+        # معلومات آخر عملية حل (الوضع، الأمثلية، عدد التحسينات، الزمن)
+        self.last_solve_info = {}
         
     def set_language(self, lang_code: str) -> None:
         """تغيير لغة النظام"""
@@ -46,38 +52,59 @@ class AdvancedScheduler:
             previous_supervisions = teacher.get('previous_supervisions', 0)
             # حساب الإجازات
             leaves = teacher.get('leaves', 0)
+            if isinstance(leaves, list):
+                leaves = len(leaves)
             # حساب العبء الكلي
             workload[teacher_id] = previous_supervisions - leaves
         return workload
     
-    def check_availability(self, teacher: Dict, date: datetime, existing_schedule: List[Dict]) -> bool:
-        """التحقق من توفر المراقب في وقت محدد"""
-        # التحقق من الإجازات
-        if 'leaves' in teacher:
-            for leave in teacher['leaves']:
-                leave_date = datetime.strptime(leave['date'], '%Y-%m-%d')
-                if leave_date.date() == date.date():
-                    return False
-        
-        # التحقق من التعارضات في الجدول
+    def build_availability(self, exams: List[Dict], teachers: List[Dict],
+                           existing_schedule: List[Dict] = ()) -> AvailabilityMatrix:
+        """بناء مصفوفة التوفر من إجازات المراقبين والجدول الحالي مرة واحدة"""
+        availability = AvailabilityMatrix([t['id'] for t in teachers], [exam['date'] for exam in exams])
+        for teacher in teachers:
+            leaves = teacher.get('leaves', [])
+            if not isinstance(leaves, list):
+                continue
+            for leave in leaves:
+                start = leave.get('start_date', leave.get('date'))
+                availability.add_leave(teacher['id'], start, leave.get('end_date', start))
+        
         for schedule in existing_schedule:
-            if schedule['teacher_id'] == teacher['id']:
-                schedule_date = datetime.strptime(schedule['date'], '%Y-%m-%d')
-                if schedule_date.date() == date.date():
-                    return False
+            # عناصر التوزيع تحمل قائمة supervisors والجداول القديمة تحمل teacher_id
+            for teacher_id in schedule.get('supervisors', [schedule.get('teacher_id')]):
+                availability.assign(teacher_id, schedule['date'])
+        return availability
+    
+    def check_availability(self, teacher: Dict, date: datetime, existing_schedule: List[Dict],
+                           availability: Optional[AvailabilityMatrix] = None) -> bool:
+        """التحقق من توفر المراقب في وقت محدد
         
-        return True
+        عند تمرير availability يكون الفحص بزمن ثابت دون المرور على الإجازات والجدول.
+        """
+        if availability is None:
+            availability = self.build_availability([{'date': date}], [teacher], existing_schedule)
+        return availability.is_free(teacher['id'], date)
     
-    def distribute_supervisors(self, exams: List[Dict], teachers: List[Dict], rooms: List[Dict]) -> List[Dict]:
-        """توزيع المراقبين على القاعات بشكل متوازن"""
+    def distribute_supervisors(self, exams: List[Dict], teachers: List[Dict], rooms: List[Dict],
+                               mode: str = 'greedy', time_budget: Optional[float] = 10.0) -> List[Dict]:
+        """توزيع المراقبين على القاعات بشكل متوازن
+
+        mode='greedy' يستخدم الاختيار المتسلسل، و mode='optimal' يحل نموذج التدفق بأقل تكلفة
+        خلال time_budget ثانية.
+        """
+        if mode == 'optimal':
+            return self._distribute_optimal(exams, teachers, rooms, time_budget)
+        
         distribution = []
         workload = self.calculate_workload(teachers)
+        availability = self.build_availability(exams, teachers)
         
         for exam in exams:
             exam_date = datetime.strptime(exam['date'], '%Y-%m-%d')
             available_teachers = [
                 t for t in teachers 
-                if self.check_availability(t, exam_date, distribution)
+                if self.check_availability(t, exam_date, distribution, availability)
             ]
             
             if not available_teachers:
@@ -99,6 +126,7 @@ class AdvancedScheduler:
                     selected_teacher = available_teachers.pop(0)
                     supervisors.append(selected_teacher['id'])
                     workload[selected_teacher['id']] += 1
+                    availability.assign(selected_teacher['id'], exam['date'])
                 
                 if len(supervisors) == needed_supervisors:
                     distribution.append({
@@ -110,47 +138,263 @@ class AdvancedScheduler:
         
         return distribution
     
-    def optimize_schedule(self, distribution: List[Dict]) -> List[Dict]:
-        """تحسين الجدول لتقليل التعارضات وتحقيق التوازن"""
-        # تنفيذ خوارزمية التحسين
-        optimized = distribution.copy()
-        changes_made = True
-        
-        while changes_made:
-            changes_made = False
-            for i in range(len(optimized)):
-                for j in range(i + 1, len(optimized)):
-                    # محاولة تبديل المراقبين لتحسين التوزيع
-                    if self._try_swap_supervisors(optimized[i], optimized[j]):
-                        changes_made = True
+    def _distribute_optimal(self, exams: List[Dict], teachers: List[Dict], rooms: List[Dict],
+                            time_budget: Optional[float]) -> List[Dict]:
+        """توزيع أمثل بنموذج تدفق بأقل تكلفة
+
+        الشبكة: المصدر -> التاريخ (سعة = مقاعد ذلك اليوم) -> المراقب المتاح (سعة 1)
+        -> المصب عبر أقواس محدبة تكلفة المراقبة رقم k فيها 2k-1، فيصبح الهدف هو
+        مجموع مربعات عبء العمل المتراكم. نبدأ بتدفق ممكن ثم نلغي الدورات السالبة،
+        وكل دورة سالبة هي مسار متناوب ينقل مراقبة من مراقب عبؤه L إلى مراقب عبؤه L-2 أو أقل.
+        """
+        started = time.monotonic()
+        deadline = started + time_budget if time_budget else None
+        workload = self.calculate_workload(teachers)
+        teacher_ids = [t['id'] for t in teachers]
+        
+        # تجميع الامتحانات حسب التاريخ لأن المراقب لا يراقب مرتين في اليوم نفسه
+        exams_by_date = {}
+        for exam in exams:
+            exams_by_date.setdefault(exam['date'], []).append(exam)
+        dates = sorted(exams_by_date)
+        seats = {
+            date: len(exams_by_date[date]) * sum(room.get('required_supervisors', 2) for room in rooms)
+            for date in dates
+        }
+        
+        availability = self.build_availability(exams, teachers)
+        available = {
+            date: [tid for tid in teacher_ids if not availability.on_leave(tid, date)]
+            for date in dates
+        }
+        
+        # التدفق الابتدائي: أقل المراقبين عبئاً في كل يوم
+        load = dict(workload)
+        assigned = {}
+        for date in dates:
+            if len(available[date]) < seats[date]:
+                raise ValueError(self.get_text('errors', 'no_teachers'))
+            chosen = sorted(available[date], key=lambda tid: load[tid])[:seats[date]]
+            assigned[date] = set(chosen)
+            for tid in chosen:
+                load[tid] += 1
+        
+        duties = {tid: set() for tid in teacher_ids}
+        for date in dates:
+            for tid in assigned[date]:
+                duties[tid].add(date)
+        
+        improvements = 0
+        optimal = True
+        while True:
+            if deadline and time.monotonic() > deadline:
+                optimal = False
+                break
+            path = self._find_improving_path(dates, available, assigned, duties, load)
+            if not path:
+                break
+            # تطبيق المسار: كل مراقب في المسار يسلم مراقبته في ذلك اليوم لمن بعده
+            for giver, date, receiver in path:
+                assigned[date].discard(giver)
+                assigned[date].add(receiver)
+                duties[giver].discard(date)
+                duties[receiver].add(date)
+            load[path[0][0]] -= 1
+            load[path[-1][2]] += 1
+            improvements += 1
+        
+        # توزيع المراقبين المختارين على مقاعد القاعات
+        distribution = []
+        for date in dates:
+            pool = sorted(assigned[date])
+            for exam in exams_by_date[date]:
+                for room in rooms:
+                    needed = room.get('required_supervisors', 2)
+                    supervisors, pool = pool[:needed], pool[needed:]
+                    distribution.append({
+                        'exam_id': exam['id'],
+                        'room_id': room['id'],
+                        'date': exam['date'],
+                        'supervisors': supervisors
+                    })
+        
+        self.last_solve_info = {
+            'mode': 'optimal',
+            'optimal': optimal,
+            'improvements': improvements,
+            'objective': sum((load[tid]) ** 2 for tid in teacher_ids),
+            'elapsed': time.monotonic() - started
+        }
+        return distribution
+    
+    def _find_improving_path(self, dates: List[str], available: Dict[str, List], assigned: Dict[str, set],
+                             duties: Dict[int, set], load: Dict[int, int]) -> Optional[List[Tuple]]:
+        """البحث عن مسار متناوب من مراقب عبؤه L إلى مراقب عبؤه L-2 أو أقل"""
+        if not load:
+            return None
+        lowest, highest = min(load.values()), max(load.values())
+        
+        for level in range(highest, lowest + 1, -1):
+            # بحث بالعرض متعدد المصادر من كل من عبؤه level أو أكثر
+            parent = {tid: None for tid, value in load.items() if value >= level and duties[tid]}
+            queue = deque(parent)
+            expanded_dates = set()
+            while queue:
+                giver = queue.popleft()
+                for date in duties[giver]:
+                    if date in expanded_dates:
+                        continue
+                    expanded_dates.add(date)
+                    for receiver in available[date]:
+                        if receiver in parent or receiver in assigned[date]:
+                            continue
+                        parent[receiver] = (giver, date)
+                        if load[receiver] <= level - 2:
+                            path = []
+                            node = receiver
+                            while parent[node]:
+                                previous, via = parent[node]
+                                path.append((previous, via, node))
+                                node = previous
+                            return path[::-1]
+                        queue.append(receiver)
+        return None
+    
+    def optimize_schedule(self, distribution: List[Dict], teachers: Optional[List[Dict]] = None,
+                          time_budget: Optional[float] = 5.0, max_iterations: int = 20000,
+                          seed: Optional[int] = None, progress=None, gap_weight: float = 1.0) -> List[Dict]:
+        """تحسين الجدول بالتلدين المحاكى مع تقييم تفاضلي للحركات
         
+        الحركات: استبدال مراقب في مقعد بمراقب آخر، أو تبديل مراقبين بين تاريخين مختلفين.
+        كل حركة تعيد حساب عبء وفجوات المراقبَين المتأثرين فقط، ولا تُقبل حركة تضع المراقب
+        مرتين في اليوم نفسه أو في يوم إجازته. يتوقف عند time_budget ثانية أو max_iterations،
+        ويُستدعى progress(iteration, current, best) دورياً لعرض تقدم الهدف.
+        """
+        started = time.monotonic()
+        rng = random.Random(seed)
+        optimized = [dict(entry, supervisors=list(entry['supervisors'])) for entry in distribution]
+        if teachers is None:
+            teachers = [{'id': tid} for tid in sorted({t for entry in optimized for t in entry['supervisors']})]
+        
+        load, days, ordinals = self._schedule_state(optimized, teachers)
+        availability = self.build_availability(optimized, teachers)
+        teacher_ids = list(load)
+        slots = [(i, k) for i, entry in enumerate(optimized) for k in range(len(entry['supervisors']))]
+        
+        current = initial = sum(self._teacher_cost(load[tid], days[tid], gap_weight) for tid in teacher_ids)
+        best = current
+        best_supervisors = [list(entry['supervisors']) for entry in optimized]
+        history = [(0, best)]
+        report_every = max(1, max_iterations // 20)
+        start_temperature, end_temperature = 2.0, 0.05
+        accepted = 0
+        iteration = 0
+        
+        while slots and len(teacher_ids) > 1 and iteration < max_iterations:
+            iteration += 1
+            if iteration % report_every == 0:
+                history.append((iteration, best))
+                if progress:
+                    progress(iteration, current, best)
+            elapsed = time.monotonic() - started
+            if time_budget and elapsed > time_budget:
+                break
+            fraction = iteration / max_iterations
+            if time_budget:
+                fraction = max(fraction, elapsed / time_budget)
+            temperature = start_temperature * (end_temperature / start_temperature) ** fraction
+            
+            i, k = rng.choice(slots)
+            entry, day = optimized[i], ordinals[i]
+            a = entry['supervisors'][k]
+            
+            if rng.random() < 0.5:
+                # استبدال: المقعد ينتقل من a إلى b في اليوم نفسه
+                b = rng.choice(teacher_ids)
+                if day in days[b] or availability.on_leave(b, entry['date']):
+                    continue
+                before = (self._teacher_cost(load[a], days[a], gap_weight)
+                          + self._teacher_cost(load[b], days[b], gap_weight))
+                days[a].discard(day)
+                days[b].add(day)
+                load[a] -= 1
+                load[b] += 1
+                delta = (self._teacher_cost(load[a], days[a], gap_weight)
+                         + self._teacher_cost(load[b], days[b], gap_weight) - before)
+                if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                    entry['supervisors'][k] = b
+                else:
+                    days[b].discard(day)
+                    days[a].add(day)
+                    load[a] += 1
+                    load[b] -= 1
+                    continue
+            else:
+                # تبديل: a يأخذ مقعد b في يومه والعكس، فلا يتغير العبء بل الفجوات فقط
+                j, m = rng.choice(slots)
+                other, other_day = optimized[j], ordinals[j]
+                b = other['supervisors'][m]
+                if (a == b or day == other_day or other_day in days[a] or day in days[b]
+                        or availability.on_leave(a, other['date']) or availability.on_leave(b, entry['date'])):
+                    continue
+                before = (self._teacher_cost(load[a], days[a], gap_weight)
+                          + self._teacher_cost(load[b], days[b], gap_weight))
+                days[a].discard(day)
+                days[a].add(other_day)
+                days[b].discard(other_day)
+                days[b].add(day)
+                delta = (self._teacher_cost(load[a], days[a], gap_weight)
+                         + self._teacher_cost(load[b], days[b], gap_weight) - before)
+                if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                    entry['supervisors'][k] = b
+                    other['supervisors'][m] = a
+                else:
+                    days[a].discard(other_day)
+                    days[a].add(day)
+                    days[b].discard(day)
+                    days[b].add(other_day)
+                    continue
+            
+            accepted += 1
+            current += delta
+            if current < best:
+                best = current
+                best_supervisors = [list(e['supervisors']) for e in optimized]
+        
+        for entry, supervisors in zip(optimized, best_supervisors):
+            entry['supervisors'] = supervisors
+        
+        self.last_solve_info = {
+            'mode': 'anneal',
+            'iterations': iteration,
+            'accepted': accepted,
+            'initial_objective': initial,
+            'objective': best,
+            'history': history,
+            'elapsed': time.monotonic() - started
+        }
         return optimized
     
-    def _try_swap_supervisors(self, schedule1: Dict, schedule2: Dict) -> bool:
-        """محاولة تبديل المراقبين بين جدولين"""
-        if schedule1['date'] == schedule2['date']:
-            return False
-        
-        original_score = self._calculate_schedule_score(schedule1) + self._calculate_schedule_score(schedule2)
-        
-        # تبديل المراقبين
-        temp = schedule1['supervisors']
-        schedule1['supervisors'] = schedule2['supervisors']
-        schedule2['supervisors'] = temp
-        
-        new_score = self._calculate_schedule_score(schedule1) + self._calculate_schedule_score(schedule2)
-        
-        if new_score > original_score:
-            return True
-        else:
-            # إعادة المراقبين إلى مواقعهم الأصلية
-            temp = schedule1['supervisors']
-            schedule1['supervisors'] = schedule2['supervisors']
-            schedule2['supervisors'] = temp
-            return False
+    def _schedule_state(self, distribution: List[Dict], teachers: List[Dict]) -> Tuple[Dict, Dict, List[int]]:
+        """حساب عبء كل مراقب وأيام مراقباته (بالترتيب الترتيبي للتاريخ) من الجدول"""
+        load = self.calculate_workload(teachers)
+        days = {tid: set() for tid in load}
+        ordinals = [datetime.strptime(entry['date'][:10], '%Y-%m-%d').toordinal() for entry in distribution]
+        for entry, day in zip(distribution, ordinals):
+            for tid in entry['supervisors']:
+                load[tid] = load.get(tid, 0) + 1
+                days.setdefault(tid, set()).add(day)
+        return load, days, ordinals
+    
+    def _teacher_cost(self, load: int, days: set, gap_weight: float) -> float:
+        """تكلفة مراقب واحد: مربع العبء مع عقوبة المراقبات في يومين متتاليين"""
+        back_to_back = sum(1 for day in days if day + 1 in days)
+        return load * load + gap_weight * back_to_back
     
-    def _calculate_schedule_score(self, schedule: Dict) -> float:
-        """حساب درجة جودة الجدول"""
-        score = 0.0
-        # يمكن إضافة المزيد من المعايير لحساب الدرجة
-        return score
\ No newline at end of file
+    def _calculate_schedule_score(self, distribution: List[Dict], teachers: Optional[List[Dict]] = None,
+                                  gap_weight: float = 1.0) -> float:
+        """حساب الهدف الكامل للجدول (الأقل أفضل) للتحقق من التقييم التفاضلي"""
+        if teachers is None:
+            teachers = []
+        load, days, _ = self._schedule_state(distribution, teachers)
+        return sum(self._teacher_cost(load[tid], days[tid], gap_weight) for tid in load)
@@ -1,13 +1,16 @@
-from flask import Flask, request, jsonify
-from database import Database
+from flask import Flask, Response, request, jsonify, stream_with_context
+from database import get_database_service
 from session_manager import SessionManager
 from security_monitor import SecurityMonitor
+from contextlib import ExitStack
 from functools import wraps
+import atexit
 import logging
 import json
 
 app = Flask(__name__)
-db = Database()
+db = get_database_service().start()
+atexit.register(get_database_service().stop)
 session_manager = SessionManager()
 logger = logging.getLogger('api')
 
@@ -174,6 +177,23 @@ def get_teachers():
         logger.error(f'خطأ في استرجاع المراقبين: {str(e)}')
         return jsonify({'error': 'حدث خطأ أثناء استرجاع المراقبين'}), 500
 
+@app.route('/api/stats/queries', methods=['GET'])
+@require_token
+def get_query_stats():
+    """إحصائيات زمن تنفيذ الاستعلامات"""
+    try:
+        token = request.headers.get('Authorization')
+        session_info = session_manager.get_session_info(token)
+        
+        if 'manage_users' not in session_info['permissions']:
+            return jsonify({'error': 'ليس لديك صلاحية لعرض إحصائيات الاستعلامات'}), 403
+        
+        limit = request.args.get('limit', type=int)
+        return jsonify({'enabled': db.query_stats is not None, 'queries': db.get_query_stats(limit)})
+    except Exception as e:
+        logger.error(f'خطأ في استرجاع إحصائيات الاستعلامات: {str(e)}')
+        return jsonify({'error': 'حدث خطأ أثناء استرجاع إحصائيات الاستعلامات'}), 500
+
 @app.route('/api/export', methods=['GET'])
 @require_token
 def export_data():
@@ -185,14 +205,38 @@ def export_data():
         if 'manage_users' not in session_info['permissions']:
             return jsonify({'error': 'ليس لديك صلاحية لتصدير البيانات'}), 403
         
-        data = {
-            'teachers': db.get_all_teachers(),
-            'rooms': db.get_all_rooms(),
-            'exam_dates': db.get_all_exam_dates(),
-            'distributions': db.get_distributions()
-        }
+        # كل أجزاء التصدير من لقطة قراءة فقط واحدة تُفتح قبل بدء الاستجابة، فأخطاء فتحها
+        # وقراءة الجداول الصغيرة تصل إلى except أدناه وتعود 500
+        snapshot = ExitStack()
+        try:
+            conn = snapshot.enter_context(db.snapshot())
+            data = {
+                'teachers': conn.execute('SELECT id, name FROM teachers').fetchall(),
+                'rooms': conn.execute('SELECT id, name, capacity, required_supervisors FROM rooms').fetchall(),
+                'exam_dates': conn.execute('SELECT id, date FROM exam_dates').fetchall()
+            }
+        except Exception:
+            snapshot.close()
+            raise
+        
+        def generate():
+            # التوزيعات تُبث صفاً صفاً بعد إرسال الترويسة، فالخطأ هنا لا يمكن أن يصبح 500
+            with snapshot:
+                yield json.dumps(data, ensure_ascii=False)[:-1] + ', "distributions": ['
+                try:
+                    for index, row in enumerate(db.iter_distributions(conn=conn)):
+                        yield (',' if index else '') + json.dumps(row, ensure_ascii=False)
+                except Exception as e:
+                    logger.error(f'خطأ أثناء بث التصدير: {str(e)}')
+                    # إغلاق JSON مع حقل error حتى يعرف العميل أن التوزيعات ناقصة
+                    yield '], "error": "حدث خطأ أثناء تصدير البيانات"}'
+                    return
+            yield ']}'
         
-        return jsonify(data)
+        response = Response(stream_with_context(generate()), mimetype='application/json')
+        # العميل قد ينقطع قبل بدء البث فلا يدخل المولد كتلة with أبداً
+        response.call_on_close(snapshot.close)
+        return response
     except Exception as e:
         logger.error(f'خطأ في تصدير البيانات: {str(e)}')
         return jsonify({'error': 'حدث خطأ أثناء تصدير البيانات'}), 500
@@ -215,23 +259,33 @@ def import_data():
         if not all(section in data for section in required_sections):
             return jsonify({'error': 'البيانات غير مكتملة'}), 400
         
-        # استيراد البيانات
-        for teacher in data['teachers']:
-            db.add_teacher(teacher['name'], teacher.get('experience', 'متوسط'))
-        
-        for room in data['rooms']:
-            db.add_room(room['name'], room.get('capacity', 0))
-        
-        for date in data['exam_dates']:
-            db.add_exam_date(date['date'])
+        # التوزيعات تقبل المعرفات أو الأسماء (date / room / teacher1 / teacher2)؛ الأسماء يجب أن تكون
+        # ضمن أقسام الملف نفسه حتى لا يُكتب مقعد فارغ بدل مراقب غير معروف
+        known = {
+            'date': {date['date'] for date in data['exam_dates']},
+            'room': {room['name'] for room in data['rooms']},
+            'teacher1': {teacher['name'] for teacher in data['teachers']},
+            'teacher2': {teacher['name'] for teacher in data['teachers']},
+        }
+        unknown = sorted({str(dist[key]) for dist in data['distributions'] for key in known
+                          if dist.get(key) is not None and dist[key] not in known[key]})
+        if unknown:
+            return jsonify({'error': 'التوزيعات تشير إلى أسماء غير موجودة في البيانات', 'unknown': unknown}), 400
         
-        for dist in data['distributions']:
-            db.add_distribution(
-                dist['date_id'],
-                dist['room_id'],
-                dist['teacher1_id'],
-                dist['teacher2_id']
-            )
+        # استيراد كل الأقسام في معاملة واحدة: أي خطأ يلغي الاستيراد كاملاً
+        with db.pool.write():
+            teacher_ids = db.bulk_upsert_teachers(
+                (teacher['name'], teacher.get('experience')) for teacher in data['teachers'])
+            room_ids = db.bulk_upsert_rooms((room['name'], room.get('capacity')) for room in data['rooms'])
+            date_ids = db.bulk_upsert_exam_dates(date['date'] for date in data['exam_dates'])
+            db.bulk_upsert_distributions(
+                (date_ids[dist['date']] if 'date' in dist else dist['date_id'],
+                 room_ids[dist['room']] if 'room' in dist else dist['room_id'],
+                 teacher_ids[dist['teacher1']] if dist.get('teacher1') is not None else dist.get('teacher1_id'),
+                 teacher_ids[dist['teacher2']] if dist.get('teacher2') is not None else dist.get('teacher2_id'))
+                for dist in data['distributions'])
+        # التوابع الداخلية أبطلت الذاكرة المؤقتة قبل الحفظ؛ الإبطال بعده يمنع تخزين قراءة سابقة له
+        db.invalidate('teachers', 'rooms', 'exam_dates', 'distributions')
         
         return jsonify({'message': 'تم استيراد البيانات بنجاح'})
     except Exception as e:
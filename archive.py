@@ -0,0 +1,204 @@
+import argparse
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# بداية العام الدراسي (سبتمبر)؛ العام 2024 يمتد من 2024-09-01 إلى 2025-08-31
+ACADEMIC_YEAR_START_MONTH = 9
+
+ARCHIVE_PATTERN = re.compile(r'^archive_(\d{4})\.db$')
+
+# شروط اختيار صفوف العام من كل جدول (المعاملان: بداية العام وبداية العام التالي)
+_YEAR_DATES = "SELECT id FROM main.exam_dates WHERE date >= :start AND date < :end"
+YEAR_ROWS = {
+    'exam_dates': 'date >= :start AND date < :end',
+    'distributions': f'date_id IN ({_YEAR_DATES})',
+    'assignments': f'date_id IN ({_YEAR_DATES})',
+    # الإجازة تتبع العام الذي تنتهي فيه حتى لا تُقسم إجازة تمتد بين عامين
+    'leaves': 'end_date >= :start AND end_date < :end',
+    'logs': 'created_at >= :start AND created_at < :end',
+}
+
+# ترتيب النسخ يحترم المفاتيح الخارجية داخل ملف الأرشيف؛ الحذف من الملف الرئيسي بالترتيب العكسي
+ARCHIVED_TABLES = ('exam_dates', 'distributions', 'assignments', 'leaves', 'logs')
+
+
+class ArchiveError(Exception):
+    """فشل التحقق من نسخة الأرشيف؛ لا يُحذف شيء من قاعدة البيانات الرئيسية"""
+
+
+def academic_year(day: str) -> int:
+    """العام الدراسي لتاريخ بصيغة YYYY-MM-DD"""
+    year, month = int(day[:4]), int(day[5:7])
+    return year if month >= ACADEMIC_YEAR_START_MONTH else year - 1
+
+
+def year_bounds(year: int) -> Dict[str, str]:
+    return {'start': f'{year}-{ACADEMIC_YEAR_START_MONTH:02d}-01',
+            'end': f'{year + 1}-{ACADEMIC_YEAR_START_MONTH:02d}-01'}
+
+
+def archive_path(directory: str, year: int) -> str:
+    return os.path.join(directory, f'archive_{year}.db')
+
+
+def archived_years(directory: str) -> List[int]:
+    """الأعوام التي لها ملف أرشيف في المجلد"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(match.group(1)) for match in map(ARCHIVE_PATTERN.match, os.listdir(directory)) if match)
+
+
+def _create_like_main(conn: sqlite3.Connection, table: str) -> None:
+    """إنشاء الجدول في الأرشيف بتعريفه في الملف الرئيسي (مع أعمدة الترحيلات اللاحقة)"""
+    sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    sql = re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?["\[]?\w+["\]]?',
+                 f'CREATE TABLE IF NOT EXISTS archive.{table}', sql.strip(), flags=re.IGNORECASE)
+    conn.execute(sql)
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> str:
+    return ', '.join(row[1] for row in conn.execute(f'PRAGMA main.table_info({table})'))
+
+
+def _missing(conn: sqlite3.Connection, table: str, bounds: Dict[str, str]) -> int:
+    """عدد صفوف العام في الملف الرئيسي التي لا توجد مطابقة تماماً (كل الأعمدة) في الأرشيف"""
+    columns = _columns(conn, table)
+    return conn.execute(f'''
+        SELECT COUNT(*) FROM (
+            SELECT {columns} FROM main.{table} WHERE {YEAR_ROWS[table]}
+            EXCEPT SELECT {columns} FROM archive.{table})
+    ''', bounds).fetchone()[0]
+
+
+def _copy_year(conn: sqlite3.Connection, bounds: Dict[str, str]) -> None:
+    for table in ('users', 'teachers', 'rooms') + ARCHIVED_TABLES:
+        _create_like_main(conn, table)
+    # نسخ المراجع كما كانت وقت الأرشفة حتى تبقى الأسماء صحيحة بعد حذف مراقب أو قاعة
+    conn.execute(f'''
+        INSERT OR IGNORE INTO archive.teachers ({_columns(conn, 'teachers')})
+        SELECT {_columns(conn, 'teachers')} FROM main.teachers WHERE id IN (
+            SELECT teacher_id FROM main.assignments WHERE {YEAR_ROWS['assignments']}
+            UNION SELECT teacher_id FROM main.leaves WHERE {YEAR_ROWS['leaves']})
+    ''', bounds)
+    conn.execute(f'''
+        INSERT OR IGNORE INTO archive.rooms ({_columns(conn, 'rooms')})
+        SELECT {_columns(conn, 'rooms')} FROM main.rooms WHERE id IN (
+            SELECT room_id FROM main.distributions WHERE {YEAR_ROWS['distributions']})
+    ''', bounds)
+    # المستخدمون دون كلمات المرور
+    conn.execute(f'''
+        INSERT OR IGNORE INTO archive.users (id, username, password, role)
+        SELECT id, username, '', role FROM main.users WHERE id IN (
+            SELECT user_id FROM main.logs WHERE {YEAR_ROWS['logs']}
+            UNION SELECT approved_by FROM main.leaves WHERE {YEAR_ROWS['leaves']})
+    ''', bounds)
+    for table in ARCHIVED_TABLES:
+        columns = _columns(conn, table)
+        conn.execute(f'INSERT OR IGNORE INTO archive.{table} ({columns}) '
+                     f'SELECT {columns} FROM main.{table} WHERE {YEAR_ROWS[table]}', bounds)
+
+
+def _verify(conn: sqlite3.Connection, bounds: Dict[str, str]) -> Dict[str, int]:
+    counts = {}
+    for table in ARCHIVED_TABLES:
+        missing = _missing(conn, table, bounds)
+        if missing:
+            raise ArchiveError(f'{missing} صفاً من {table} لم تُنسخ إلى الأرشيف كما هي')
+        counts[table] = conn.execute(f'SELECT COUNT(*) FROM main.{table} WHERE {YEAR_ROWS[table]}',
+                                     bounds).fetchone()[0]
+    result = conn.execute('PRAGMA archive.integrity_check').fetchone()[0]
+    if result != 'ok':
+        raise ArchiveError(f'فشل فحص سلامة الأرشيف: {result}')
+    violations = conn.execute('PRAGMA archive.foreign_key_check').fetchall()
+    if violations:
+        raise ArchiveError(f'مراجع مفقودة في الأرشيف: {violations[:5]}')
+    return counts
+
+
+def archive_academic_year(pool, year: int, directory: Optional[str] = None,
+                          today: Optional[date] = None) -> Dict[str, int]:
+    """نقل عام دراسي منتهٍ إلى archive_<year>.db ثم حذفه من قاعدة البيانات الرئيسية
+
+    النسخ يتم في معاملة، ثم يُتحقق من وجود كل صف في الأرشيف بكل أعمدته ومن integrity_check
+    و foreign_key_check للأرشيف، وبعدها فقط يُحذف العام من الملف الرئيسي في معاملة ثانية. إعادة التشغيل بعد
+    انقطاع آمنة لأن النسخ يتجاهل الصفوف الموجودة.
+
+    Returns:
+        dict: عدد الصفوف المنقولة من كل جدول
+    """
+    today = today or date.today()
+    if academic_year(today.isoformat()) <= year:
+        raise ValueError(f'العام الدراسي {year} لم ينته بعد')
+    directory = directory or os.path.dirname(os.path.abspath(pool.path))
+    bounds = year_bounds(year)
+
+    with pool.exclusive() as conn:
+        conn.execute('ATTACH DATABASE ? AS archive', (archive_path(directory, year),))
+        try:
+            with pool.write() as conn:
+                _copy_year(conn, bounds)
+            counts = _verify(conn, bounds)
+            with pool.write() as conn:
+                # حذف التوزيعات يحذف مقاعدها من assignments ويحدث teacher_workload عبر المشغلات
+                for table in ('logs', 'leaves', 'distributions', 'exam_dates'):
+                    conn.execute(f'DELETE FROM main.{table} WHERE {YEAR_ROWS[table]}', bounds)
+        finally:
+            conn.execute('DETACH DATABASE archive')
+    return counts
+
+
+@contextmanager
+def attached_archives(conn: sqlite3.Connection, directory: str, years: Optional[Iterable[int]] = None):
+    """إرفاق ملفات الأرشيف للقراءة فقط باسم archive_<year> وإرجاع أسماء مخططاتها
+
+    يُستخدم مع Database.snapshot() للتقارير عبر الأعوام؛ SQLite يسمح بعشرة ملفات مرفقة افتراضياً.
+    """
+    available = archived_years(directory)
+    years = available if years is None else [year for year in years if year in available]
+    schemas = []
+    try:
+        for year in years:
+            uri = Path(archive_path(directory, year)).resolve().as_uri() + '?mode=ro'
+            conn.execute(f'ATTACH DATABASE ? AS archive_{year}', (uri,))
+            schemas.append(f'archive_{year}')
+        yield schemas
+    finally:
+        # لا يمكن الفصل داخل معاملة قراءة مفتوحة؛ اتصال اللقطة يُغلق بعدها على أي حال
+        if not conn.in_transaction:
+            for schema in schemas:
+                conn.execute(f'DETACH DATABASE {schema}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='أرشفة الأعوام الدراسية المنتهية')
+    parser.add_argument('year', type=int, nargs='?', help='العام الدراسي (سنة البداية)')
+    parser.add_argument('--db', default='exam_system.db')
+    parser.add_argument('--dir', default=None, help='مجلد ملفات الأرشيف (افتراضياً مجلد قاعدة البيانات)')
+    parser.add_argument('--list', action='store_true', help='عرض الأعوام المؤرشفة')
+    args = parser.parse_args(argv)
+
+    from connection_pool import ConnectionPool
+    directory = args.dir or os.path.dirname(os.path.abspath(args.db))
+    if args.list or args.year is None:
+        print('الأعوام المؤرشفة:', ', '.join(map(str, archived_years(directory))) or 'لا يوجد')
+        return
+    pool = ConnectionPool(args.db)
+    try:
+        counts = archive_academic_year(pool, args.year, directory)
+    except (ValueError, ArchiveError) as e:
+        print(f'❌ {e}')
+        return 1
+    finally:
+        pool.close()
+    print(f'✅ تمت أرشفة العام {args.year} في {archive_path(directory, args.year)}')
+    for table, count in counts.items():
+        print(f'  {table}: {count}')
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,140 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+INSERT_LOG = 'INSERT INTO logs (user_id, action, details, created_at) VALUES (?, ?, ?, ?)'
+
+# علامات التحكم في الطابور: _FLUSH يكتب الدفعة الحالية فوراً و None يوقف الخيط
+_FLUSH = object()
+
+
+class AuditLogger:
+    """كاتب سجل العمليات في الخلفية (write-behind)
+
+    log() يضع السجل في طابور محدود ويعود فوراً، وخيط واحد يكتب السجلات على دفعات
+    (عند امتلاء الدفعة أو مرور flush_interval) بمعاملة واحدة لكل دفعة عبر كاتب مجمع
+    الاتصالات. التحقق من المستخدم يتم من مجموعة معرفات مخزنة تُحدث عند أول معرف غير معروف.
+    """
+
+    def __init__(self, pool, batch_size: int = 100, flush_interval: float = 1.0,
+                 max_queue: int = 10000, put_timeout: float = 5.0):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.dropped = 0
+        self.written = 0
+        self._user_ids = None
+        self._users_lock = threading.Lock()
+        self.logger = logging.getLogger('database')
+
+    def start(self) -> None:
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._worker, name='audit-log', daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        """كتابة كل السجلات المتبقية ثم إيقاف الخيط"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def flush(self) -> None:
+        """انتظار كتابة كل السجلات الموجودة في الطابور
+
+        لا تُستدعى من داخل معاملة pool.write() مفتوحة لأن الخيط يحتاج قفل الكاتب.
+        """
+        if self.thread is not None:
+            self.queue.put(_FLUSH)
+            self.queue.join()
+
+    def _known_user(self, user_id) -> bool:
+        with self._users_lock:
+            if self._user_ids is None:
+                with self.pool.read() as conn:
+                    self._user_ids = {row[0] for row in conn.execute('SELECT id FROM users')}
+            if user_id in self._user_ids:
+                return True
+        # مستخدم أضيف بعد تحميل المجموعة: استعلام واحد ثم يُحفظ
+        with self.pool.read() as conn:
+            exists = conn.execute('SELECT 1 FROM users WHERE id = ?', (user_id,)).fetchone()
+        if exists:
+            with self._users_lock:
+                self._user_ids.add(user_id)
+        return bool(exists)
+
+    def forget_user(self, user_id) -> None:
+        """إزالة مستخدم محذوف من المجموعة المخزنة"""
+        with self._users_lock:
+            if self._user_ids is not None:
+                self._user_ids.discard(user_id)
+
+    def log(self, user_id, action, details=None) -> bool:
+        """إضافة سجل إلى الطابور؛ يعيد False إن كان المستخدم غير موجود أو امتلأ الطابور"""
+        if not self._known_user(user_id):
+            self.logger.warning(f'محاولة تسجيل إجراء لمستخدم غير موجود: {user_id}')
+            return False
+        # وقت الإجراء نفسه لا وقت كتابته، بتوقيت UTC كما في CURRENT_TIMESTAMP
+        created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        record = (user_id, action, details, created_at)
+        if self.thread is None:
+            self._write([record])
+            return True
+        try:
+            self.queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            self.logger.error(f'طابور سجل العمليات ممتلئ، تم إسقاط الإجراء: {action}')
+            return False
+        return True
+
+    def _write(self, batch) -> None:
+        try:
+            with self.pool.write() as conn:
+                conn.executemany(INSERT_LOG, batch)
+            self.written += len(batch)
+        except sqlite3.IntegrityError:
+            # مستخدم حُذف بعد وضع سجله في الطابور: كتابة الباقي سجلاً سجلاً
+            for record in batch:
+                try:
+                    with self.pool.write() as conn:
+                        conn.execute(INSERT_LOG, record)
+                    self.written += 1
+                except sqlite3.IntegrityError:
+                    self.dropped += 1
+        except Exception as e:
+            self.dropped += len(batch)
+            self.logger.error(f'خطأ في كتابة سجل العمليات: {e}')
+
+    def _worker(self) -> None:
+        batch = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                record = self.queue.get(timeout=timeout)
+                received = 1
+            except queue.Empty:
+                # انتهت مهلة الدفعة الحالية
+                record, received = _FLUSH, 0
+            if record is not None and record is not _FLUSH:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(record)
+                if len(batch) < self.batch_size:
+                    continue
+                received = 0
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + received):
+                self.queue.task_done()
+            batch = []
+            if record is None:
+                return
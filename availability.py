@@ -0,0 +1,166 @@
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# حالات الإجازة المعتمدة (الواجهة تستخدم 'approved' ومدير الإجازات يستخدم 'موافق عليها')
+APPROVED_LEAVE_STATUSES = ('approved', 'موافق عليها')
+
+
+def _iso(value) -> str:
+    """توحيد التاريخ إلى نص بصيغة YYYY-MM-DD"""
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+class AvailabilityMatrix:
+    """مصفوفة بتات (مراقب × تاريخ امتحان) لمعرفة توفر المراقب بزمن ثابت
+
+    تحتوي على مصفوفتين: بتات الإجازات المعتمدة وبتات المراقبات المسندة. تُحمل مرة واحدة
+    ثم تُحدث تدريجياً عند إضافة إجازة أو إلغائها أو عند إسناد مراقبة أو تحريرها.
+    التواريخ غير الموجودة في المصفوفة تُعامل كأيام متاحة لعدم وجود معلومات عنها.
+    """
+
+    def __init__(self, teacher_ids: Iterable[int], dates: Iterable):
+        self.teacher_ids = list(teacher_ids)
+        self.dates = sorted({_iso(d) for d in dates})
+        self.teacher_index = {teacher_id: i for i, teacher_id in enumerate(self.teacher_ids)}
+        self.date_index = {d: j for j, d in enumerate(self.dates)}
+        # عدد البايتات لكل مراقب
+        self.stride = (len(self.dates) + 7) >> 3
+        self.leave_bits = bytearray(len(self.teacher_ids) * self.stride)
+        self.busy_bits = bytearray(len(self.teacher_ids) * self.stride)
+        # فترات الإجازة لكل مراقب لإعادة بناء صفه عند إلغاء إجازة متداخلة
+        self.leaves: Dict[int, List[Tuple[str, str]]] = {}
+
+    @classmethod
+    def from_db(cls, conn, date_ids: Optional[Iterable[int]] = None,
+                include_assignments: bool = True) -> 'AvailabilityMatrix':
+        """تحميل المراقبين والتواريخ والإجازات المعتمدة والمراقبات الحالية (من assignments)
+
+        ترتيب المراقبين هو ترتيب محرك التوزيع (الخبرة تنازلياً)، و date_ids يقصر
+        التحميل على تواريخ محددة.
+        """
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM teachers ORDER BY experience DESC')
+        teacher_ids = [row[0] for row in cursor.fetchall()]
+
+        if date_ids is None:
+            cursor.execute('SELECT id, date FROM exam_dates')
+        else:
+            date_ids = tuple(date_ids)
+            marks = ','.join('?' for _ in date_ids)
+            cursor.execute(f'SELECT id, date FROM exam_dates WHERE id IN ({marks})', date_ids)
+        exam_dates = cursor.fetchall()
+
+        matrix = cls(teacher_ids, [d for _, d in exam_dates])
+        if not matrix.dates:
+            return matrix
+
+        placeholders = ','.join('?' for _ in APPROVED_LEAVE_STATUSES)
+        cursor.execute(f'''
+            SELECT teacher_id, start_date, end_date FROM leaves
+            WHERE status IN ({placeholders}) AND start_date <= ? AND end_date >= ?
+        ''', APPROVED_LEAVE_STATUSES + (matrix.dates[-1], matrix.dates[0]))
+        for teacher_id, start_date, end_date in cursor.fetchall():
+            matrix.add_leave(teacher_id, start_date, end_date)
+
+        if include_assignments:
+            date_of = {date_id: d for date_id, d in exam_dates}
+            cursor.execute('SELECT date_id, teacher_id FROM assignments')
+            for date_id, teacher_id in cursor.fetchall():
+                if date_id in date_of:
+                    matrix.assign(teacher_id, date_of[date_id])
+        return matrix
+
+    def add_teacher(self, teacher_id: int) -> None:
+        """إضافة صف لمراقب جديد"""
+        if teacher_id in self.teacher_index:
+            return
+        self.teacher_index[teacher_id] = len(self.teacher_ids)
+        self.teacher_ids.append(teacher_id)
+        self.leave_bits.extend(bytes(self.stride))
+        self.busy_bits.extend(bytes(self.stride))
+
+    def column(self, day) -> Optional[int]:
+        """رقم عمود التاريخ أو None إن لم يكن تاريخ امتحان"""
+        return self.date_index.get(_iso(day))
+
+    def _test(self, bits: bytearray, row: int, col: int) -> bool:
+        return bool(bits[row * self.stride + (col >> 3)] & (1 << (col & 7)))
+
+    def _set(self, bits: bytearray, row: int, col: int, on: bool) -> None:
+        index = row * self.stride + (col >> 3)
+        if on:
+            bits[index] |= 1 << (col & 7)
+        else:
+            bits[index] &= ~(1 << (col & 7)) & 0xFF
+
+    def _mark_leave(self, row: int, start_date: str, end_date: str) -> None:
+        # التواريخ بصيغة ISO لذا تكفي المقارنة النصية
+        for col in range(bisect_left(self.dates, start_date), bisect_right(self.dates, end_date)):
+            self._set(self.leave_bits, row, col, True)
+
+    def add_leave(self, teacher_id: int, start_date, end_date) -> None:
+        """تسجيل إجازة معتمدة"""
+        interval = (_iso(start_date), _iso(end_date))
+        self.leaves.setdefault(teacher_id, []).append(interval)
+        row = self.teacher_index.get(teacher_id)
+        if row is not None:
+            self._mark_leave(row, *interval)
+
+    def remove_leave(self, teacher_id: int, start_date, end_date) -> None:
+        """إلغاء إجازة مع إبقاء الإجازات الأخرى المتداخلة معها"""
+        intervals = self.leaves.get(teacher_id, [])
+        interval = (_iso(start_date), _iso(end_date))
+        if interval in intervals:
+            intervals.remove(interval)
+        row = self.teacher_index.get(teacher_id)
+        if row is None:
+            return
+        start = row * self.stride
+        self.leave_bits[start:start + self.stride] = bytes(self.stride)
+        for remaining in intervals:
+            self._mark_leave(row, *remaining)
+
+    def assign(self, teacher_id: int, day) -> None:
+        """تسجيل مراقبة للمراقب في تاريخ"""
+        row, col = self.teacher_index.get(teacher_id), self.column(day)
+        if row is not None and col is not None:
+            self._set(self.busy_bits, row, col, True)
+
+    def release(self, teacher_id: int, day) -> None:
+        """تحرير مراقبة المراقب في تاريخ"""
+        row, col = self.teacher_index.get(teacher_id), self.column(day)
+        if row is not None and col is not None:
+            self._set(self.busy_bits, row, col, False)
+
+    def on_leave_at(self, row: int, col: int) -> bool:
+        """فحص الإجازة بالمواضع مباشرة للمسارات الساخنة في المحرك"""
+        return self._test(self.leave_bits, row, col)
+
+    def on_leave(self, teacher_id: int, day) -> bool:
+        row, col = self.teacher_index.get(teacher_id), self.column(day)
+        if row is None or col is None:
+            return False
+        return self._test(self.leave_bits, row, col)
+
+    def is_free(self, teacher_id: int, day) -> bool:
+        """المراقب ليس في إجازة وليست لديه مراقبة في التاريخ"""
+        row, col = self.teacher_index.get(teacher_id), self.column(day)
+        if row is None or col is None:
+            return True
+        return not (self._test(self.leave_bits, row, col) or self._test(self.busy_bits, row, col))
+
+    def teachers_on_leave(self, day) -> List[int]:
+        col = self.column(day)
+        if col is None:
+            return []
+        return [t for row, t in enumerate(self.teacher_ids) if self._test(self.leave_bits, row, col)]
+
+    def free_teachers(self, day) -> List[int]:
+        col = self.column(day)
+        if col is None:
+            return list(self.teacher_ids)
+        return [t for row, t in enumerate(self.teacher_ids)
+                if not (self._test(self.leave_bits, row, col) or self._test(self.busy_bits, row, col))]
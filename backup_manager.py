@@ -4,6 +4,7 @@ import json
 import os
 from datetime import datetime
 import sqlite3
+from connection_pool import snapshot
 
 class BackupManager:
     def __init__(self, db_path='exam_system.db'):
@@ -14,46 +15,52 @@ class BackupManager:
         if not os.path.exists(self.default_backup_dir):
             os.makedirs(self.default_backup_dir)
     
+    def _read_tables(self, cursor):
+        """استخراج البيانات من الجداول"""
+        data = {}
+        
+        # جدول المستخدمين (بدون كلمات المرور)
+        cursor.execute('SELECT id, username, role, created_at FROM users')
+        data['users'] = [{'id': row[0], 'username': row[1], 'role': row[2], 'created_at': row[3]} 
+                        for row in cursor.fetchall()]
+        
+        # جدول المراقبين
+        cursor.execute('SELECT id, name, experience, specialization, created_at FROM teachers')
+        data['teachers'] = [{'id': row[0], 'name': row[1], 'experience': row[2], 
+                           'specialization': row[3], 'created_at': row[4]} 
+                          for row in cursor.fetchall()]
+        
+        # جدول القاعات
+        cursor.execute('SELECT id, name, capacity, created_at FROM rooms')
+        data['rooms'] = [{'id': row[0], 'name': row[1], 'capacity': row[2], 'created_at': row[3]} 
+                        for row in cursor.fetchall()]
+        
+        # جدول التواريخ
+        cursor.execute('SELECT id, date, created_at FROM exam_dates')
+        data['exam_dates'] = [{'id': row[0], 'date': row[1], 'created_at': row[2]} 
+                             for row in cursor.fetchall()]
+        
+        # جدول التوزيعات
+        cursor.execute('''SELECT id, date_id, room_id, teacher1_id, teacher2_id, created_at 
+                        FROM distributions''')
+        data['distributions'] = [{'id': row[0], 'date_id': row[1], 'room_id': row[2], 
+                                'teacher1_id': row[3], 'teacher2_id': row[4], 'created_at': row[5]} 
+                               for row in cursor.fetchall()]
+        
+        # المقاعد من 3 فما فوق موجودة في assignments فقط؛ المقعدان 1 و 2 تعيدهما مشغلات distributions
+        cursor.execute('SELECT distribution_id, date_id, teacher_id, seat FROM assignments WHERE seat > 2')
+        data['assignments'] = [{'distribution_id': row[0], 'date_id': row[1], 'teacher_id': row[2],
+                                'seat': row[3]}
+                               for row in cursor.fetchall()]
+        
+        return data
+    
     def create_backup(self, custom_path=None):
         """إنشاء نسخة احتياطية من قاعدة البيانات"""
         try:
-            # اتصال بقاعدة البيانات
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # استخراج البيانات من الجداول
-            data = {}
-            
-            # جدول المستخدمين (بدون كلمات المرور)
-            cursor.execute('SELECT id, username, role, created_at FROM users')
-            data['users'] = [{'id': row[0], 'username': row[1], 'role': row[2], 'created_at': row[3]} 
-                            for row in cursor.fetchall()]
-            
-            # جدول المراقبين
-            cursor.execute('SELECT id, name, experience, specialization, created_at FROM teachers')
-            data['teachers'] = [{'id': row[0], 'name': row[1], 'experience': row[2], 
-                               'specialization': row[3], 'created_at': row[4]} 
-                              for row in cursor.fetchall()]
-            
-            # جدول القاعات
-            cursor.execute('SELECT id, name, capacity, created_at FROM rooms')
-            data['rooms'] = [{'id': row[0], 'name': row[1], 'capacity': row[2], 'created_at': row[3]} 
-                            for row in cursor.fetchall()]
-            
-            # جدول التواريخ
-            cursor.execute('SELECT id, date, created_at FROM exam_dates')
-            data['exam_dates'] = [{'id': row[0], 'date': row[1], 'created_at': row[2]} 
-                                 for row in cursor.fetchall()]
-            
-            # جدول التوزيعات
-            cursor.execute('''SELECT id, date_id, room_id, teacher1_id, teacher2_id, created_at 
-                            FROM distributions''')
-            data['distributions'] = [{'id': row[0], 'date_id': row[1], 'room_id': row[2], 
-                                    'teacher1_id': row[3], 'teacher2_id': row[4], 'created_at': row[5]} 
-                                   for row in cursor.fetchall()]
-            
-            # إغلاق الاتصال
-            conn.close()
+            # لقطة قراءة فقط واحدة لكل الجداول فلا تنتظر الكاتب ولا تختلط نسختان من البيانات
+            with snapshot(self.db_path) as conn:
+                data = self._read_tables(conn.cursor())
             
             # إنشاء اسم الملف
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -100,37 +107,37 @@ class BackupManager:
             cursor.execute('DELETE FROM teachers')
             # لا نحذف المستخدمين للحفاظ على حسابات الدخول
             
-            # استعادة البيانات
+            # استعادة البيانات (executemany لكل جدول داخل المعاملة نفسها)
             # المراقبين
-            for teacher in data.get('teachers', []):
-                cursor.execute('''
-                    INSERT OR IGNORE INTO teachers (id, name, experience, specialization, created_at)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (teacher['id'], teacher['name'], teacher['experience'], 
-                       teacher['specialization'], teacher['created_at']))
+            cursor.executemany('''
+                INSERT OR IGNORE INTO teachers (id, name, experience, specialization, created_at)
+                VALUES (:id, :name, :experience, :specialization, :created_at)
+            ''', data.get('teachers', []))
             
             # القاعات
-            for room in data.get('rooms', []):
-                cursor.execute('''
-                    INSERT OR IGNORE INTO rooms (id, name, capacity, created_at)
-                    VALUES (?, ?, ?, ?)
-                ''', (room['id'], room['name'], room['capacity'], room['created_at']))
+            cursor.executemany('''
+                INSERT OR IGNORE INTO rooms (id, name, capacity, created_at)
+                VALUES (:id, :name, :capacity, :created_at)
+            ''', data.get('rooms', []))
             
             # التواريخ
-            for date in data.get('exam_dates', []):
-                cursor.execute('''
-                    INSERT OR IGNORE INTO exam_dates (id, date, created_at)
-                    VALUES (?, ?, ?)
-                ''', (date['id'], date['date'], date['created_at']))
+            cursor.executemany('''
+                INSERT OR IGNORE INTO exam_dates (id, date, created_at)
+                VALUES (:id, :date, :created_at)
+            ''', data.get('exam_dates', []))
             
             # التوزيعات
-            for dist in data.get('distributions', []):
-                cursor.execute('''
-                    INSERT OR IGNORE INTO distributions 
-                    (id, date_id, room_id, teacher1_id, teacher2_id, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (dist['id'], dist['date_id'], dist['room_id'], 
-                       dist['teacher1_id'], dist['teacher2_id'], dist['created_at']))
+            cursor.executemany('''
+                INSERT OR IGNORE INTO distributions 
+                (id, date_id, room_id, teacher1_id, teacher2_id, created_at)
+                VALUES (:id, :date_id, :room_id, :teacher1_id, :teacher2_id, :created_at)
+            ''', data.get('distributions', []))
+            
+            # المقاعد الإضافية (حذف التوزيعات أعلاه حذف مقاعدها القديمة عبر المشغلات)
+            cursor.executemany('''
+                INSERT OR IGNORE INTO assignments (distribution_id, date_id, teacher_id, seat)
+                VALUES (:distribution_id, :date_id, :teacher_id, :seat)
+            ''', data.get('assignments', []))
             
             # حفظ التغييرات
             conn.commit()
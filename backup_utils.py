@@ -6,7 +6,7 @@ from datetime import datetime
 import threading
 import queue
 import logging
-from functools import lru_cache
+from connection_pool import snapshot
 
 class BackupManager:
     def __init__(self, db_path='exam_system.db', backup_dir='backups'):
@@ -69,11 +69,12 @@ class BackupManager:
             except Exception as e:
                 self.logger.error(f'خطأ في خيط النسخ الاحتياطي: {str(e)}')
     
-    @lru_cache(maxsize=128)
-    def get_table_data(self, table_name):
-        """الحصول على بيانات الجدول مع التخزين المؤقت"""
+    def get_table_data(self, table_name, conn=None):
+        """الحصول على بيانات الجدول من لقطة مفتوحة أو من لقطة جديدة"""
+        if conn is None:
+            with snapshot(self.db_path) as conn:
+                return self.get_table_data(table_name, conn)
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute(f'SELECT * FROM {table_name}')
             columns = [description[0] for description in cursor.description]
@@ -82,21 +83,22 @@ class BackupManager:
         except Exception as e:
             self.logger.error(f'خطأ في قراءة بيانات الجدول {table_name}: {str(e)}')
             return None
-        finally:
-            if conn:
-                conn.close()
     
     def create_backup(self):
         """إنشاء نسخة احتياطية من قاعدة البيانات"""
         try:
             backup_data = {}
+            # assignments بعد distributions: استعادة التوزيعات تعيد المقعدين 1 و 2 عبر المشغلات
+            # ثم تستبدل صفوف assignments المحفوظة كل المقاعد ومنها الثالث فما فوق
             tables = ['users', 'permissions', 'teachers', 'rooms', 'exam_dates', 
-                     'distributions', 'logs', 'leaves']
+                     'distributions', 'assignments', 'logs', 'leaves']
             
-            for table in tables:
-                table_data = self.get_table_data(table)
-                if table_data:
-                    backup_data[table] = table_data
+            # كل الجداول من لقطة قراءة فقط واحدة: نسخة متسقة لا تنتظر الكاتب ولا توقفه
+            with snapshot(self.db_path) as conn:
+                for table in tables:
+                    table_data = self.get_table_data(table, conn)
+                    if table_data:
+                        backup_data[table] = table_data
             
             # إنشاء اسم الملف بالتاريخ والوقت
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -0,0 +1,268 @@
+"""قياس أداء خوارزميات توزيع المراقبين على مدارس اصطناعية
+
+يولد مدارس بأحجام مختلفة في ملفات SQLite مؤقتة ثم يقيس لكل محرك زمن التنفيذ
+والإنتاجية (مقعد/ثانية) وذروة الذاكرة ومقاييس العدالة، ويكتب النتائج بصيغة JSON.
+
+الاستخدام:
+    python benchmarks/bench_distribution.py --scale small medium --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from advanced_scheduling import AdvancedScheduler
+from distribution_engine import DistributionEngine
+from migrations import create_assignments, create_teacher_workload
+
+# (مراقبون، قاعات، تواريخ امتحان)
+SCALES = {
+    'small': (50, 20, 10),
+    'medium': (500, 200, 10),
+    'large': (5000, 200, 60),
+}
+
+SCHEMA = '''
+    CREATE TABLE teachers (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL,
+                           experience TEXT DEFAULT 'متوسط', specialization TEXT);
+    CREATE TABLE rooms (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL,
+                        capacity INTEGER DEFAULT 0, required_supervisors INTEGER DEFAULT 2);
+    CREATE TABLE exam_dates (id INTEGER PRIMARY KEY AUTOINCREMENT, date DATE NOT NULL);
+    CREATE TABLE distributions (id INTEGER PRIMARY KEY AUTOINCREMENT, date_id INTEGER, room_id INTEGER,
+                                teacher1_id INTEGER, teacher2_id INTEGER);
+    CREATE TABLE leaves (id INTEGER PRIMARY KEY AUTOINCREMENT, teacher_id INTEGER NOT NULL,
+                         start_date DATE NOT NULL, end_date DATE NOT NULL, reason TEXT,
+                         status TEXT DEFAULT 'قيد المراجعة');
+'''
+
+
+def generate_school(path: str, teachers: int, rooms: int, dates: int, leave_density: float,
+                    seed: int = 0) -> None:
+    """إنشاء مدرسة اصطناعية في ملف SQLite
+
+    leave_density هي نسبة أيام (مراقب × تاريخ) المغطاة بإجازات معتمدة، وتُوزع
+    كإجازات من يوم إلى ثلاثة أيام. لا تُمنح إجازة تجعل أي يوم غير ممكن التوزيع.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    create_assignments(conn)
+    create_teacher_workload(conn)
+    experience = ['مبتدئ', 'متوسط', 'خبير']
+    conn.executemany('INSERT INTO teachers (name, experience) VALUES (?, ?)',
+                     [(f'مراقب {i}', rng.choice(experience)) for i in range(teachers)])
+    conn.executemany('INSERT INTO rooms (name, capacity) VALUES (?, ?)',
+                     [(f'قاعة {i}', 30) for i in range(rooms)])
+
+    start = date(2025, 1, 5)
+    days = [(start + timedelta(days=d)).isoformat() for d in range(dates)]
+    conn.executemany('INSERT INTO exam_dates (date) VALUES (?)', [(d,) for d in days])
+    conn.execute('''
+        INSERT INTO distributions (date_id, room_id)
+        SELECT ed.id, r.id FROM exam_dates ed CROSS JOIN rooms r ORDER BY ed.id, r.id
+    ''')
+
+    seats = rooms * 2
+    on_leave = [0] * dates
+    leaves = []
+    target = int(leave_density * teachers * dates)
+    taken = set()
+    attempts = 0
+    while target > 0 and attempts < target * 10:
+        attempts += 1
+        teacher_id = rng.randrange(1, teachers + 1)
+        first = rng.randrange(dates)
+        last = min(dates - 1, first + rng.randrange(3))
+        span = range(first, last + 1)
+        if any((teacher_id, d) in taken or teachers - on_leave[d] - 1 < seats for d in span):
+            continue
+        for d in span:
+            taken.add((teacher_id, d))
+            on_leave[d] += 1
+        leaves.append((teacher_id, days[first], days[last]))
+        target -= len(span)
+    conn.executemany("INSERT INTO leaves (teacher_id, start_date, end_date, reason, status) "
+                     "VALUES (?, ?, ?, 'اختبار', 'approved')", leaves)
+    conn.commit()
+    conn.close()
+
+
+def fairness(loads: Dict[int, int], duty_days: Dict[int, set]) -> Dict[str, float]:
+    """الفارق بين الأعلى والأدنى والتباين وعدد المراقبات في يومين متتاليين"""
+    values = list(loads.values()) or [0]
+    mean = sum(values) / len(values)
+    return {
+        'spread': max(values) - min(values),
+        'variance': sum((v - mean) ** 2 for v in values) / len(values),
+        'back_to_back': sum(1 for days in duty_days.values() for day in days if day + 1 in days)
+    }
+
+
+def _distribution_fairness(conn) -> Dict[str, float]:
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM teachers')
+    loads = {row[0]: 0 for row in cursor.fetchall()}
+    duty_days = {}
+    cursor.execute('''
+        SELECT ed.date, a.teacher_id
+        FROM assignments a JOIN exam_dates ed ON a.date_id = ed.id
+    ''')
+    for exam_date, teacher_id in cursor.fetchall():
+        loads[teacher_id] += 1
+        duty_days.setdefault(teacher_id, set()).add(datetime.strptime(exam_date, '%Y-%m-%d').toordinal())
+    return fairness(loads, duty_days)
+
+
+def _scheduler_inputs(conn):
+    """تحويل قاعدة البيانات إلى مدخلات AdvancedScheduler (قوائم قواميس)"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, date FROM exam_dates ORDER BY date')
+    exams = [{'id': date_id, 'date': exam_date} for date_id, exam_date in cursor.fetchall()]
+    cursor.execute('SELECT id, required_supervisors FROM rooms')
+    rooms = [{'id': room_id, 'required_supervisors': seats} for room_id, seats in cursor.fetchall()]
+    cursor.execute('SELECT id FROM teachers')
+    teachers = {row[0]: {'id': row[0], 'previous_supervisions': 0, 'leaves': []} for row in cursor.fetchall()}
+    cursor.execute("SELECT teacher_id, start_date, end_date FROM leaves WHERE status = 'approved'")
+    for teacher_id, start_date, end_date in cursor.fetchall():
+        teachers[teacher_id]['leaves'].append({'start_date': start_date, 'end_date': end_date})
+    return exams, list(teachers.values()), rooms
+
+
+def _schedule_fairness(teachers: List[Dict], distribution: List[Dict]) -> Dict[str, float]:
+    loads = {t['id']: 0 for t in teachers}
+    duty_days = {}
+    for entry in distribution:
+        ordinal = datetime.strptime(entry['date'], '%Y-%m-%d').toordinal()
+        for teacher_id in entry['supervisors']:
+            loads[teacher_id] += 1
+            duty_days.setdefault(teacher_id, set()).add(ordinal)
+    return fairness(loads, duty_days)
+
+
+def _measure(func):
+    """تشغيل الدالة مع قياس الزمن وذروة الذاكرة (في العملية الرئيسية فقط)"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    error = None
+    result = None
+    try:
+        result = func()
+    except ValueError as e:
+        error = str(e)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak // 1024, error
+
+
+def run_engines(template: str, workdir: str, budget: float, portfolio_runs: int) -> List[Dict]:
+    """تشغيل كل المحركات على نسخة مستقلة من المدرسة نفسها"""
+    results = []
+
+    def engine_case(name, runs):
+        path = os.path.join(workdir, f'{name}.db')
+        shutil.copyfile(template, path)
+        conn = sqlite3.connect(path)
+        try:
+            _, elapsed, peak, error = _measure(
+                lambda: DistributionEngine(conn, seed=1).run(runs=runs, deadline=budget))
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM assignments')
+            seats = cursor.fetchone()[0]
+            return {'engine': name, 'elapsed': elapsed, 'seats': seats, 'peak_memory_kb': peak,
+                    'fairness': None if error else _distribution_fairness(conn), 'error': error}
+        finally:
+            conn.close()
+
+    # ExamSupervisionSystem.distribute_supervisors يستدعي هذا المحرك مباشرة
+    results.append(engine_case('distribution_engine', 1))
+    if portfolio_runs > 1:
+        results.append(engine_case('distribution_engine_portfolio', portfolio_runs))
+
+    conn = sqlite3.connect(template)
+    exams, teachers, rooms = _scheduler_inputs(conn)
+    conn.close()
+    scheduler = AdvancedScheduler()
+    greedy = None
+    for mode in ('greedy', 'optimal'):
+        distribution, elapsed, peak, error = _measure(
+            lambda: scheduler.distribute_supervisors(exams, teachers, rooms, mode=mode, time_budget=budget))
+        if mode == 'greedy':
+            greedy = distribution
+        results.append({
+            'engine': f'advanced_scheduler_{mode}', 'elapsed': elapsed,
+            'seats': sum(len(entry['supervisors']) for entry in distribution or []),
+            'peak_memory_kb': peak, 'error': error,
+            'fairness': None if error else _schedule_fairness(teachers, distribution)
+        })
+
+    if greedy:
+        distribution, elapsed, peak, error = _measure(
+            lambda: scheduler.optimize_schedule(greedy, teachers, time_budget=budget, seed=1))
+        results.append({
+            'engine': 'advanced_scheduler_anneal', 'elapsed': elapsed,
+            'seats': sum(len(entry['supervisors']) for entry in distribution or []),
+            'peak_memory_kb': peak, 'error': error,
+            'fairness': None if error else _schedule_fairness(teachers, distribution)
+        })
+
+    for result in results:
+        result['throughput'] = result['seats'] / result['elapsed'] if result['elapsed'] else None
+    return results
+
+
+def run_benchmarks(scales: List[str], leave_densities: List[float], budget: float = 10.0,
+                   portfolio_runs: int = 4, seed: int = 0) -> Dict:
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': []
+    }
+    workdir = tempfile.mkdtemp(prefix='exam_bench_')
+    try:
+        for scale in scales:
+            teachers, rooms, dates = SCALES[scale]
+            for density in leave_densities:
+                template = os.path.join(workdir, f'{scale}_{density}.db')
+                generate_school(template, teachers, rooms, dates, density, seed)
+                for result in run_engines(template, workdir, budget, portfolio_runs):
+                    result.update({'scale': scale, 'teachers': teachers, 'rooms': rooms,
+                                   'dates': dates, 'leave_density': density})
+                    report['results'].append(result)
+                    print(f"{scale:<7} leave={density:<5} {result['engine']:<32} "
+                          f"{result['elapsed']:8.3f}s {result['error'] or ''}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='قياس أداء توزيع المراقبين')
+    parser.add_argument('--scale', nargs='+', choices=sorted(SCALES), default=['small', 'medium'])
+    parser.add_argument('--leave-density', nargs='+', type=float, default=[0.0, 0.1])
+    parser.add_argument('--budget', type=float, default=10.0, help='الحد الزمني بالثواني لكل محرك')
+    parser.add_argument('--portfolio-runs', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.scale, args.leave_density, args.budget, args.portfolio_runs, args.seed)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f'تم حفظ النتائج في {args.output}')
+
+
+if __name__ == '__main__':
+    main()
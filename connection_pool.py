@@ -0,0 +1,200 @@
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+from query_stats import InstrumentedConnection
+
+# إعدادات تُطبق على كل اتصال جديد
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -8000',
+)
+
+# انتظار SQLite للقفل داخل الجملة الواحدة؛ ما بعده تتولاه retry_on_busy بتأخير عشوائي
+BUSY_TIMEOUT = 0.25
+
+
+def is_busy(error: Exception) -> bool:
+    return isinstance(error, sqlite3.OperationalError) and (
+        'database is locked' in str(error) or 'database is busy' in str(error))
+
+
+def retry_on_busy(operation, attempts: int = 6, base_delay: float = 0.05, max_delay: float = 1.0):
+    """تنفيذ operation مع إعادة المحاولة عند قفل قاعدة البيانات
+
+    التأخير أسي مع عشوائية كاملة (full jitter) حتى لا يعيد العملاء المتنافسون على الملف
+    المشترك المحاولة في اللحظة نفسها. بعد آخر محاولة يُرفع خطأ القفل للمستدعي.
+    """
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except sqlite3.OperationalError as e:
+            if not is_busy(e) or attempt == attempts - 1:
+                raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+def connect(database: str, timeout: float = BUSY_TIMEOUT, stats=None, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect مع قياس الجمل عند تمرير QueryStats (انظر query_stats.py)"""
+    if stats is None:
+        return sqlite3.connect(database, timeout=timeout, **kwargs)
+    conn = sqlite3.connect(database, timeout=timeout, factory=InstrumentedConnection, **kwargs)
+    conn.stats = stats
+    return conn
+
+
+@contextmanager
+def snapshot(path: str, timeout: float = BUSY_TIMEOUT, stats=None):
+    """اتصال قراءة فقط (mode=ro) مستقل بلقطة WAL ثابتة طوال الكتلة
+
+    للقراءات الطويلة (التقارير والتصدير والنسخ الاحتياطي): لا يشارك الكاتب اتصاله
+    ولا قفله، وكل الاستعلامات داخل الكتلة ترى قاعدة البيانات كما كانت عند فتحها.
+    """
+    uri = Path(path).resolve().as_uri() + '?mode=ro'
+    conn = connect(uri, timeout, stats, uri=True, check_same_thread=False)
+    try:
+        conn.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+        conn.execute('BEGIN')
+        # BEGIN المؤجل لا يثبت اللقطة إلا عند أول قراءة
+        retry_on_busy(lambda: conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone())
+        yield conn
+    finally:
+        conn.close()
+
+
+class ConnectionPool:
+    """مجمع اتصالات SQLite: اتصال قراءة مستقل لكل خيط واتصال كتابة واحد مشترك
+
+    في وضع WAL لا يحجب القراء بعضهم ولا يحجبهم الكاتب، لذا تتوزع طلبات القراءة
+    المتزامنة (مثل طلبات API) على الخيوط، بينما تمر كل الكتابات عبر كاتب واحد محمي بقفل.
+    """
+
+    def __init__(self, path: str, timeout: float = BUSY_TIMEOUT, stats=None, retries: int = 6):
+        self.path = path
+        # timeout هو انتظار القفل لكل جملة، و retries عدد محاولات بدء معاملة الكتابة وحفظها
+        self.timeout = timeout
+        self.retries = retries
+        # QueryStats اختياري؛ بدونه تكون الاتصالات sqlite3 عادية بلا أي كلفة قياس
+        self.stats = stats
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._readers_lock = threading.Lock()
+        self._readers = []
+        self._closed = False
+        # الخيط الذي فتح معاملة write() الحالية؛ وحده ينضم إليها الاستدعاء المتداخل
+        self._owner = None
+        # وقت آخر كتابة (monotonic) تستخدمه الصيانة لتحديد فترات الخمول
+        self.last_write = time.monotonic()
+        self.writer = self._connect()
+
+    def _connect(self, timeout: float = None) -> sqlite3.Connection:
+        timeout = self.timeout if timeout is None else timeout
+        conn = connect(self.path, timeout, self.stats, check_same_thread=False)
+        conn.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def connection(self, timeout: float = None) -> sqlite3.Connection:
+        """اتصال مستقل بإعدادات المجمع نفسها لا يشارك الكاتب؛ يغلقه المستدعي"""
+        if self._closed:
+            raise sqlite3.ProgrammingError('مجمع الاتصالات مغلق')
+        return self._connect(timeout)
+
+    def reader(self) -> sqlite3.Connection:
+        """اتصال القراءة الخاص بالخيط الحالي (يُنشأ عند أول استخدام)"""
+        if self._closed:
+            raise sqlite3.ProgrammingError('مجمع الاتصالات مغلق')
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute('PRAGMA query_only = ON')
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def read(self):
+        """معاملة قراءة بلقطة متسقة على اتصال الخيط الحالي"""
+        conn = self.reader()
+        if conn.in_transaction:
+            # قراءة متداخلة داخل read() آخر على الخيط نفسه
+            yield conn
+            return
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+    def snapshot(self):
+        """لقطة قراءة فقط على اتصال مستقل (انظر snapshot)"""
+        if self._closed:
+            raise sqlite3.ProgrammingError('مجمع الاتصالات مغلق')
+        return snapshot(self.path, self.timeout, self.stats)
+
+    @contextmanager
+    def write(self):
+        """معاملة كتابة على الكاتب الوحيد: تُحفظ عند النجاح وتُلغى عند أي خطأ
+
+        الاستدعاءات المتداخلة من الخيط نفسه تنضم إلى المعاملة الخارجية. الكاتب لا يُستخدم
+        إلا عبر هذا المجمع، فمعاملة مفتوحة عليه لم يبدأها write() خطأ برمجي لا يُنضم إليه.
+        """
+        with self._write_lock:
+            conn = self.writer
+            if self._owner == threading.get_ident():
+                yield conn
+                return
+            if conn.in_transaction:
+                raise sqlite3.ProgrammingError('معاملة مفتوحة على الكاتب خارج write()')
+            # القفل يؤخذ عند BEGIN IMMEDIATE قبل أي عمل، فإعادة المحاولة هنا آمنة دائماً
+            retry_on_busy(lambda: conn.execute('BEGIN IMMEDIATE'), self.retries)
+            self._owner = threading.get_ident()
+            try:
+                yield conn
+                # COMMIT الذي يعيد SQLITE_BUSY يبقي المعاملة مفتوحة ويمكن تكراره
+                retry_on_busy(conn.commit, self.retries)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._owner = None
+                self.last_write = time.monotonic()
+
+    def data_version(self) -> Optional[int]:
+        """PRAGMA data_version للكاتب، أو None إن كان مشغولاً بمعاملة في خيط آخر
+
+        القيمة لا تتغير بما يحفظه الكاتب نفسه، وتتغير عند أي حفظ من اتصال آخر (عامل
+        التوزيع أو عميل آخر على الملف المشترك)، فتكشف الكتابات التي لم تمر بهذا المجمع.
+        """
+        if not self._write_lock.acquire(blocking=False):
+            return None
+        try:
+            return self.writer.execute('PRAGMA data_version').fetchone()[0]
+        finally:
+            self._write_lock.release()
+
+    @contextmanager
+    def exclusive(self):
+        """الكاتب خارج أي معاملة مع حجز قفل الكتابة (لـ VACUUM و wal_checkpoint)"""
+        with self._write_lock:
+            if self.writer.in_transaction:
+                raise sqlite3.ProgrammingError('لا يمكن تنفيذ الصيانة داخل معاملة كتابة مفتوحة')
+            yield self.writer
+
+    def close(self) -> None:
+        """إغلاق الكاتب وكل اتصالات القراءة"""
+        self._closed = True
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        with self._write_lock:
+            self.writer.close()
@@ -1,31 +1,81 @@
 import sqlite3
+import json
 import bcrypt
-from datetime import datetime
+from datetime import datetime, timedelta
 import threading
 import queue
 import time
 import logging
 from backup_utils import BackupManager
-from functools import lru_cache
+from connection_pool import ConnectionPool, retry_on_busy
+from migrations import DEFAULT_PERMISSIONS, WEEKDAY_COLUMNS, migrate, rebuild_teacher_workload
+from query_cache import QueryCache
+from audit_log import AuditLogger
+from archive import archive_academic_year
+from availability import APPROVED_LEAVE_STATUSES, AvailabilityMatrix
+from maintenance import MaintenanceScheduler
+from query_stats import QueryStats
+from contextlib import contextmanager
 import re
 
+def load_database_settings(config_file='config.json'):
+    """قسم database من ملف التكوين (قاموس فارغ إن لم يوجد)"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get('database', {})
+    except (OSError, ValueError):
+        return {}
+
+
+# انتظار القفل لجمل self.conn المباشرة؛ لا إعادة محاولة حولها فيبقى انتظار الأصل
+LEGACY_TIMEOUT = 30
+
+# الجداول التي تُبطل مصفوفة التوفر المشتركة عند الكتابة فيها
+AVAILABILITY_TABLES = frozenset(('teachers', 'exam_dates', 'distributions', 'assignments'))
+
+
+class ConcurrentModificationError(Exception):
+    """الصف تغير (أو حُذف) منذ قراءته؛ يجب إعادة تحميله قبل الحفظ"""
+
+
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('exam_system.db', timeout=30)
-        self.conn.execute('PRAGMA foreign_keys = ON')
-        self.conn.execute('PRAGMA defer_foreign_keys = OFF')
-        self.create_tables()
-        self.conn.execute('PRAGMA foreign_keys = ON')
+    def __init__(self, path='exam_system.db', start_backups=True, settings=None):
+        settings = load_database_settings() if settings is None else settings
+        # قياس زمن كل جملة وسجل الاستعلامات البطيئة؛ عند تعطيله لا تُغلف الاتصالات أصلاً
+        self.query_stats = None
+        if settings.get('query_stats', False):
+            self.query_stats = QueryStats(slow_threshold=settings.get('slow_query_ms', 100) / 1000)
+            self._setup_slow_query_logging()
+        # كاتب واحد محمي بقفل واتصال قراءة لكل خيط، مع وضع WAL على كل اتصال
+        self.pool = ConnectionPool(path, stats=self.query_stats)
+        # اتصال الواجهة القديم (self.conn) مستقل عن كاتب المجمع: معاملاته وحفظه وإلغاؤه لا تمس
+        # معاملات write() في الخيوط الأخرى، ويتنافس معها على قفل الملف فقط
+        self.conn = self.pool.connection(LEGACY_TIMEOUT)
         self.conn.execute('PRAGMA defer_foreign_keys = OFF')
-        self.conn.execute('PRAGMA journal_mode = WAL')
-        self.create_tables()
-        self._create_indexes()
-        self.create_initial_data()
-        self.create_default_admin()
-        self.backup_manager = BackupManager()
-        self.backup_manager.start_backup_thread()
+        # نتائج استعلامات القراءة المتكررة، تُبطل حسب إصدار كل جدول بعد الكتابة
+        self.cache = QueryCache()
+        # مصفوفة التوفر المشتركة (مراقب × تاريخ)؛ تُحمل عند أول طلب وتُحدث بفروق الإجازات
+        self._availability = None
+        self._availability_lock = threading.RLock()
+        # آخر data_version للكاتب؛ تغيره يعني كتابة من اتصال آخر لا تعرف الذاكرة المؤقتة جداولها
+        self._data_version = self.pool.data_version()
+        # الترحيلات تُطبق مرة واحدة؛ التشغيل الدافئ لا ينفذ أي DDL
+        applied = self.create_tables()
+        if 1 in applied:
+            # تشغيل بارد: إنشاء حساب المدير الافتراضي مرة واحدة فقط
+            self.create_default_admin()
+        # خدمة قاعدة البيانات المشتركة تدير خيط نسخ احتياطي واحد للعملية كلها
+        self.backup_manager = BackupManager(path)
+        # الصيانة الدورية (ANALYZE و checkpoint و vacuum) تعمل بجانب النسخ الاحتياطي
+        self.maintenance = MaintenanceScheduler(self.pool)
+        if start_backups:
+            self.backup_manager.start_backup_thread()
+            self.maintenance.start()
         self.logger = logging.getLogger('database')
         self._setup_logging()
+        # سجل العمليات يُكتب في الخلفية على دفعات
+        self.audit = AuditLogger(self.pool)
+        self.audit.start()
 
     def create_initial_data(self):
         cursor = self.conn.cursor()
@@ -34,28 +84,12 @@ class Database:
             cursor.execute('PRAGMA foreign_keys = OFF')
             
             # إضافة الصلاحيات الافتراضية
-            default_permissions = [
-                ('admin', 'manage_users'),
-                ('admin', 'manage_teachers'),
-                ('admin', 'manage_rooms'),
-                ('admin', 'manage_distributions'),
-                ('admin', 'manage_leaves'),
-                ('admin', 'view_reports'),
-                ('manager', 'manage_distributions'),
-                ('manager', 'manage_leaves'),
-                ('manager', 'view_reports'),
-                ('staff', 'manage_teachers'),
-                ('staff', 'manage_rooms'),
-                ('staff', 'manage_distributions'),
-                ('supervisor', 'view_distributions'),
-                ('supervisor', 'manage_notifications')
-            ]
-            
-            for role, permission in default_permissions:
+            for role, permission in DEFAULT_PERMISSIONS:
                 cursor.execute('INSERT OR IGNORE INTO permissions (role, permission) VALUES (?, ?)',
                               (role, permission))
             
             self.conn.commit()
+            self.invalidate('permissions')
             cursor.execute('PRAGMA foreign_keys = ON')
         except Exception as e:
             self.conn.rollback()
@@ -114,176 +148,14 @@ class Database:
         except Exception as e:
             self.conn.rollback()
             print(f"❌ فشل إنشاء المدير: {e}")
-        self.conn = sqlite3.connect('exam_system.db', timeout=30)
-        self.conn.execute('PRAGMA foreign_keys = ON')
-        self.conn.execute('PRAGMA defer_foreign_keys = OFF')
-        self.create_tables()
-        self.conn.execute('PRAGMA foreign_keys = ON')
-        self.conn.execute('PRAGMA defer_foreign_keys = OFF')
-        self.conn.execute('PRAGMA journal_mode = WAL')  # تحسين الأداء باستخدام WAL
-        self.create_tables()
-        self._create_indexes()
-        
-        # إعداد نظام النسخ الاحتياطي
-        self.backup_manager = BackupManager()
-        self.backup_manager.start_backup_thread()
-        
-        # إعداد التسجيل
-        self.logger = logging.getLogger('database')
-        self._setup_logging()
+        # إعادة تفعيل FOREIGN KEY حتى عند الفشل لأن الاتصال مشترك
+        self.conn.execute("PRAGMA foreign_keys = ON")
     
-    def _create_indexes(self):
-        """إنشاء فهارس للحقول المستخدمة بكثرة في عمليات البحث"""
-        cursor = self.conn.cursor()
-        # فهارس للجداول الرئيسية
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_teachers_name ON teachers(name)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_rooms_name ON rooms(name)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_exam_dates_date ON exam_dates(date)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_distributions_date ON distributions(date_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_leaves_teacher ON leaves(teacher_id, start_date, end_date)')
-        self.conn.commit()
-
     def create_tables(self):
-        cursor = self.conn.cursor()
-        
-        # جدول المستخدمين
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL,
-            last_login TIMESTAMP,
-            status TEXT DEFAULT 'active',
-            experience TEXT DEFAULT 'متوسط',
-            email TEXT,
-            phone TEXT,
-            failed_attempts INTEGER DEFAULT 0,
-            last_attempt TIMESTAMP,
-            account_locked_until TIMESTAMP DEFAULT NULL,
-            verification_code TEXT,
-            verification_code_expiry TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # جدول الصلاحيات
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS permissions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            role TEXT NOT NULL,
-            permission TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(role, permission)
-        )
-        ''')
-        
-        # إضافة الصلاحيات الافتراضية
-        default_permissions = [
-            ('admin', 'manage_users'),
-            ('admin', 'manage_teachers'),
-            ('admin', 'manage_rooms'),
-            ('admin', 'manage_distributions'),
-            ('admin', 'manage_leaves'),
-            ('admin', 'view_reports'),
-            ('manager', 'manage_distributions'),
-            ('manager', 'manage_leaves'),
-            ('manager', 'view_reports'),
-            ('staff', 'manage_teachers'),
-            ('staff', 'manage_rooms'),
-            ('staff', 'manage_distributions'),
-            ('supervisor', 'view_distributions'),
-            ('supervisor', 'manage_notifications')
-        ]
-        
-        for role, permission in default_permissions:
-            try:
-                cursor.execute('INSERT OR IGNORE INTO permissions (role, permission) VALUES (?, ?)',
-                              (role, permission))
-            except sqlite3.IntegrityError:
-                pass
-        
-        # جدول المراقبين
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS teachers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            experience TEXT DEFAULT 'متوسط',
-            specialization TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # جدول القاعات
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS rooms (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            capacity INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # جدول التواريخ
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS exam_dates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date DATE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
-        
-        # جدول توزيع المراقبين
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS distributions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date_id INTEGER,
-            room_id INTEGER,
-            teacher1_id INTEGER,
-            teacher2_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (date_id) REFERENCES exam_dates (id),
-            FOREIGN KEY (room_id) REFERENCES rooms (id),
-            FOREIGN KEY (teacher1_id) REFERENCES teachers (id),
-            FOREIGN KEY (teacher2_id) REFERENCES teachers (id)
-        )
-        ''')
-        
-        # جدول السجلات
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            action TEXT NOT NULL,
-            details TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        ''')
-
-
-        
-        # جدول الإجازات
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS leaves (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            teacher_id INTEGER NOT NULL,
-            start_date DATE NOT NULL,
-            end_date DATE NOT NULL,
-            reason TEXT NOT NULL,
-            status TEXT DEFAULT 'قيد المراجعة',
-            approved_by INTEGER,
-            rejection_reason TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (teacher_id) REFERENCES teachers (id),
-            FOREIGN KEY (approved_by) REFERENCES users (id)
-        )
-        ''')
-        
-        self.conn.commit()
+        """تطبيق ترحيلات المخطط الناقصة (انظر migrations.py) وإرجاع أرقامها"""
+        # عدة أجهزة قد تبدأ معاً على الملف المشترك؛ كل ترحيل في معاملته فالإعادة تكمل الناقص فقط
+        with self.pool.exclusive() as conn:
+            return retry_on_busy(lambda: migrate(conn))
     
     def _setup_logging(self):
         """إعداد نظام التسجيل"""
@@ -294,63 +166,79 @@ class Database:
             self.logger.addHandler(handler)
             self.logger.setLevel(logging.INFO)
     
+    def _setup_slow_query_logging(self):
+        """سجل الاستعلامات البطيئة مع خطط تنفيذها في ملف منفصل"""
+        logger = self.query_stats.logger
+        if not logger.handlers:
+            handler = logging.FileHandler('logs/slow_queries.log')
+            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+    
+    def get_query_stats(self, limit=None):
+        """عدد مرات التنفيذ ومدرج زمن كل جملة موحدة مرتبة حسب الزمن الكلي
+        
+        Returns:
+            list: قائمة فارغة إن كان القياس معطلاً
+        """
+        if self.query_stats is None:
+            return []
+        return self.query_stats.report(limit)
+    
     def record_failed_login(self, username):
         """تسجيل محاولة تسجيل دخول فاشلة"""
-        cursor = self.conn.cursor()
         try:
-            # الحصول على عدد المحاولات الفاشلة الحالية
-            cursor.execute('SELECT failed_attempts FROM users WHERE username = ?', (username,))
-            result = cursor.fetchone()
-            failed_attempts = result[0] if result else 0
-            
-            # تحديث عدد المحاولات الفاشلة
-            cursor.execute('''
-                UPDATE users 
-                SET failed_attempts = ?,
-                    last_attempt = CURRENT_TIMESTAMP
-                WHERE username = ?
-            ''', (failed_attempts + 1, username))
-            
-            # قفل الحساب بعد 5 محاولات فاشلة
-            if failed_attempts + 1 >= 5:
+            with self._write('users') as conn:
+                cursor = conn.cursor()
+                # الحصول على عدد المحاولات الفاشلة الحالية
+                cursor.execute('SELECT failed_attempts FROM users WHERE username = ?', (username,))
+                result = cursor.fetchone()
+                failed_attempts = (result[0] or 0) if result else 0
+                
+                # تحديث عدد المحاولات الفاشلة
                 cursor.execute('''
-                    UPDATE users
-                    SET account_locked_until = datetime('now', '+30 minutes')
+                    UPDATE users 
+                    SET failed_attempts = ?,
+                        last_attempt = CURRENT_TIMESTAMP
                     WHERE username = ?
-                ''', (username,))
-            
-            self.conn.commit()
+                ''', (failed_attempts + 1, username))
+                
+                # قفل الحساب بعد 5 محاولات فاشلة
+                if failed_attempts + 1 >= 5:
+                    cursor.execute('''
+                        UPDATE users
+                        SET account_locked_until = datetime('now', '+30 minutes')
+                        WHERE username = ?
+                    ''', (username,))
             self.logger.warning(f'محاولة تسجيل دخول فاشلة للمستخدم: {username}')
         except Exception as e:
             self.logger.error(f'خطأ في تسجيل محاولة الدخول الفاشلة: {e}')
-            self.conn.rollback()
             raise
     
     def reset_failed_login_attempts(self, username):
         """إعادة تعيين عداد محاولات تسجيل الدخول الفاشلة"""
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('''
-                UPDATE users
-                SET failed_login_attempts = 0,
-                    account_locked_until = NULL
-                WHERE username = ?
-            ''', (username,))
-            self.conn.commit()
+            with self._write('users') as conn:
+                conn.execute('''
+                    UPDATE users
+                    SET failed_attempts = 0,
+                        account_locked_until = NULL
+                    WHERE username = ?
+                ''', (username,))
         except Exception as e:
             self.logger.error(f'خطأ في إعادة تعيين محاولات تسجيل الدخول: {e}')
             raise
     
     def is_account_locked(self, username):
         """التحقق مما إذا كان الحساب مقفلاً"""
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('''
-                SELECT account_locked_until
-                FROM users
-                WHERE username = ?
-            ''', (username,))
-            result = cursor.fetchone()
+            with self.pool.read() as conn:
+                result = conn.execute('''
+                    SELECT account_locked_until
+                    FROM users
+                    WHERE username = ?
+                ''', (username,)).fetchone()
             if result and result[0]:
                 lock_time = datetime.strptime(result[0], '%Y-%m-%d %H:%M:%S')
                 return lock_time > datetime.now()
@@ -361,29 +249,27 @@ class Database:
     
     def set_verification_code(self, username, code):
         """تعيين رمز التحقق للمستخدم"""
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('''
-                UPDATE users
-                SET verification_code = ?,
-                    verification_code_expiry = datetime('now', '+30 minutes')
-                WHERE username = ?
-            ''', (code, username))
-            self.conn.commit()
+            with self._write('users') as conn:
+                conn.execute('''
+                    UPDATE users
+                    SET verification_code = ?,
+                        verification_code_expiry = datetime('now', '+30 minutes')
+                    WHERE username = ?
+                ''', (code, username))
         except Exception as e:
             self.logger.error(f'خطأ في تعيين رمز التحقق: {e}')
             raise
     
     def verify_code(self, username, code):
         """التحقق من صحة رمز التحقق"""
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('''
-                SELECT verification_code, verification_code_expiry
-                FROM users
-                WHERE username = ?
-            ''', (username,))
-            result = cursor.fetchone()
+            with self.pool.read() as conn:
+                result = conn.execute('''
+                    SELECT verification_code, verification_code_expiry
+                    FROM users
+                    WHERE username = ?
+                ''', (username,)).fetchone()
             if not result:
                 return False
             
@@ -402,10 +288,9 @@ class Database:
     
     def activate_user(self, user_id):
         """تفعيل حساب المستخدم"""
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('UPDATE users SET status = "active" WHERE id = ?', (user_id,))
-            self.conn.commit()
+            with self._write('users') as conn:
+                conn.execute("UPDATE users SET status = 'active' WHERE id = ?", (user_id,))
             self.logger.info(f'تم تفعيل حساب المستخدم: {user_id}')
         except Exception as e:
             self.logger.error(f'خطأ في تفعيل حساب المستخدم: {e}')
@@ -413,10 +298,9 @@ class Database:
     
     def deactivate_user(self, user_id):
         """إيقاف حساب المستخدم"""
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('UPDATE users SET status = "inactive" WHERE id = ?', (user_id,))
-            self.conn.commit()
+            with self._write('users') as conn:
+                conn.execute("UPDATE users SET status = 'inactive' WHERE id = ?", (user_id,))
             self.logger.info(f'تم إيقاف حساب المستخدم: {user_id}')
         except Exception as e:
             self.logger.error(f'خطأ في إيقاف حساب المستخدم: {e}')
@@ -424,16 +308,16 @@ class Database:
     
     def delete_user(self, user_id):
         """حذف حساب المستخدم"""
-        cursor = self.conn.cursor()
         try:
-            # التحقق من عدم حذف المستخدم الرئيسي
-            cursor.execute('SELECT username FROM users WHERE id = ?', (user_id,))
-            result = cursor.fetchone()
-            if result and result[0] == 'admin':
-                raise ValueError('لا يمكن حذف حساب المستخدم الرئيسي')
-            
-            cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-            self.conn.commit()
+            with self._write('users') as conn:
+                cursor = conn.cursor()
+                # التحقق من عدم حذف المستخدم الرئيسي
+                cursor.execute('SELECT username FROM users WHERE id = ?', (user_id,))
+                result = cursor.fetchone()
+                if result and result[0] == 'admin':
+                    raise ValueError('لا يمكن حذف حساب المستخدم الرئيسي')
+                
+                cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
             self.logger.info(f'تم حذف حساب المستخدم: {user_id}')
         except Exception as e:
             self.logger.error(f'خطأ في حذف حساب المستخدم: {e}')
@@ -446,23 +330,103 @@ class Database:
             return re.sub(r'[;\\\"\'\-\#]', '', value)
         return value
     
-    @lru_cache(maxsize=128)
-    def _get_cached_query(self, query, params=None):
-        """تنفيذ الاستعلام مع التخزين المؤقت"""
-        cursor = self.conn.cursor()
+    def _cached_query(self, query, params=(), tables=(), one=False):
+        """تنفيذ استعلام قراءة عبر الذاكرة المؤقتة، موسوماً بالجداول التي يقرأها"""
+        def load():
+            with self.pool.read() as conn:
+                cursor = conn.execute(query, params)
+                return cursor.fetchone() if one else cursor.fetchall()
+        self._check_external_writes()
+        result = self.cache.get_or_load(query, params, tables, load)
+        # نسخة من القائمة حتى لا يعدل المستدعي النتيجة المخزنة
+        return list(result) if isinstance(result, list) else result
+    
+    @contextmanager
+    def _write(self, *tables):
+        """معاملة كتابة ترفع إصدار الجداول المعدلة بعد الحفظ"""
         try:
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            return cursor.fetchall()
-        except Exception as e:
-            self.logger.error(f'خطأ في تنفيذ الاستعلام: {str(e)}')
-            return None
+            with self.pool.write() as conn:
+                yield conn
+        finally:
+            self.invalidate(*tables)
     
-    def create_user(self, username, password, role, email=None, phone=None, experience=None):
-        cursor = self.conn.cursor()
+    def _versioned_update(self, table, row_id, update_fields, params, expected_version=None):
+        """تحديث صف واحد، وحفظ شرطي (compare-and-swap) عند تمرير expected_version
+        
+        expected_version هو عمود version كما قُرئ مع الصف. إن غيّر مستخدم آخر الصف منذ
+        ذلك يُرفع ConcurrentModificationError بدل الكتابة فوق تعديله.
         
+        Returns:
+            int: الإصدار الجديد للصف (None دون expected_version)
+        """
+        query = f"UPDATE {table} SET {', '.join(update_fields)}"
+        params = list(params)
+        if expected_version is None:
+            query += " WHERE id = ?"
+            params.append(row_id)
+        else:
+            query += ", version = version + 1 WHERE id = ? AND version = ?"
+            params += [row_id, expected_version]
+        with self._write(table) as conn:
+            if conn.execute(query, params).rowcount == 0 and expected_version is not None:
+                raise ConcurrentModificationError(f'{table}:{row_id} تغير منذ الإصدار {expected_version}')
+        return None if expected_version is None else expected_version + 1
+    
+    def invalidate(self, *tables):
+        """إبطال النتائج المخزنة للجداول بعد كتابة خارج توابع Database (مثل self.conn مباشرة)"""
+        self.cache.bump(*tables)
+        # المراقبون والتواريخ والمقاعد تُكتب من مسارات كثيرة فتُعاد المصفوفة عند الطلب التالي؛
+        # الإجازات وحدها تُطبق عليها كفروق (apply_leave_status)
+        if AVAILABILITY_TABLES.intersection(tables):
+            with self._availability_lock:
+                self._availability = None
+    
+    def _check_external_writes(self):
+        """إبطال الذاكرة المؤقتة ومصفوفة التوفر إن حفظ اتصال آخر تغييرات منذ آخر فحص"""
+        version = self.pool.data_version()
+        if version is None or version == self._data_version:
+            return
+        self._data_version = version
+        self.cache.invalidate_all()
+        with self._availability_lock:
+            self._availability = None
+    
+    def get_availability(self):
+        """مصفوفة التوفر المشتركة (انظر availability.py)"""
+        self._check_external_writes()
+        with self._availability_lock:
+            if self._availability is None:
+                with self.pool.read() as conn:
+                    self._availability = AvailabilityMatrix.from_db(conn)
+            return self._availability
+    
+    def apply_leave_status(self, teacher_id, start_date, end_date, old_status, new_status):
+        """تحديث المصفوفة المشتركة بعد حفظ تغيير حالة إجازة بدل إعادة تحميلها"""
+        was_approved = old_status in APPROVED_LEAVE_STATUSES
+        if was_approved == (new_status in APPROVED_LEAVE_STATUSES):
+            return
+        with self._availability_lock:
+            matrix = self._availability
+            if matrix is None:
+                # التحميل التالي يقرأ الحالة المحفوظة
+                return
+            interval = (str(start_date)[:10], str(end_date)[:10])
+            if was_approved:
+                matrix.remove_leave(teacher_id, *interval)
+            elif interval not in matrix.leaves.get(teacher_id, []):
+                # قد تكون المصفوفة حُملت بعد الحفظ وفيها الإجازة بالفعل
+                matrix.add_leave(teacher_id, *interval)
+    
+    def get_cache_stats(self):
+        """عدادات الإصابة والإخفاق والإزاحة للذاكرة المؤقتة"""
+        return self.cache.stats()
+    
+    def get_user_permissions(self, role):
+        """صلاحيات الدور (مخزنة مؤقتاً لأنها تُقرأ مع كل طلب API)"""
+        rows = self._cached_query('SELECT permission FROM permissions WHERE role = ?', (role,), ('permissions',))
+        return [row[0] for row in rows]
+    
+    def create_user(self, username, password, role, email=None, phone=None, experience=None):
         # تنظيف المدخلات
         username = self._sanitize_input(username)
         role = self._sanitize_input(role)
@@ -470,27 +434,28 @@ class Database:
         phone = self._sanitize_input(phone) if phone else None
         experience = self._sanitize_input(experience) if experience else None
         try:
-            # التحقق من عدم وجود المستخدم
-            cursor.execute('SELECT id, role FROM users WHERE LOWER(username) = LOWER(?)', (username,))
-            existing_user = cursor.fetchone()
-            
-            # إذا كان المستخدم موجود وليس المستخدم الافتراضي admin
-            if existing_user and not (username.lower() == 'admin' and role == 'admin'):
-                raise ValueError("اسم المستخدم موجود بالفعل")
-            
-            # إذا كان المستخدم هو admin وموجود بالفعل، نتخطى الإنشاء
-            if existing_user and username.lower() == 'admin' and role == 'admin':
-                return True
-            
-            # تشفير كلمة المرور
+            # تشفير كلمة المرور خارج قفل الكتابة لأنه بطيء عمداً
             hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
             
-            # تخزين المستخدم مع كلمة المرور المشفرة والمعلومات الإضافية
-            cursor.execute('''
-                INSERT OR REPLACE INTO users (username, password, role, experience, email, phone, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (username, hashed_password.decode('utf-8'), role, experience or 'متوسط', email, phone, 'active'))
-            self.conn.commit()
+            with self._write('users') as conn:
+                cursor = conn.cursor()
+                # التحقق من عدم وجود المستخدم
+                cursor.execute('SELECT id, role FROM users WHERE LOWER(username) = LOWER(?)', (username,))
+                existing_user = cursor.fetchone()
+                
+                # إذا كان المستخدم موجود وليس المستخدم الافتراضي admin
+                if existing_user and not (username.lower() == 'admin' and role == 'admin'):
+                    raise ValueError("اسم المستخدم موجود بالفعل")
+                
+                # إذا كان المستخدم هو admin وموجود بالفعل، نتخطى الإنشاء
+                if existing_user and username.lower() == 'admin' and role == 'admin':
+                    return True
+                
+                # تخزين المستخدم مع كلمة المرور المشفرة والمعلومات الإضافية
+                cursor.execute('''
+                    INSERT OR REPLACE INTO users (username, password, role, experience, email, phone, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (username, hashed_password.decode('utf-8'), role, experience or 'متوسط', email, phone, 'active'))
             return True
         except ValueError as ve:
             raise ve
@@ -505,16 +470,15 @@ class Database:
 
     
     def verify_user(self, username, password):
-        cursor = self.conn.cursor()
         try:
             username = self._sanitize_input(username)
             
-            cursor.execute('''
-                SELECT id, password, role, status, failed_attempts, account_locked_until 
-                FROM users 
-                WHERE LOWER(username) = LOWER(?)
-            ''', (username,))
-            result = cursor.fetchone()
+            with self.pool.read() as conn:
+                result = conn.execute('''
+                    SELECT id, password, role, status, failed_attempts, account_locked_until 
+                    FROM users 
+                    WHERE LOWER(username) = LOWER(?)
+                ''', (username,)).fetchone()
             
             if not result:
                 self.logger.warning(f'محاولة تسجيل دخول لمستخدم غير موجود: {username}')
@@ -541,42 +505,37 @@ class Database:
             
             if bcrypt.checkpw(password, stored_password):
                 # إعادة تعيين محاولات تسجيل الدخول الفاشلة
-                cursor.execute('''
-                    UPDATE users 
-                    SET last_login = CURRENT_TIMESTAMP,
-                        failed_attempts = 0,
-                        account_locked_until = NULL,
-                        last_attempt = NULL
-                    WHERE id = ?
-                ''', (user_id,))
-                self.conn.commit()
+                with self._write('users') as conn:
+                    conn.execute('''
+                        UPDATE users 
+                        SET last_login = CURRENT_TIMESTAMP,
+                            failed_attempts = 0,
+                            account_locked_until = NULL,
+                            last_attempt = NULL
+                        WHERE id = ?
+                    ''', (user_id,))
                 self.logger.info(f'تسجيل دخول ناجح للمستخدم: {username}')
                 return user_id, role
             else:
-                # تسجيل محاولة فاشلة
-                new_failed_attempts = (failed_attempts or 0) + 1
-                lock_account = new_failed_attempts >= 5
-                
-                if lock_account:
-                    lock_until = datetime.now() + timedelta(minutes=30)
-                    cursor.execute('''
+                # تسجيل محاولة فاشلة؛ العداد يُقرأ داخل معاملة الكتابة حتى لا تضيع محاولة متزامنة
+                with self._write('users') as conn:
+                    failed_attempts = conn.execute('SELECT failed_attempts FROM users WHERE id = ?',
+                                                   (user_id,)).fetchone()[0]
+                    new_failed_attempts = (failed_attempts or 0) + 1
+                    lock_account = new_failed_attempts >= 5
+                    lock_until = datetime.now() + timedelta(minutes=30) if lock_account else None
+                    conn.execute('''
                         UPDATE users 
                         SET failed_attempts = ?,
                             last_attempt = CURRENT_TIMESTAMP,
-                            account_locked_until = ?
+                            account_locked_until = COALESCE(?, account_locked_until)
                         WHERE id = ?
-                    ''', (new_failed_attempts, lock_until.strftime('%Y-%m-%d %H:%M:%S'), user_id))
-                    self.conn.commit()
+                    ''', (new_failed_attempts, lock_until and lock_until.strftime('%Y-%m-%d %H:%M:%S'), user_id))
+                
+                if lock_account:
                     self.logger.warning(f'تم قفل حساب {username} بعد {new_failed_attempts} محاولات فاشلة')
                     raise ValueError("تم قفل الحساب مؤقتاً بسبب كثرة المحاولات الفاشلة. يرجى المحاولة بعد 30 دقيقة")
                 else:
-                    cursor.execute('''
-                        UPDATE users 
-                        SET failed_attempts = ?,
-                            last_attempt = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    ''', (new_failed_attempts, user_id))
-                    self.conn.commit()
                     self.logger.warning(f'محاولة تسجيل دخول فاشلة للمستخدم: {username} (المحاولة {new_failed_attempts})')
                     raise ValueError("اسم المستخدم أو كلمة المرور غير صحيحة")
                 
@@ -597,27 +556,28 @@ class Database:
         Raises:
             Exception: في حالة وجود خطأ أثناء عملية الحذف
         """
-        cursor = self.conn.cursor()
         try:
-            # التحقق من وجود المستخدم
-            cursor.execute('SELECT username, role FROM users WHERE id = ?', (user_id,))
-            user = cursor.fetchone()
-            if not user:
-                raise Exception('المستخدم غير موجود')
-            
-            username, role = user
-            
-            # لا يمكن حذف المستخدم الرئيسي
-            if username.lower() == 'admin':
-                raise Exception('لا يمكن حذف المستخدم الرئيسي')
-            
-            # حذف سجلات المستخدم من الجداول المرتبطة
-            cursor.execute('DELETE FROM logs WHERE user_id = ?', (user_id,))
-            cursor.execute('UPDATE leaves SET approved_by = NULL WHERE approved_by = ?', (user_id,))
-            
-            # حذف المستخدم
-            cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-            self.conn.commit()
+            with self._write('users', 'logs', 'leaves') as conn:
+                cursor = conn.cursor()
+                # التحقق من وجود المستخدم
+                cursor.execute('SELECT username, role FROM users WHERE id = ?', (user_id,))
+                user = cursor.fetchone()
+                if not user:
+                    raise Exception('المستخدم غير موجود')
+                
+                username, role = user
+                
+                # لا يمكن حذف المستخدم الرئيسي
+                if username.lower() == 'admin':
+                    raise Exception('لا يمكن حذف المستخدم الرئيسي')
+                
+                # حذف سجلات المستخدم من الجداول المرتبطة
+                cursor.execute('DELETE FROM logs WHERE user_id = ?', (user_id,))
+                cursor.execute('UPDATE leaves SET approved_by = NULL WHERE approved_by = ?', (user_id,))
+                
+                # حذف المستخدم
+                cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+            self.audit.forget_user(user_id)
             
             # تسجيل عملية الحذف
             self.log_action(user_id, 'حذف مستخدم', f'تم حذف المستخدم {username}')
@@ -626,55 +586,41 @@ class Database:
             return True
             
         except Exception as e:
-            self.conn.rollback()
             self.logger.error(f'خطأ في حذف المستخدم {user_id}: {str(e)}')
             raise Exception(f'خطأ في حذف المستخدم: {str(e)}')
-            
-        finally:
-            cursor.close()
     
     def add_teacher(self, name, experience='متوسط'):
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('INSERT INTO teachers (name, experience) VALUES (?, ?)', 
-                         (name, experience))
-            self.conn.commit()
+            with self._write('teachers') as conn:
+                conn.execute('INSERT INTO teachers (name, experience) VALUES (?, ?)', 
+                             (name, experience))
             return True
         except sqlite3.IntegrityError:
             return False
     
     def add_room(self, name, capacity=0):
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('INSERT INTO rooms (name, capacity) VALUES (?, ?)',
-                          (name, capacity))
-            self.conn.commit()
+            with self._write('rooms') as conn:
+                conn.execute('INSERT INTO rooms (name, capacity) VALUES (?, ?)',
+                             (name, capacity))
             return True
         except sqlite3.IntegrityError:
             return False
     
     def add_exam_date(self, date):
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('INSERT INTO exam_dates (date) VALUES (?)', (date,))
-            self.conn.commit()
+            with self._write('exam_dates') as conn:
+                conn.execute('INSERT INTO exam_dates (date) VALUES (?)', (date,))
             return True
         except sqlite3.IntegrityError:
             return False
     
     def add_distribution(self, date_id, room_id, teacher1_id, teacher2_id):
-        cursor = self.conn.cursor()
         try:
-            with self.conn:
-                # التحقق من عدم وجود تعارض في التوزيع
-                cursor.execute('''
-                    SELECT 1 FROM distributions 
-                    WHERE date_id = ? AND (room_id = ? OR teacher1_id IN (?, ?) OR teacher2_id IN (?, ?))
-                ''', (date_id, room_id, teacher1_id, teacher2_id, teacher1_id, teacher2_id))
-                
-                if cursor.fetchone():
-                    return False
-                
+            with self._write('distributions') as conn:
+                cursor = conn.cursor()
+                # القاعة المكررة أو المراقب المسند في اليوم نفسه يرفضهما الفهرسان الفريدان
+                # (distributions(date_id, room_id) و assignments(date_id, teacher_id))
                 cursor.execute('''
                     INSERT INTO distributions (date_id, room_id, teacher1_id, teacher2_id)
                     VALUES (?, ?, ?, ?)
@@ -683,81 +629,175 @@ class Database:
         except sqlite3.IntegrityError:
             return False
     
+    def _ids_by(self, conn, table, column, keys):
+        """خريطة القيمة -> المعرف لقيم عمود فريد، على دفعات تحت حد متغيرات SQLite"""
+        keys = list(dict.fromkeys(keys))
+        ids = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ','.join('?' for _ in chunk)
+            ids.update((key, row_id) for row_id, key in
+                       conn.execute(f'SELECT id, {column} FROM {table} WHERE {column} IN ({marks})', chunk))
+        return ids
+    
+    def bulk_upsert_teachers(self, teachers):
+        """إضافة أو تحديث مراقبين في معاملة واحدة
+        
+        Args:
+            teachers: أسماء أو أزواج (الاسم، الخبرة)؛ الخبرة None تبقي القيمة الحالية
+            
+        Returns:
+            dict: اسم المراقب -> معرفه
+        """
+        rows = [(t, None) if isinstance(t, str) else (t[0], t[1] if len(t) > 1 else None) for t in teachers]
+        with self._write('teachers') as conn:
+            conn.executemany('''
+                INSERT INTO teachers (name, experience) VALUES (?1, COALESCE(?2, 'متوسط'))
+                ON CONFLICT(name) DO UPDATE SET experience = COALESCE(?2, experience)
+            ''', rows)
+            return self._ids_by(conn, 'teachers', 'name', [name for name, _ in rows])
+    
+    def bulk_upsert_rooms(self, rooms):
+        """إضافة أو تحديث قاعات في معاملة واحدة (أسماء أو أزواج (الاسم، السعة)) وإرجاع اسم -> معرف"""
+        rows = [(r, None) if isinstance(r, str) else (r[0], r[1] if len(r) > 1 else None) for r in rooms]
+        with self._write('rooms') as conn:
+            conn.executemany('''
+                INSERT INTO rooms (name, capacity) VALUES (?1, COALESCE(?2, 0))
+                ON CONFLICT(name) DO UPDATE SET capacity = COALESCE(?2, capacity)
+            ''', rows)
+            return self._ids_by(conn, 'rooms', 'name', [name for name, _ in rows])
+    
+    def bulk_upsert_exam_dates(self, dates):
+        """إضافة تواريخ الامتحانات غير الموجودة في معاملة واحدة وإرجاع تاريخ -> معرف"""
+        dates = list(dates)
+        with self._write('exam_dates') as conn:
+            conn.executemany('INSERT INTO exam_dates (date) VALUES (?) ON CONFLICT(date) DO NOTHING',
+                             [(d,) for d in dates])
+            return self._ids_by(conn, 'exam_dates', 'date', dates)
+    
+    def bulk_upsert_distributions(self, distributions):
+        """إضافة توزيعات أو استبدال مراقبيها لكل (تاريخ، قاعة) في معاملة واحدة
+        
+        Args:
+            distributions: صفوف (date_id, room_id, teacher1_id, teacher2_id)
+            
+        Returns:
+            dict: (date_id, room_id) -> معرف التوزيع
+        """
+        rows = [tuple(d) for d in distributions]
+        with self._write('distributions') as conn:
+            conn.executemany('''
+                INSERT INTO distributions (date_id, room_id, teacher1_id, teacher2_id) VALUES (?, ?, ?, ?)
+                ON CONFLICT(date_id, room_id) DO UPDATE SET
+                    teacher1_id = excluded.teacher1_id, teacher2_id = excluded.teacher2_id
+            ''', rows)
+            wanted = {(row[0], row[1]) for row in rows}
+            ids = {}
+            for date_id in {key[0] for key in wanted}:
+                for row_id, room_id in conn.execute('SELECT id, room_id FROM distributions WHERE date_id = ?',
+                                                    (date_id,)):
+                    if (date_id, room_id) in wanted:
+                        ids[(date_id, room_id)] = row_id
+            return ids
+    
     def log_action(self, user_id, action, details=None):
-        cursor = self.conn.cursor()
         try:
-            # التحقق من وجود المستخدم قبل تسجيل الإجراء
-            cursor.execute('SELECT id FROM users WHERE id = ?', (user_id,))
-            if not cursor.fetchone():
-                self.logger.warning(f'محاولة تسجيل إجراء لمستخدم غير موجود: {user_id}')
-                return
-                
-            cursor.execute('INSERT INTO logs (user_id, action, details) VALUES (?, ?, ?)',
-                          (user_id, action, details))
-            self.conn.commit()
+            # يُضاف إلى طابور سجل العمليات ويُكتب مع الدفعة التالية (انظر audit_log.py)
+            self.audit.log(user_id, action, details)
         except Exception as e:
             self.logger.error(f'خطأ في تسجيل الإجراء: {e}')
             raise
     
     def get_all_teachers(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, name FROM teachers')
-        return cursor.fetchall()
+        return self._cached_query('SELECT id, name FROM teachers', tables=('teachers',))
     
     def get_all_rooms(self):
-        cursor = self.conn.cursor()
-        # إضافة عمود required_supervisors إذا لم يكن موجوداً
-        # التحقق من وجود العمود قبل إضافته
-        cursor.execute('PRAGMA table_info(rooms)')
-        columns = [column[1] for column in cursor.fetchall()]
-        if 'required_supervisors' not in columns:
-            cursor.execute('ALTER TABLE rooms ADD COLUMN required_supervisors INTEGER DEFAULT 2')
-        self.conn.commit()
-        cursor.execute('SELECT id, name, capacity, required_supervisors FROM rooms')
-        return cursor.fetchall()
+        # عمود required_supervisors يضيفه الترحيل 2
+        return self._cached_query('SELECT id, name, capacity, required_supervisors FROM rooms', tables=('rooms',))
     
     def get_all_exam_dates(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, date FROM exam_dates')
-        return cursor.fetchall()
+        return self._cached_query('SELECT id, date FROM exam_dates', tables=('exam_dates',))
     
-    def get_distributions(self, date_id=None, page=1, per_page=50):
-        cursor = self.conn.cursor()
-        offset = (page - 1) * per_page
+    def snapshot(self):
+        """اتصال قراءة فقط بلقطة ثابتة للتقارير والتصدير، لا ينافس الكاتب"""
+        return self.pool.snapshot()
+    
+    def get_distributions(self, date_id=None, page=1, per_page=50, after=None, conn=None):
+        """صفحة من التوزيعات مرتبة حسب (التاريخ، اسم القاعة، الرقم)
+
+        after هو آخر صف من الصفحة السابقة، ويُستأنف البحث بعده مباشرة عبر فهرس
+        exam_dates(date) فتكلف أي صفحة ما تكلفه الأولى. page يبقى للتوافق مع الاستدعاءات
+        القديمة ويستخدم OFFSET. المراقب الفارغ يظهر None بدلاً من إخفاء الصف.
+        conn اتصال لقطة مفتوح تُقرأ منه الصفحة بدلاً من قارئ الخيط.
+        """
+        conditions, params = [], []
+        if date_id:
+            conditions.append('d.date_id = ?')
+            params.append(date_id)
+        if after is not None:
+            last_id, last_date, last_room = after[0], after[1], after[2]
+            # الشرط الأول مكرر عمداً ليستخدم المخطط نطاق الفهرس على التاريخ
+            conditions.append('ed.date >= ? AND (ed.date, r.name, d.id) > (?, ?, ?)')
+            params.extend((last_date, last_date, last_room, last_id))
+        where_clause = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
         
-        # استخدام Common Table Expression لتحسين الأداء
-        base_query = '''
-            WITH distribution_details AS (
-                SELECT 
-                    d.id,
-                    ed.date,
-                    r.name as room,
-                    t1.name as teacher1,
-                    t2.name as teacher2,
-                    ROW_NUMBER() OVER (ORDER BY ed.date, r.name) as row_num
-                FROM distributions d
-                JOIN exam_dates ed ON d.date_id = ed.id
-                JOIN rooms r ON d.room_id = r.id
-                JOIN teachers t1 ON d.teacher1_id = t1.id
-                JOIN teachers t2 ON d.teacher2_id = t2.id
-                {where_clause}
-            )
-            SELECT id, date, room, teacher1, teacher2
-            FROM distribution_details
-            WHERE row_num > ? AND row_num <= ?
+        query = f'''
+            SELECT d.id, ed.date, r.name, t1.name, t2.name
+            FROM exam_dates ed
+            JOIN distributions d ON d.date_id = ed.id
+            JOIN rooms r ON d.room_id = r.id
+            LEFT JOIN teachers t1 ON d.teacher1_id = t1.id
+            LEFT JOIN teachers t2 ON d.teacher2_id = t2.id
+            {where_clause}
+            ORDER BY ed.date, r.name, d.id
+            LIMIT ? OFFSET ?
         '''
+        offset = 0 if after is not None else (page - 1) * per_page
+        params.extend((per_page, offset))
+        if conn is not None:
+            return conn.execute(query, params).fetchall()
+        with self.pool.read() as conn:
+            return conn.execute(query, params).fetchall()
+    
+    def iter_distributions(self, date_id=None, batch_size=500, conn=None):
+        """كل التوزيعات على دفعات ثابتة الحجم بذاكرة ثابتة (للتصدير والعرض الكامل)
+
+        كل الدفعات تُقرأ من لقطة واحدة (conn أو لقطة جديدة) فلا تختلط نسختان من الجدول.
+        """
+        if conn is None:
+            with self.snapshot() as conn:
+                yield from self.iter_distributions(date_id, batch_size, conn)
+            return
+        after = None
+        while True:
+            rows = self.get_distributions(date_id, per_page=batch_size, after=after, conn=conn)
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1]
+    
+    def get_teacher_workload(self):
+        """عبء كل مراقب من جدول teacher_workload مرتباً تنازلياً
         
-        where_clause = 'WHERE d.date_id = ?' if date_id else ''
-        query = base_query.format(where_clause=where_clause)
-        
-        if date_id:
-            cursor.execute(query, (date_id, offset, offset + per_page))
-        else:
-            cursor.execute(query, (offset, offset + per_page))
-        return cursor.fetchall()
+        Returns:
+            list: (الاسم، عدد المراقبات، آخر مراقبة، {عمود اليوم: العدد})
+        """
+        with self.pool.read() as conn:
+            rows = conn.execute(f'''
+                SELECT t.name, COALESCE(w.total_duties, 0), w.last_duty_date,
+                       {', '.join(f'COALESCE(w.{column}, 0)' for column in WEEKDAY_COLUMNS)}
+                FROM teachers t
+                LEFT JOIN teacher_workload w ON w.teacher_id = t.id
+                ORDER BY 2 DESC, t.name
+            ''').fetchall()
+        return [(row[0], row[1], row[2], dict(zip(WEEKDAY_COLUMNS, row[3:]))) for row in rows]
     
-    def update_teacher(self, teacher_id, name=None, experience=None, specialization=None):
-        cursor = self.conn.cursor()
+    def rebuild_teacher_workload(self):
+        """إعادة بناء جدول العبء من assignments بعد استعادة أو خلل"""
+        with self._write('teacher_workload') as conn:
+            return rebuild_teacher_workload(conn)
+    
+    def update_teacher(self, teacher_id, name=None, experience=None, specialization=None, expected_version=None):
         update_fields = []
         params = []
         
@@ -776,18 +816,13 @@ class Database:
         if not update_fields:
             return False
         
-        query = f"UPDATE teachers SET {', '.join(update_fields)} WHERE id = ?"
-        params.append(teacher_id)
-        
         try:
-            cursor.execute(query, params)
-            self.conn.commit()
+            self._versioned_update('teachers', teacher_id, update_fields, params, expected_version)
             return True
         except sqlite3.IntegrityError:
             return False
     
-    def update_room(self, room_id, name=None, capacity=None):
-        cursor = self.conn.cursor()
+    def update_room(self, room_id, name=None, capacity=None, expected_version=None):
         update_fields = []
         params = []
         
@@ -802,27 +837,22 @@ class Database:
         if not update_fields:
             return False
         
-        query = f"UPDATE rooms SET {', '.join(update_fields)} WHERE id = ?"
-        params.append(room_id)
-        
         try:
-            cursor.execute(query, params)
-            self.conn.commit()
+            self._versioned_update('rooms', room_id, update_fields, params, expected_version)
             return True
         except sqlite3.IntegrityError:
             return False
     
     def update_exam_date(self, date_id, new_date):
-        cursor = self.conn.cursor()
         try:
-            cursor.execute('UPDATE exam_dates SET date = ? WHERE id = ?', (new_date, date_id))
-            self.conn.commit()
+            with self._write('exam_dates') as conn:
+                conn.execute('UPDATE exam_dates SET date = ? WHERE id = ?', (new_date, date_id))
             return True
         except sqlite3.IntegrityError:
             return False
     
-    def update_distribution(self, distribution_id, date_id=None, room_id=None, teacher1_id=None, teacher2_id=None):
-        cursor = self.conn.cursor()
+    def update_distribution(self, distribution_id, date_id=None, room_id=None, teacher1_id=None, teacher2_id=None,
+                            expected_version=None):
         update_fields = []
         params = []
         
@@ -845,50 +875,44 @@ class Database:
         if not update_fields:
             return False
         
-        query = f"UPDATE distributions SET {', '.join(update_fields)} WHERE id = ?"
-        params.append(distribution_id)
-        
         try:
-            cursor.execute(query, params)
-            self.conn.commit()
+            self._versioned_update('distributions', distribution_id, update_fields, params, expected_version)
             return True
         except sqlite3.IntegrityError:
             return False
     
     def get_teacher_by_id(self, teacher_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, name, experience, specialization FROM teachers WHERE id = ?', (teacher_id,))
-        return cursor.fetchone()
+        return self._cached_query('SELECT id, name, experience, specialization, version FROM teachers WHERE id = ?',
+                                  (teacher_id,), ('teachers',), one=True)
     
     def get_room_by_id(self, room_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, name, capacity FROM rooms WHERE id = ?', (room_id,))
-        return cursor.fetchone()
+        return self._cached_query('SELECT id, name, capacity, version FROM rooms WHERE id = ?',
+                                  (room_id,), ('rooms',), one=True)
     
     def get_exam_date_by_id(self, date_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, date FROM exam_dates WHERE id = ?', (date_id,))
-        return cursor.fetchone()
+        return self._cached_query('SELECT id, date FROM exam_dates WHERE id = ?',
+                                  (date_id,), ('exam_dates',), one=True)
     
     def get_distribution_by_id(self, distribution_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT d.id, d.date_id, d.room_id, d.teacher1_id, d.teacher2_id,
-                   ed.date, r.name as room_name, 
-                   t1.name as teacher1_name, t2.name as teacher2_name
-            FROM distributions d
-            JOIN exam_dates ed ON d.date_id = ed.id
-            JOIN rooms r ON d.room_id = r.id
-            JOIN teachers t1 ON d.teacher1_id = t1.id
-            JOIN teachers t2 ON d.teacher2_id = t2.id
-            WHERE d.id = ?
-        ''', (distribution_id,))
-        return cursor.fetchone()
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT d.id, d.date_id, d.room_id, d.teacher1_id, d.teacher2_id,
+                       ed.date, r.name as room_name, 
+                       t1.name as teacher1_name, t2.name as teacher2_name, d.version
+                FROM distributions d
+                JOIN exam_dates ed ON d.date_id = ed.id
+                JOIN rooms r ON d.room_id = r.id
+                LEFT JOIN teachers t1 ON d.teacher1_id = t1.id
+                LEFT JOIN teachers t2 ON d.teacher2_id = t2.id
+                WHERE d.id = ?
+            ''', (distribution_id,))
+            return cursor.fetchone()
     
     def add_leave(self, teacher_id, start_date, end_date, reason=None):
-        cursor = self.conn.cursor()
         try:
-            with self.conn:
+            with self._write('leaves') as conn:
+                cursor = conn.cursor()
                 # التحقق من عدم وجود إجازات متداخلة
                 cursor.execute('''
                     SELECT 1 FROM leaves 
@@ -912,36 +936,129 @@ class Database:
             return False
     
     def get_teacher_leaves(self, teacher_id):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT id, start_date, end_date, reason, status
-            FROM leaves
-            WHERE teacher_id = ?
-            ORDER BY start_date DESC
-        ''', (teacher_id,))
-        return cursor.fetchall()
-    
-    def update_leave_status(self, leave_id, status):
-        cursor = self.conn.cursor()
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, start_date, end_date, reason, status, version
+                FROM leaves
+                WHERE teacher_id = ?
+                ORDER BY start_date DESC
+            ''', (teacher_id,))
+            return cursor.fetchall()
+    
+    def update_leave_status(self, leave_id, status, expected_version=None):
         try:
-            cursor.execute('UPDATE leaves SET status = ? WHERE id = ?', (status, leave_id))
-            self.conn.commit()
+            with self._write('leaves') as conn:
+                leave = conn.execute('SELECT teacher_id, start_date, end_date, status FROM leaves WHERE id = ?',
+                                     (leave_id,)).fetchone()
+                self._versioned_update('leaves', leave_id, ['status = ?'], [status], expected_version)
+            if leave:
+                self.apply_leave_status(*leave, status)
             return True
         except sqlite3.IntegrityError:
             return False
     
     def get_teachers_on_leave(self, date):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT DISTINCT t.id, t.name
-            FROM teachers t
-            JOIN leaves l ON t.id = l.teacher_id
-            WHERE l.status = 'approved'
-            AND ? BETWEEN l.start_date AND l.end_date
-        ''', (date,))
-        return cursor.fetchall()
+        matrix = self.get_availability()
+        if matrix.column(date) is not None:
+            names = dict(self.get_all_teachers())
+            return [(teacher_id, names[teacher_id]) for teacher_id in matrix.teachers_on_leave(date)
+                    if teacher_id in names]
+        # يوم ليس تاريخ امتحان فليس له عمود في المصفوفة
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT DISTINCT t.id, t.name
+                FROM teachers t
+                JOIN leaves l ON t.id = l.teacher_id
+                WHERE l.status IN (?, ?)
+                AND ? BETWEEN l.start_date AND l.end_date
+            ''', APPROVED_LEAVE_STATUSES + (date,))
+            return cursor.fetchall()
     
 
     
+    def archive_year(self, year):
+        """نقل عام دراسي منتهٍ إلى archive_<year>.db بجانب قاعدة البيانات (انظر archive.py)
+        
+        Returns:
+            dict: عدد الصفوف المنقولة من كل جدول
+        """
+        counts = archive_academic_year(self.pool, year)
+        self.invalidate('exam_dates', 'distributions', 'assignments', 'teacher_workload', 'leaves', 'logs')
+        self.logger.info(f'تمت أرشفة العام الدراسي {year}: {counts}')
+        return counts
+    
+    def get_maintenance_runs(self, limit=20):
+        """آخر تشغيلات الصيانة مع الأحجام قبلها وبعدها"""
+        with self.pool.read() as conn:
+            return conn.execute('''
+                SELECT started_at, duration, tasks, db_size_before, db_size_after,
+                       wal_size_before, wal_size_after, freelist_before, freelist_after, error
+                FROM maintenance_runs
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (limit,)).fetchall()
+    
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        # كتابة ما تبقى من سجل العمليات قبل إغلاق الاتصالات
+        self.maintenance.stop()
+        self.audit.stop()
+        self.conn.close()
+        self.pool.close()
+
+
+class DatabaseService:
+    """خدمة قاعدة البيانات المشتركة على مستوى العملية
+
+    تُنشأ قاعدة البيانات عند أول start() وتُغلق عند آخر stop() (عدّ مراجع)، مع خيط
+    نسخ احتياطي واحد وخيط صيانة واحد مهما كان عدد المكونات التي تستخدمها.
+    """
+
+    def __init__(self, path='exam_system.db'):
+        self.path = path
+        self.db = None
+        self.backup_manager = None
+        self._refs = 0
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.db is not None
+
+    def start(self):
+        """الحصول على قاعدة البيانات المشتركة وزيادة عدد المستخدمين"""
+        with self._lock:
+            if self.db is None:
+                self.db = Database(self.path, start_backups=False)
+                self.backup_manager = self.db.backup_manager
+                self.backup_manager.start_backup_thread()
+                self.db.maintenance.start()
+            self._refs += 1
+            return self.db
+
+    def stop(self):
+        """تحرير مرجع واحد؛ عند آخر مرجع يُوقف النسخ الاحتياطي وتُغلق الاتصالات"""
+        with self._lock:
+            if not self._refs:
+                return
+            self._refs -= 1
+            if self._refs:
+                return
+            self.backup_manager.stop_backup_thread()
+            self.db.close()
+            self.db = None
+            self.backup_manager = None
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_database_service(path='exam_system.db'):
+    """الخدمة المشتركة الوحيدة في العملية (تُنشأ عند أول طلب)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = DatabaseService(path)
+        return _service
\ No newline at end of file
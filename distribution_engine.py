@@ -0,0 +1,642 @@
+import multiprocessing
+import queue
+import random
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from availability import APPROVED_LEAVE_STATUSES, AvailabilityMatrix
+from connection_pool import BUSY_TIMEOUT, retry_on_busy
+
+# عدد المراقبين الافتراضي لكل قاعة (عمودا teacher1_id و teacher2_id، والزائد في assignments)
+SEATS_PER_ROOM = 2
+
+# الفاصل بالثواني لفحص طلب الإلغاء أثناء انتظار عمليات المحافظة
+CANCEL_POLL_SECONDS = 0.2
+
+
+class DistributionCancelled(Exception):
+    """أُلغي التوزيع قبل حفظه"""
+
+
+# تعبير SQL لعدد مقاعد القاعة r (مراقب واحد على الأقل)؛ العمود تنشئه الترحيلة 2
+ROOM_SEATS_SQL = f'MAX(COALESCE(r.required_supervisors, {SEATS_PER_ROOM}), 1)'
+
+
+def _trim(seats) -> Tuple[Optional[int], ...]:
+    """المقاعد دون الفارغة في آخرها (للمقارنة بين الخطة والجدول)"""
+    seats = list(seats)
+    while seats and seats[-1] is None:
+        seats.pop()
+    return tuple(seats)
+
+
+def _current_seats(cursor, date_ids=None) -> Dict[int, List[Optional[int]]]:
+    """المقاعد الحالية لكل صف توزيع من جدول assignments (المقعد i في الموضع i-1)"""
+    current: Dict[int, List[Optional[int]]] = {}
+    if date_ids is None:
+        cursor.execute('SELECT id FROM distributions')
+        current = {row[0]: [] for row in cursor.fetchall()}
+        cursor.execute('SELECT distribution_id, seat, teacher_id FROM assignments')
+    else:
+        date_ids = tuple(date_ids)
+        marks = ','.join('?' for _ in date_ids)
+        cursor.execute(f'SELECT id FROM distributions WHERE date_id IN ({marks})', date_ids)
+        current = {row[0]: [] for row in cursor.fetchall()}
+        cursor.execute(f'SELECT distribution_id, seat, teacher_id FROM assignments WHERE date_id IN ({marks})',
+                       date_ids)
+    for distribution_id, seat, teacher_id in cursor.fetchall():
+        seats = current.setdefault(distribution_id, [])
+        seats.extend([None] * (seat - len(seats)))
+        seats[seat - 1] = teacher_id
+    return current
+
+
+def write_seats(cursor, rows: Dict[int, List[Optional[int]]]) -> None:
+    """كتابة مقاعد صفوف التوزيع المعطاة على مرحلتين داخل المعاملة الحالية
+
+    تُفرغ الصفوف أولاً ثم تُملأ، لأن UNIQUE(date_id, teacher_id) يُفحص مع كل صف ولا
+    يمكن تأجيله، فتبديل مراقبين بين قاعتين في اليوم نفسه يفشل لو كُتب صفاً صفاً.
+    المقعدان الأولان في أعمدة distributions (تنسخهما المشغلات) والباقي في assignments.
+    """
+    ids = [(distribution_id,) for distribution_id in rows]
+    cursor.executemany('UPDATE distributions SET teacher1_id = NULL, teacher2_id = NULL WHERE id = ?', ids)
+    cursor.executemany('DELETE FROM assignments WHERE distribution_id = ?', ids)
+    updates, extra = [], []
+    for distribution_id, seats in rows.items():
+        seats = list(seats) + [None] * (SEATS_PER_ROOM - len(seats))
+        updates.append((seats[0], seats[1], distribution_id))
+        extra.extend((teacher_id, seat, distribution_id)
+                     for seat, teacher_id in enumerate(seats[SEATS_PER_ROOM:], SEATS_PER_ROOM + 1)
+                     if teacher_id is not None)
+    cursor.executemany('UPDATE distributions SET teacher1_id = ?, teacher2_id = ? WHERE id = ?', updates)
+    cursor.executemany('''
+        INSERT INTO assignments (distribution_id, date_id, teacher_id, seat)
+        SELECT id, date_id, ?, ? FROM distributions WHERE id = ?
+    ''', extra)
+
+
+class _RankTree:
+    """شجرة فينويك لاختيار العنصر رقم k من المراقبين المتبقين بزمن لوغاريتمي"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = array('l', [0]) * (size + 1)
+        for i in range(1, size + 1):
+            self.tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+        self.top_bit = 1 << (size.bit_length() - 1) if size else 0
+
+    def remove(self, position: int) -> None:
+        i = position + 1
+        while i <= self.size:
+            self.tree[i] -= 1
+            i += i & -i
+
+    def find(self, rank: int) -> int:
+        """إرجاع موضع العنصر المتبقي رقم rank (يبدأ من الصفر)"""
+        position = 0
+        remaining = rank + 1
+        step = self.top_bit
+        while step:
+            nxt = position + step
+            if nxt <= self.size and self.tree[nxt] < remaining:
+                position = nxt
+                remaining -= self.tree[nxt]
+            step >>= 1
+        return position
+
+
+class _DatePicker:
+    """اختيار مراقبي يوم واحد وفق قواعد العدالة الحالية
+
+    ترتيب المتاحين لا يتغير داخل اليوم الواحد لأن من يُختار يُحذف من المجموعة،
+    لذا يُرتب مرة واحدة ثم يُختار عشوائياً من مقدمة المؤهلين عبر شجرة الرتب.
+    """
+
+    def __init__(self, available: List[int], supervision_count: array, last_ordinal: array,
+                 rng: random.Random):
+        available.sort(key=lambda i: (supervision_count[i], last_ordinal[i]))
+        self.available = available
+        self.supervision_count = supervision_count
+        self.last_ordinal = last_ordinal
+        self.random = rng
+        self.ranks = _RankTree(len(available))
+        self.buckets = {}
+        for i in available:
+            self.buckets[supervision_count[i]] = self.buckets.get(supervision_count[i], 0) + 1
+
+    def pick(self, ordinal: int) -> int:
+        """اختيار مراقب وتحديث عدد مراقباته وتاريخ آخر مراقبة له"""
+        min_supervisions = min(self.buckets)
+        eligible = self.buckets[min_supervisions] + self.buckets.get(min_supervisions + 1, 0)
+        window = min(max(3, eligible // 3), eligible)
+
+        slot = self.ranks.find(self.random.randrange(window))
+        self.ranks.remove(slot)
+        chosen = self.available[slot]
+
+        count = self.supervision_count[chosen]
+        self.buckets[count] -= 1
+        if not self.buckets[count]:
+            del self.buckets[count]
+        self.supervision_count[chosen] = count + 1
+        self.last_ordinal[chosen] = ordinal
+        return chosen
+
+
+class ChangeSet:
+    """وصف التغييرات التي تتطلب إعادة توزيع جزئية"""
+
+    def __init__(self):
+        self.leaves = []
+        self.added_rooms = []
+        self.removed_rooms = []
+        self.deleted_teachers = set()
+
+    def add_leave(self, teacher_id: int, start_date, end_date) -> 'ChangeSet':
+        """إجازة معتمدة جديدة"""
+        self.leaves.append((teacher_id, str(start_date), str(end_date)))
+        return self
+
+    def add_room(self, date_id: int, room_id: int) -> 'ChangeSet':
+        """إضافة قاعة في تاريخ محدد"""
+        self.added_rooms.append((date_id, room_id))
+        return self
+
+    def remove_room(self, date_id: int, room_id: int) -> 'ChangeSet':
+        """إزالة قاعة من تاريخ محدد"""
+        self.removed_rooms.append((date_id, room_id))
+        return self
+
+    def delete_teacher(self, teacher_id: int) -> 'ChangeSet':
+        """مراقب سيُحذف ويجب استبداله في كل مقاعده"""
+        self.deleted_teachers.add(teacher_id)
+        return self
+
+
+class DistributionPlan:
+    """خطة توزيع كاملة مجهزة في الذاكرة قبل كتابتها
+
+    المقاعد مفهرسة بمعرف صف distributions (المفتاح الأساسي) حتى يُحسب الفرق مع الجدول
+    الحالي ويُكتب بتحديث مجمع واحد داخل معاملة قصيرة بعد انتهاء الحساب.
+    """
+
+    def __init__(self):
+        self.seats: Dict[int, List[int]] = {}
+        self.date_of: Dict[int, int] = {}
+
+    def assign(self, distribution_id: int, date_id: int, teachers: List[int]) -> None:
+        self.seats[distribution_id] = teachers
+        self.date_of[distribution_id] = date_id
+
+    def __len__(self) -> int:
+        return len(self.seats)
+
+    def diff(self, current: Dict[int, List[Optional[int]]]) -> Dict[int, List[int]]:
+        """الصفوف التي تختلف مقاعدها عن الجدول الحالي {distribution_id: المقاعد}"""
+        updates = {}
+        for distribution_id, seats in self.seats.items():
+            existing = current.get(distribution_id)
+            # الصف حُذف بعد التحميل فلا يوجد ما يُحدث
+            if existing is None or _trim(existing) == _trim(seats):
+                continue
+            updates[distribution_id] = seats
+        return updates
+
+    def commit(self, conn) -> int:
+        """كتابة الصفوف المتغيرة فقط في معاملة واحدة وإرجاع عددها
+
+        يُحجز قفل الكتابة (BEGIN IMMEDIATE) قبل قراءة الحالة الحالية مباشرة،
+        فلا يُحتجز إلا أثناء المقارنة والتحديث المجمع.
+        """
+        cursor = conn.cursor()
+        try:
+            if not conn.in_transaction:
+                cursor.execute('BEGIN IMMEDIATE')
+            updates = self.diff(_current_seats(cursor))
+            write_seats(cursor, updates)
+            conn.commit()
+            return len(updates)
+        except Exception:
+            conn.rollback()
+            raise
+
+
+class DistributionProblem:
+    """بيانات التوزيع المحملة من قاعدة البيانات بصيغة مصفوفات صحيحة"""
+
+    def __init__(self, teacher_ids: List[int], dates: List[Tuple[int, str]],
+                 rooms_by_date: Dict[int, List[Tuple[int, int, int]]], availability: AvailabilityMatrix):
+        self.teacher_ids = teacher_ids
+        self.dates = dates
+        # rooms_by_date: date_id -> [(distribution_id, room_id, seats)] بترتيب الصفوف
+        self.rooms_by_date = rooms_by_date
+        # صفوف المصفوفة بنفس ترتيب teacher_ids
+        self.availability = availability
+        self.ordinals = array('l', [datetime.strptime(d, '%Y-%m-%d').toordinal() for _, d in dates])
+
+
+def score_plan(problem: DistributionProblem, plan: DistributionPlan) -> Dict[str, float]:
+    """مقاييس عدالة الخطة: الفارق بين الأعلى والأدنى، المراقبات المتتالية، والتباين"""
+    counts = {teacher_id: 0 for teacher_id in problem.teacher_ids}
+    duty_dates = {}
+    date_index = {date_id: i for i, (date_id, _) in enumerate(problem.dates)}
+    for distribution_id, seats in plan.seats.items():
+        day = date_index[plan.date_of[distribution_id]]
+        for teacher_id in seats:
+            counts[teacher_id] = counts.get(teacher_id, 0) + 1
+            duty_dates.setdefault(teacher_id, set()).add(day)
+
+    # مراقبة في يومي امتحان متتاليين لنفس المراقب
+    back_to_back = sum(1 for days in duty_dates.values() for day in days if day + 1 in days)
+    values = list(counts.values()) or [0]
+    mean = sum(values) / len(values)
+    return {
+        'spread': max(values) - min(values),
+        'back_to_back': back_to_back,
+        'variance': sum((v - mean) ** 2 for v in values) / len(values)
+    }
+
+
+def _plan_key(metrics: Dict[str, float]) -> Tuple:
+    """ترتيب الخطط: الفارق أولاً ثم المراقبات المتتالية ثم التباين"""
+    return (metrics['spread'], metrics['back_to_back'], metrics['variance'])
+
+
+# حدث إيقاف عمليات المحافظة؛ يصل إلى كل عملية عند إنشائها (انظر _init_portfolio_worker)
+_portfolio_stop = None
+
+
+def _init_portfolio_worker(stop) -> None:
+    global _portfolio_stop
+    _portfolio_stop = stop
+
+
+def _solve_seeded(problem: DistributionProblem, seed: int):
+    """تشغيل توزيع واحد ببذرة محددة داخل عملية منفصلة؛ يتوقف عند ضبط حدث الإيقاف"""
+    plan = DistributionEngine(None, seed=seed).solve(problem, cancel=_portfolio_stop)
+    return seed, plan, score_plan(problem, plan)
+
+
+class DistributionEngine:
+    """محرك توزيع المراقبين المستقل عن الواجهة الرسومية
+
+    يحافظ على قواعد العدالة الحالية: الأولوية لأقل عدد مراقبات ثم لأبعد مراقبة سابقة،
+    مع نافذة سماح +1 عن الحد الأدنى واختيار عشوائي من مقدمة المؤهلين.
+    """
+
+    def __init__(self, conn, seed: Optional[int] = None):
+        self.conn = conn
+        self.random = random.Random(seed)
+
+    def preflight(self) -> List[Dict]:
+        """فحص إمكانية التوزيع لكل التواريخ باستعلام تجميعي واحد قبل تشغيل الخوارزمية
+
+        يقارن مجموع المقاعد المطلوبة (حسب required_supervisors لكل قاعة) بعدد المراقبين
+        غير المجازين في كل تاريخ، ويرجع كل التواريخ غير الممكنة مع مقدار النقص.
+        """
+        placeholders = ','.join('?' for _ in APPROVED_LEAVE_STATUSES)
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT ed.id, ed.date, COALESCE(s.rooms, 0), COALESCE(s.seats, 0),
+                   (SELECT COUNT(*) FROM teachers) - COALESCE(l.on_leave, 0)
+            FROM exam_dates ed
+            LEFT JOIN (
+                SELECT d.date_id, COUNT(*) AS rooms, SUM({ROOM_SEATS_SQL}) AS seats
+                FROM distributions d
+                LEFT JOIN rooms r ON r.id = d.room_id
+                GROUP BY d.date_id
+            ) s ON s.date_id = ed.id
+            LEFT JOIN (
+                SELECT e.id AS date_id, COUNT(DISTINCT lv.teacher_id) AS on_leave
+                FROM exam_dates e
+                JOIN leaves lv ON e.date BETWEEN lv.start_date AND lv.end_date
+                JOIN teachers t ON t.id = lv.teacher_id
+                WHERE lv.status IN ({placeholders})
+                GROUP BY e.id
+            ) l ON l.date_id = ed.id
+            ORDER BY ed.date
+        ''', APPROVED_LEAVE_STATUSES)
+
+        infeasible = []
+        for date_id, exam_date, rooms, seats, free in cursor.fetchall():
+            if rooms and free >= seats:
+                continue
+            infeasible.append({'date_id': date_id, 'date': exam_date, 'rooms': rooms, 'seats': seats,
+                               'free': free, 'shortfall': seats - free if rooms else 0})
+        return infeasible
+
+    def load(self) -> DistributionProblem:
+        """تحميل المراقبين والتواريخ والقاعات والإجازات المعتمدة دفعة واحدة"""
+        availability = AvailabilityMatrix.from_db(self.conn, include_assignments=False)
+        cursor = self.conn.cursor()
+
+        cursor.execute('SELECT id, date FROM exam_dates ORDER BY date')
+        dates = cursor.fetchall()
+
+        rooms_by_date = {date_id: [] for date_id, _ in dates}
+        cursor.execute(f'''
+            SELECT d.id, d.date_id, d.room_id, {ROOM_SEATS_SQL}
+            FROM distributions d
+            LEFT JOIN rooms r ON r.id = d.room_id
+            ORDER BY d.id
+        ''')
+        for distribution_id, date_id, room_id, seats in cursor.fetchall():
+            if date_id in rooms_by_date:
+                rooms_by_date[date_id].append((distribution_id, room_id, seats))
+
+        return DistributionProblem(availability.teacher_ids, dates, rooms_by_date, availability)
+
+    def solve(self, problem: DistributionProblem, progress=None,
+              cancel: Optional[threading.Event] = None) -> DistributionPlan:
+        """حساب التوزيع كاملاً في الذاكرة دون لمس قاعدة البيانات
+
+        يُستدعى progress(done, total, exam_date) بعد كل تاريخ، ويُفحص cancel قبل كل تاريخ.
+        """
+        if not problem.teacher_ids:
+            raise ValueError("يجب وجود مراقب واحد على الأقل لإتمام التوزيع")
+
+        teacher_count = len(problem.teacher_ids)
+        supervision_count = array('l', [0]) * teacher_count
+        # -1 يعني عدم وجود مراقبة سابقة فيأخذ الأولوية كما في الخوارزمية الأصلية
+        last_ordinal = array('l', [-1]) * teacher_count
+        plan = DistributionPlan()
+
+        for index, ((date_id, exam_date), ordinal) in enumerate(zip(problem.dates, problem.ordinals)):
+            if cancel is not None and cancel.is_set():
+                raise DistributionCancelled()
+            column = problem.availability.column(exam_date)
+            available = [i for i in range(teacher_count) if not problem.availability.on_leave_at(i, column)]
+
+            rooms = problem.rooms_by_date.get(date_id, [])
+            if not rooms:
+                raise ValueError(f"لا توجد قاعات محددة في تاريخ {exam_date}")
+
+            if len(available) < sum(seats for _, _, seats in rooms):
+                raise ValueError(f"عدد المراقبين المتاحين ({len(available)}) غير كافٍ للقاعات ({len(rooms)}) في {exam_date}. يجب توفر مراقبين لكل قاعة.")
+
+            picker = _DatePicker(available, supervision_count, last_ordinal, self.random)
+            for distribution_id, _, seats in rooms:
+                plan.assign(distribution_id, date_id, [
+                    problem.teacher_ids[picker.pick(ordinal)] for _ in range(seats)
+                ])
+            if progress:
+                progress(index + 1, len(problem.dates), exam_date)
+
+        return plan
+
+    def apply(self, plan: DistributionPlan) -> int:
+        """كتابة الصفوف التي تغيرت فقط في جدول distributions وإرجاع عددها
+
+        خارج معاملة مفتوحة يُعاد الحفظ كاملاً عند قفل الملف (retry_on_busy)، فالمعاملة
+        الفاشلة أُلغيت بالفعل ولا تبدأ المحاولة التالية إلا بـ BEGIN IMMEDIATE جديد.
+        """
+        if self.conn.in_transaction:
+            return plan.commit(self.conn)
+        return retry_on_busy(lambda: plan.commit(self.conn))
+
+    def solve_portfolio(self, problem: DistributionProblem, runs: int = 8, workers: Optional[int] = None,
+                        deadline: Optional[float] = None, progress=None,
+                        cancel: Optional[threading.Event] = None) -> Tuple[DistributionPlan, Dict[str, float]]:
+        """تشغيل عدة توزيعات عشوائية ببذور مختلفة على التوازي واختيار أعدلها
+
+        deadline هو الحد الأقصى بالثواني؛ عند انتهائه تُقارن الخطط المكتملة فقط،
+        وإن لم تكتمل أي خطة يُنتظر أول خطة مكتملة. عند الخروج تُلغى التشغيلات التي
+        لم تبدأ وتتوقف الجارية، فلا تبقى أي عملية تعمل بعد الإرجاع.
+        يُستدعى progress(done, runs, None) بعد اكتمال كل تشغيل.
+        """
+        seeds = [self.random.randrange(2 ** 31) for _ in range(max(1, runs))]
+        started = time.monotonic()
+        best = None
+        completed = 0
+
+        stop = multiprocessing.Event()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_portfolio_worker,
+                                       initargs=(stop,))
+        try:
+            pending = {executor.submit(_solve_seeded, problem, seed) for seed in seeds}
+            while pending:
+                if cancel is not None and cancel.is_set():
+                    raise DistributionCancelled()
+                remaining = None if deadline is None else max(0.0, deadline - (time.monotonic() - started))
+                if remaining == 0.0 and best is not None:
+                    break
+                timeout = remaining or None
+                if cancel is not None:
+                    timeout = CANCEL_POLL_SECONDS if timeout is None else min(timeout, CANCEL_POLL_SECONDS)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    seed, plan, metrics = future.result()
+                    if best is None or _plan_key(metrics) < _plan_key(best[2]):
+                        best = (seed, plan, metrics)
+                    completed += 1
+                    if progress:
+                        progress(completed, len(seeds), None)
+        finally:
+            # التشغيلات الخاسرة تتوقف عند تاريخها التالي بدل إكمال ميزانيتها بعد المهلة،
+            # والانتظار هنا قصير ويضمن تحرير الأنوية قبل الحفظ
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        seed, plan, metrics = best
+        self.last_portfolio = {'seed': seed, 'runs': len(seeds), 'completed': completed,
+                               'metrics': metrics, 'elapsed': time.monotonic() - started}
+        return plan, metrics
+
+    def run(self, runs: int = 1, workers: Optional[int] = None, deadline: Optional[float] = None,
+            progress=None, cancel: Optional[threading.Event] = None) -> DistributionPlan:
+        """تحميل البيانات وحساب التوزيع وحفظه
+
+        الحساب يتم كاملاً قبل فتح معاملة الكتابة، فلا تُقفل قاعدة البيانات أثناءه.
+        عند runs > 1 يُستخدم وضع المحافظة (عدة توزيعات متوازية) ولا تُحفظ إلا أفضل خطة.
+        يُرفض الفصل قبل الحساب إن وُجد أي تاريخ غير ممكن التوزيع مع ذكر كل التواريخ.
+        عند ضبط cancel قبل الحفظ يُرفع DistributionCancelled دون أي تغيير في الجدول.
+        """
+        infeasible = self.preflight()
+        if infeasible:
+            details = []
+            for item in infeasible:
+                if not item['rooms']:
+                    details.append(f"{item['date']}: لا توجد قاعات محددة")
+                else:
+                    details.append(f"{item['date']}: المطلوب {item['seats']} والمتاح {item['free']} "
+                                   f"(نقص {item['shortfall']})")
+            raise ValueError("لا يمكن إتمام التوزيع في التواريخ التالية:\n" + "\n".join(details))
+
+        problem = self.load()
+        if runs > 1:
+            plan, _ = self.solve_portfolio(problem, runs, workers, deadline, progress, cancel)
+        else:
+            plan = self.solve(problem, progress, cancel)
+        if cancel is not None and cancel.is_set():
+            raise DistributionCancelled()
+        self.apply(plan)
+        return plan
+
+    def redistribute(self, changes: ChangeSet) -> Dict[int, Tuple[Optional[int], ...]]:
+        """إعادة توزيع جزئية تقتصر على المقاعد التي أبطلتها التغييرات
+
+        تُطبق تغييرات القاعات على جدول distributions ثم تُفحص أيام التغيير فقط، ويُستبدل
+        كل مقعد فارغ أو لمراقب محذوف أو في إجازة معتمدة مع إبقاء بقية التوزيع كما هو.
+        ترجع {distribution_id: (مقعد 1، مقعد 2، ...)} للصفوف التي تغيرت.
+        """
+        cursor = self.conn.cursor()
+        try:
+            for date_id, room_id in changes.removed_rooms:
+                cursor.execute('DELETE FROM distributions WHERE date_id = ? AND room_id = ?', (date_id, room_id))
+            for date_id, room_id in changes.added_rooms:
+                cursor.execute('SELECT 1 FROM distributions WHERE date_id = ? AND room_id = ?', (date_id, room_id))
+                if not cursor.fetchone():
+                    cursor.execute('INSERT INTO distributions (date_id, room_id) VALUES (?, ?)', (date_id, room_id))
+
+            changed = self._repair(cursor, changes)
+            write_seats(cursor, changed)
+            self.conn.commit()
+            return changed
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def _affected_dates(self, cursor, changes: ChangeSet) -> set:
+        """الأيام التي قد تحتوي على مقاعد أبطلتها التغييرات"""
+        affected = {date_id for date_id, _ in changes.added_rooms}
+        for _, start_date, end_date in changes.leaves:
+            cursor.execute('SELECT id FROM exam_dates WHERE date BETWEEN ? AND ?', (start_date, end_date))
+            affected.update(row[0] for row in cursor.fetchall())
+        for teacher_id in changes.deleted_teachers:
+            cursor.execute('SELECT date_id FROM assignments WHERE teacher_id = ?', (teacher_id,))
+            affected.update(row[0] for row in cursor.fetchall())
+        return affected
+
+    def _repair(self, cursor, changes: ChangeSet) -> Dict[int, Tuple[Optional[int], ...]]:
+        """حساب بدائل المقاعد غير الصالحة في الأيام المتأثرة فقط"""
+        affected = self._affected_dates(cursor, changes)
+        if not affected:
+            return {}
+
+        marks = ','.join('?' for _ in affected)
+        cursor.execute(f'''
+            SELECT d.id, d.date_id, ed.date, {ROOM_SEATS_SQL}
+            FROM distributions d
+            JOIN exam_dates ed ON d.date_id = ed.id
+            LEFT JOIN rooms r ON r.id = d.room_id
+            WHERE d.date_id IN ({marks})
+            ORDER BY ed.date, d.id
+        ''', tuple(affected))
+        rows = cursor.fetchall()
+        if not rows:
+            return {}
+        current = _current_seats(cursor, affected)
+
+        cursor.execute('SELECT id FROM teachers ORDER BY experience DESC')
+        teacher_ids = [row[0] for row in cursor.fetchall() if row[0] not in changes.deleted_teachers]
+        position = {teacher_id: i for i, teacher_id in enumerate(teacher_ids)}
+
+        # عدد المراقبات وآخر مراقبة لكل مراقب على مستوى الفصل كاملاً (من جدول العبء المجمع)
+        supervision_count = array('l', [0]) * len(teacher_ids)
+        last_ordinal = array('l', [-1]) * len(teacher_ids)
+        cursor.execute('SELECT teacher_id, total_duties, last_duty_date FROM teacher_workload')
+        for teacher_id, count, last_date in cursor.fetchall():
+            if teacher_id in position and last_date:
+                supervision_count[position[teacher_id]] = count
+                last_ordinal[position[teacher_id]] = datetime.strptime(last_date, '%Y-%m-%d').toordinal()
+
+        # الإجازات المعتمدة في الأيام المتأثرة فقط إضافة إلى الإجازات الجديدة
+        availability = AvailabilityMatrix.from_db(self.conn, date_ids=affected, include_assignments=False)
+        for teacher_id, start_date, end_date in changes.leaves:
+            availability.add_leave(teacher_id, start_date, end_date)
+
+        rows_by_date = {}
+        for row in rows:
+            rows_by_date.setdefault((row[2], row[1]), []).append(row)
+
+        changed = {}
+        for (exam_date, _), date_rows in sorted(rows_by_date.items()):
+            seated = set()
+            invalid = []
+            seats_by_row = {}
+            for distribution_id, _, _, seats in date_rows:
+                row_seats = list(current.get(distribution_id, []))
+                row_seats.extend([None] * (seats - len(row_seats)))
+                seats_by_row[distribution_id] = row_seats
+                for index, teacher_id in enumerate(list(row_seats)):
+                    if index >= seats:
+                        # مقعد زائد عن حاجة القاعة يُفرغ
+                        if teacher_id is not None:
+                            seats_by_row[distribution_id][index] = None
+                            changed[distribution_id] = tuple(seats_by_row[distribution_id])
+                            if teacher_id in position:
+                                supervision_count[position[teacher_id]] -= 1
+                        continue
+                    if (teacher_id in position and not availability.on_leave(teacher_id, exam_date)
+                            and teacher_id not in seated):
+                        seated.add(teacher_id)
+                        continue
+                    invalid.append((distribution_id, index))
+                    if teacher_id in position:
+                        # المقعد المحرر لم يعد يُحتسب في عبء المراقب
+                        supervision_count[position[teacher_id]] -= 1
+            if not invalid:
+                continue
+
+            available = [position[t] for t in teacher_ids
+                         if t not in seated and not availability.on_leave(t, exam_date)]
+            if len(available) < len(invalid):
+                raise ValueError(f"عدد المراقبين المتاحين ({len(available)}) غير كافٍ لاستبدال {len(invalid)} مقعد في {exam_date}")
+
+            ordinal = datetime.strptime(exam_date, '%Y-%m-%d').toordinal()
+            picker = _DatePicker(available, supervision_count, last_ordinal, self.random)
+            for distribution_id, index in invalid:
+                seats_by_row[distribution_id][index] = teacher_ids[picker.pick(ordinal)]
+                changed[distribution_id] = tuple(seats_by_row[distribution_id])
+
+        return changed
+
+
+class DistributionWorker(threading.Thread):
+    """تشغيل التوزيع في خيط منفصل باتصال مستقل بقاعدة البيانات
+
+    يضع الخيط الأحداث في events لتقرأها الواجهة عبر root.after دون أن تتجمد:
+    ('progress', (done, total, label)) ثم حدث نهائي واحد من 'done' أو 'cancelled'
+    أو 'error' (رسالة للمستخدم) أو 'failed' (خطأ غير متوقع).
+    """
+
+    def __init__(self, database_path: str, runs: int = 1, workers: Optional[int] = None,
+                 deadline: Optional[float] = None, seed: Optional[int] = None):
+        super().__init__(daemon=True)
+        self.database_path = database_path
+        self.runs = runs
+        self.workers = workers
+        self.deadline = deadline
+        self.seed = seed
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+
+    def cancel(self) -> None:
+        """طلب الإلغاء؛ يُحترم حتى لحظة بدء الحفظ"""
+        self.cancel_event.set()
+
+    def run(self) -> None:
+        # انتظار قصير لكل جملة؛ الحفظ يعيد المحاولة بتأخير عشوائي (انظر apply)
+        conn = sqlite3.connect(self.database_path, timeout=BUSY_TIMEOUT)
+        try:
+            DistributionEngine(conn, seed=self.seed).run(
+                self.runs, self.workers, self.deadline,
+                progress=lambda done, total, label: self.events.put(('progress', (done, total, label))),
+                cancel=self.cancel_event
+            )
+            self.events.put(('done', None))
+        except DistributionCancelled:
+            self.events.put(('cancelled', None))
+        except ValueError as e:
+            self.events.put(('error', str(e)))
+        except Exception as e:
+            self.events.put(('failed', str(e)))
+        finally:
+            conn.close()
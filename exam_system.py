@@ -1,11 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
 from tkcalendar import Calendar, DateEntry
-from database import Database
+from database import ConcurrentModificationError, get_database_service
 from reports import ReportGenerator
+from distribution_engine import DistributionEngine, DistributionWorker, ChangeSet
 from datetime import datetime
 import pandas as pd
-import random
 import json
 import os
 import hashlib
@@ -29,10 +29,13 @@ class ExamSupervisionSystem:
         """فرز العناصر العربية بشكل صحيح"""
         return sorted(items, key=lambda x: araby.strip_tashkeel(araby.strip_tatweel(x)))
 
-    def __init__(self, root, user_id, role):
+    def __init__(self, root, user_id, role, db=None):
         self.root = root
         self.user_id = user_id
         self.role = role
+        # قاعدة البيانات الممررة من نافذة الدخول أو مرجع خاص من الخدمة المشتركة
+        self._owns_db = db is None
+        self.db = db
         
         # تهيئة نظام تسجيل الأخطاء
         from logger import SystemLogger
@@ -55,8 +58,9 @@ class ExamSupervisionSystem:
         self.root.geometry("1200x800")
         
         try:
-            # إنشاء الاتصال بقاعدة البيانات
-            self.db = Database()
+            # الاتصال بقاعدة البيانات المشتركة
+            if self._owns_db:
+                self.db = get_database_service().start()
             self.logger.info("تم الاتصال بقاعدة البيانات بنجاح")
             
             # تهيئة الواجهة
@@ -66,7 +70,7 @@ class ExamSupervisionSystem:
             # تحديث القوائم
             self.update_lists()
             
-            self.report_generator = ReportGenerator()
+            self.report_generator = ReportGenerator(self.db)
             self.logger.info("تم تهيئة نظام التقارير بنجاح")
         except Exception as e:
             self.logger.error(f"خطأ في تهيئة النظام: {e}")
@@ -158,6 +162,9 @@ class ExamSupervisionSystem:
                 tools_menu.add_separator()
             tools_menu.add_command(label="إدارة المستخدمين", 
                                  command=lambda: self.safe_callback(self.show_user_management))
+            if self.role == 'admin':
+                tools_menu.add_command(label="أداء الاستعلامات", 
+                                     command=lambda: self.safe_callback(self.show_query_stats))
         
             # قائمة المساعدة
             help_menu = tk.Menu(self.menubar, tearoff=0)
@@ -218,6 +225,14 @@ class ExamSupervisionSystem:
                 return config.get("school_logo", "school_logo.ico")
         return "school_logo.ico"
         
+    def load_distribution_settings(self):
+        """قراءة إعدادات محرك التوزيع (عدد التشغيلات المتوازية والعمال والمهلة)"""
+        if os.path.exists(self.config_file):
+            with open(self.config_file, "r", encoding="utf-8") as f:
+                config = json.load(f)
+                return config.get("distribution", {})
+        return {}
+        
     def save_school_logo(self, logo_path):
         """حفظ مسار الشعار في ملف الإعدادات"""
         config = {}
@@ -268,9 +283,10 @@ class ExamSupervisionSystem:
                     else:
                         self.logger.warning(f"محاولة تسجيل خروج لمستخدم غير موجود (ID: {self.user_id})")
                     
-                    # إغلاق الاتصال بقاعدة البيانات
+                    # تحرير مرجع قاعدة البيانات المشتركة (تُغلق عند آخر مرجع فقط)
                     try:
-                        self.db.conn.close()
+                        if self._owns_db:
+                            get_database_service().stop()
                         self.logger.info("تم إغلاق الاتصال بقاعدة البيانات بنجاح")
                     except Exception as close_error:
                         self.logger.error(f"خطأ في إغلاق قاعدة البيانات: {close_error}")
@@ -650,6 +666,7 @@ class ExamSupervisionSystem:
                 cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
                 
                 self.db.conn.commit()
+                self.db.audit.forget_user(user_id)
                 self._refresh_users(tree)
                 messagebox.showinfo("نجاح", "تم حذف المستخدم بنجاح")
                 
@@ -772,7 +789,8 @@ class ExamSupervisionSystem:
         button_frame = ttk.Frame(control_frame)
         button_frame.grid(row=0, column=0)
         
-        ttk.Button(button_frame, text="توزيع المراقبين", command=self.distribute_supervisors).pack(side='left', padx=5)
+        self.distribute_button = ttk.Button(button_frame, text="توزيع المراقبين", command=self.distribute_supervisors)
+        self.distribute_button.pack(side='left', padx=5)
         ttk.Button(button_frame, text="تعديل التوزيع", command=self.edit_distribution).pack(side='left', padx=5)
         ttk.Button(button_frame, text="عرض الجدول", command=self.show_table).pack(side='left', padx=5)
         ttk.Button(button_frame, text="حفظ التوزيع", command=self.save_distribution).pack(side='left', padx=5)
@@ -885,14 +903,14 @@ class ExamSupervisionSystem:
         
         # الحصول على بيانات المراقب
         cursor = self.db.conn.cursor()
-        cursor.execute('SELECT id, name FROM teachers WHERE name = ?', (teacher_name,))
+        cursor.execute('SELECT id, name, version FROM teachers WHERE name = ?', (teacher_name,))
         teacher = cursor.fetchone()
         
         if not teacher:
             messagebox.showerror("خطأ", "لم يتم العثور على بيانات المراقب")
             return
         
-        teacher_id, name = teacher
+        teacher_id, name, version = teacher
         
         # طلب الاسم الجديد
         new_name = simpledialog.askstring("تعديل المراقب", "أدخل اسم المراقب الجديد:", initialvalue=name)
@@ -904,17 +922,21 @@ class ExamSupervisionSystem:
                 return
             
             try:
-                # تحديث بيانات المراقب
-                cursor.execute('UPDATE teachers SET name = ? WHERE id = ?', (new_name, teacher_id))
-                self.db.conn.commit()
+                # تحديث بيانات المراقب بشرط ألا يكون مستخدم آخر قد عدله منذ فتح النافذة
+                if not self.db.update_teacher(teacher_id, name=new_name, expected_version=version):
+                    messagebox.showerror("خطأ", "فشل تعديل المراقب. قد يكون الاسم مستخدماً بالفعل.")
+                    return
                 
                 self.update_lists()
                 self.db.log_action(self.user_id, "تعديل مراقب", 
                                   f"تم تعديل بيانات المراقب من: {name} إلى: {new_name}")
                 messagebox.showinfo("نجاح", f"تم تعديل بيانات المراقب بنجاح")
             
+            except ConcurrentModificationError:
+                self.update_lists()
+                messagebox.showwarning("تعارض", "عدّل مستخدم آخر هذا المراقب أثناء التحرير. "
+                                                "تم تحديث القائمة، يرجى إعادة المحاولة.")
             except Exception as e:
-                self.db.conn.rollback()
                 messagebox.showerror("خطأ", f"حدث خطأ أثناء تعديل بيانات المراقب: {str(e)}")
                 print(f"خطأ في تعديل المراقب: {e}")
     
@@ -932,9 +954,16 @@ class ExamSupervisionSystem:
                 cursor.execute('SELECT id FROM teachers WHERE name = ?', (name,))
                 teacher_id = cursor.fetchone()[0]
                 
-                # حذف السجلات المرتبطة في جدول التوزيعات
-                cursor.execute('DELETE FROM distributions WHERE teacher1_id = ? OR teacher2_id = ?', 
-                              (teacher_id, teacher_id))
+                # استبدال المراقب في مقاعده فقط مع إبقاء بقية التوزيع كما هو
+                try:
+                    DistributionEngine(self.db.conn).redistribute(ChangeSet().delete_teacher(teacher_id))
+                except ValueError as e:
+                    # لا يوجد بديل متاح: تفريغ مقاعد المراقب مع الإبقاء على القاعات
+                    cursor.execute('UPDATE distributions SET teacher1_id = NULL WHERE teacher1_id = ?', (teacher_id,))
+                    cursor.execute('UPDATE distributions SET teacher2_id = NULL WHERE teacher2_id = ?', (teacher_id,))
+                    # المقاعد من 3 فما فوق لا تنعكس من distributions فتُحذف مباشرة
+                    cursor.execute('DELETE FROM assignments WHERE teacher_id = ? AND seat > 2', (teacher_id,))
+                    messagebox.showwarning("تنبيه", f"تعذر استبدال المراقب تلقائياً: {str(e)}")
                 
                 # حذف السجلات المرتبطة في جدول الإجازات
                 cursor.execute('DELETE FROM leaves WHERE teacher_id = ?', (teacher_id,))
@@ -942,6 +971,7 @@ class ExamSupervisionSystem:
                 # حذف المراقب
                 cursor.execute('DELETE FROM teachers WHERE id = ?', (teacher_id,))
                 self.db.conn.commit()
+                self.db.invalidate('teachers', 'distributions', 'assignments', 'teacher_workload', 'leaves')
                 
                 self.update_lists()
                 self.db.log_action(self.user_id, "حذف مراقب", f"تم حذف المراقب: {name}")
@@ -965,6 +995,7 @@ class ExamSupervisionSystem:
                 VALUES (?)
             ''', (name,))
             self.db.conn.commit()
+            self.db.invalidate('rooms')
             
             self.room_entry.delete(0, 'end')
             self.update_lists()
@@ -984,14 +1015,14 @@ class ExamSupervisionSystem:
         
         # الحصول على بيانات القاعة
         cursor = self.db.conn.cursor()
-        cursor.execute('SELECT id, name FROM rooms WHERE name = ?', (room_name,))
+        cursor.execute('SELECT id, name, version FROM rooms WHERE name = ?', (room_name,))
         room = cursor.fetchone()
         
         if not room:
             messagebox.showerror("خطأ", "لم يتم العثور على بيانات القاعة")
             return
         
-        room_id, name = room
+        room_id, name, version = room
         
         # طلب الاسم الجديد
         new_name = simpledialog.askstring("تعديل القاعة", "أدخل اسم القاعة الجديد:", initialvalue=name)
@@ -1003,17 +1034,21 @@ class ExamSupervisionSystem:
                 return
             
             try:
-                # تحديث بيانات القاعة
-                cursor.execute('UPDATE rooms SET name = ? WHERE id = ?', (new_name, room_id))
-                self.db.conn.commit()
+                # تحديث بيانات القاعة بشرط ألا يكون مستخدم آخر قد عدلها منذ فتح النافذة
+                if not self.db.update_room(room_id, name=new_name, expected_version=version):
+                    messagebox.showerror("خطأ", "فشل تعديل القاعة. قد يكون الاسم مستخدماً بالفعل.")
+                    return
                 
                 self.update_lists()
                 self.db.log_action(self.user_id, "تعديل قاعة", 
                                   f"تم تعديل بيانات القاعة من: {name} إلى: {new_name}")
                 messagebox.showinfo("نجاح", f"تم تعديل بيانات القاعة بنجاح")
             
+            except ConcurrentModificationError:
+                self.update_lists()
+                messagebox.showwarning("تعارض", "عدّل مستخدم آخر هذه القاعة أثناء التحرير. "
+                                                "تم تحديث القائمة، يرجى إعادة المحاولة.")
             except Exception as e:
-                self.db.conn.rollback()
                 messagebox.showerror("خطأ", f"حدث خطأ أثناء تعديل بيانات القاعة: {str(e)}")
                 print(f"خطأ في تعديل القاعة: {e}")
     
@@ -1032,6 +1067,7 @@ class ExamSupervisionSystem:
                 # حذف القاعة
                 cursor.execute('DELETE FROM rooms WHERE name = ?', (room_name,))
                 self.db.conn.commit()
+                self.db.invalidate('rooms')
                 
                 self.room_listbox.delete(selection[0])
                 self.logger.info(f"تم حذف القاعة: {room_name}")
@@ -1102,6 +1138,7 @@ class ExamSupervisionSystem:
                     cursor.execute('INSERT INTO distributions (date_id, room_id) VALUES (?, ?)', (date_id, room_id))
             
             self.db.conn.commit()
+            self.db.invalidate('exam_dates', 'distributions')
             window.destroy()
             self.update_lists()
             messagebox.showinfo("نجاح", f"تم إضافة تاريخ الامتحان: {selected_date} مع القاعات المختارة")
@@ -1125,6 +1162,7 @@ class ExamSupervisionSystem:
             # Then delete the exam date
             cursor.execute('DELETE FROM exam_dates WHERE date = ?', (date,))
             self.db.conn.commit()
+            self.db.invalidate('exam_dates', 'distributions')
             
             self.update_lists()
             self.db.log_action(self.user_id, "حذف تاريخ", f"تم حذف التاريخ: {date}")
@@ -1136,118 +1174,77 @@ class ExamSupervisionSystem:
             messagebox.showerror("خطأ", "يرجى التأكد من وجود مراقبين وقاعات وتواريخ")
             return
         
-        try:
-            cursor = self.db.conn.cursor()
-            
-            # الحصول على جميع التواريخ مرتبة
-            cursor.execute('SELECT id, date FROM exam_dates ORDER BY date')
-            dates = cursor.fetchall()
-            
-            # التحقق من عدد المراقبين المتاحين
-            cursor.execute('SELECT COUNT(*) FROM teachers')
-            total_teachers = cursor.fetchone()[0]
-            if total_teachers < 2:
-                raise ValueError("يجب وجود مراقبين على الأقل لإتمام التوزيع")
-            
-            # إنشاء قواميس لتتبع عدد المراقبات وآخر تاريخ مراقبة لكل معلم
-            supervision_count = {}
-            last_supervision_date = {}
-            
-            # تهيئة القواميس
-            cursor.execute('SELECT id FROM teachers')
-            for (teacher_id,) in cursor.fetchall():
-                supervision_count[teacher_id] = 0
-                last_supervision_date[teacher_id] = None
-            
-            # حذف التوزيعات السابقة
-            cursor.execute('UPDATE distributions SET teacher1_id = NULL, teacher2_id = NULL')
-            
-            # توزيع المراقبين لكل تاريخ
-            for date_id, exam_date in dates:
-                # الحصول على المراقبين المتاحين (غير في إجازة)
-                cursor.execute('''
-                    SELECT t.id, t.name, t.experience
-                    FROM teachers t
-                    WHERE t.id NOT IN (
-                        SELECT l.teacher_id FROM leaves l
-                        WHERE l.status = 'approved'
-                        AND ? BETWEEN l.start_date AND l.end_date
-                    )
-                    ORDER BY t.experience DESC
-                ''', (exam_date,))
-                available_teachers = cursor.fetchall()
-                
-                # التحقق من وجود مراقبين كافيين
-                if len(available_teachers) < 2:
-                    raise ValueError(f"عدد المراقبين المتاحين ({len(available_teachers)}) غير كافٍ في تاريخ {exam_date}")
-                
-                # الحصول على القاعات المحددة لهذا التاريخ
-                cursor.execute('SELECT room_id FROM distributions WHERE date_id = ?', (date_id,))
-                selected_rooms = cursor.fetchall()
-                
-                # التحقق من وجود قاعات كافية
-                if len(selected_rooms) == 0:
-                    raise ValueError(f"لا توجد قاعات محددة في تاريخ {exam_date}")
-                
-                # التحقق من وجود عدد كافٍ من المراقبين
-                if len(available_teachers) < len(selected_rooms) * 2:
-                    raise ValueError(f"عدد المراقبين المتاحين ({len(available_teachers)}) غير كافٍ للقاعات ({len(selected_rooms)}) في {exam_date}. يجب توفر مراقبين لكل قاعة.")
-                
-                # ترتيب المراقبين حسب عدد المراقبات وتاريخ آخر مراقبة
-                def teacher_priority(teacher):
-                    teacher_id = teacher[0]
-                    days_since_last = float('inf')
-                    if last_supervision_date[teacher_id]:
-                        last_date = datetime.strptime(last_supervision_date[teacher_id], '%Y-%m-%d')
-                        current_date = datetime.strptime(exam_date, '%Y-%m-%d')
-                        days_since_last = (current_date - last_date).days
-                    return (supervision_count[teacher_id], -days_since_last)
-                
-                # توزيع المراقبين
-                for room_id, in selected_rooms:
-                    # ترتيب المراقبين المتاحين حسب الأولوية
-                    sorted_teachers = sorted(available_teachers, key=teacher_priority)
-                    
-                    # تحديد مجموعة المراقبين المؤهلين (الذين لديهم أقل عدد من المراقبات)
-                    min_supervisions = supervision_count[sorted_teachers[0][0]]
-                    eligible_teachers = [t for t in sorted_teachers if supervision_count[t[0]] <= min_supervisions + 1]
-                    
-                    # اختيار المراقب الأول بشكل عشوائي من المجموعة المؤهلة
-                    teacher1 = random.choice(eligible_teachers[:max(3, len(eligible_teachers)//3)])
-                    cursor.execute('UPDATE distributions SET teacher1_id = ? WHERE date_id = ? AND room_id = ?',
-                                  (teacher1[0], date_id, room_id))
-                    
-                    # تحديث إحصائيات المراقب الأول
-                    supervision_count[teacher1[0]] += 1
-                    last_supervision_date[teacher1[0]] = exam_date
-                    available_teachers.remove(teacher1)
-                    
-                    # إعادة ترتيب المراقبين المتبقين وتحديد المؤهلين للمراقبة الثانية
-                    sorted_teachers = sorted(available_teachers, key=teacher_priority)
-                    min_supervisions = supervision_count[sorted_teachers[0][0]]
-                    eligible_teachers = [t for t in sorted_teachers if supervision_count[t[0]] <= min_supervisions + 1]
-                    
-                    # اختيار المراقب الثاني بشكل عشوائي من المجموعة المؤهلة
-                    teacher2 = random.choice(eligible_teachers[:max(3, len(eligible_teachers)//3)])
-                    cursor.execute('UPDATE distributions SET teacher2_id = ? WHERE date_id = ? AND room_id = ?',
-                                  (teacher2[0], date_id, room_id))
-                    
-                    # تحديث إحصائيات المراقب الثاني
-                    supervision_count[teacher2[0]] += 1
-                    last_supervision_date[teacher2[0]] = exam_date
-                    available_teachers.remove(teacher2)
-            
-            self.db.conn.commit()
-            self.db.log_action(self.user_id, "توزيع المراقبين", "تم توزيع المراقبين بشكل عادل")
-            
-            messagebox.showinfo("نجاح", "تم توزيع المراقبين بشكل عادل")
-            
-        except ValueError as e:
-            messagebox.showerror("خطأ", str(e))
+        worker = getattr(self, 'distribution_worker', None)
+        if worker and worker.is_alive():
+            messagebox.showinfo("تنبيه", "عملية التوزيع قيد التنفيذ")
             return
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ أثناء التوزيع: {str(e)}")
+        
+        # التوزيع يتم في خيط منفصل باتصاله الخاص حتى تبقى الواجهة مستجيبة أثناء الحساب
+        settings = self.load_distribution_settings()
+        database_path = self.db.conn.execute('PRAGMA database_list').fetchone()[2]
+        self.distribution_worker = DistributionWorker(
+            database_path,
+            runs=settings.get("portfolio_runs", 1),
+            workers=settings.get("portfolio_workers") or None,
+            deadline=settings.get("portfolio_deadline_seconds")
+        )
+        
+        # نافذة التقدم غير مقيدة لتبقى بقية النوافذ مثل عرض الجدول متاحة
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title("توزيع المراقبين")
+        progress_window.geometry("400x150")
+        progress_window.protocol("WM_DELETE_WINDOW", self.cancel_distribution)
+        
+        self.distribution_status = tk.StringVar(value="جاري تحميل البيانات...")
+        ttk.Label(progress_window, textvariable=self.distribution_status).pack(pady=10)
+        self.distribution_progress = ttk.Progressbar(progress_window, length=350, mode='determinate')
+        self.distribution_progress.pack(pady=5)
+        self.cancel_distribution_button = ttk.Button(progress_window, text="إلغاء", command=self.cancel_distribution)
+        self.cancel_distribution_button.pack(pady=10)
+        self.distribution_window = progress_window
+        
+        self.distribute_button.config(state='disabled')
+        self.distribution_worker.start()
+        self.root.after(100, self._poll_distribution)
+    
+    def cancel_distribution(self):
+        """طلب إلغاء التوزيع الجاري؛ لا يُحفظ شيء ما لم يكن الحفظ قد بدأ"""
+        worker = getattr(self, 'distribution_worker', None)
+        if worker and worker.is_alive():
+            worker.cancel()
+            self.distribution_status.set("جاري الإلغاء...")
+            self.cancel_distribution_button.config(state='disabled')
+    
+    def _poll_distribution(self):
+        """قراءة أحداث خيط التوزيع وتحديث نافذة التقدم"""
+        worker = self.distribution_worker
+        while not worker.events.empty():
+            kind, payload = worker.events.get_nowait()
+            if kind == 'progress':
+                done, total, label = payload
+                self.distribution_progress.config(maximum=total, value=done)
+                if label:
+                    self.distribution_status.set(f"تم توزيع {done} من {total} ({label})")
+                else:
+                    self.distribution_status.set(f"اكتمل {done} من {total} تشغيلات")
+                continue
+            
+            # حدث نهائي: إعادة تفعيل الواجهة بعد انتهاء الحفظ أو الإلغاء
+            self.distribution_window.destroy()
+            self.distribute_button.config(state='normal')
+            if kind == 'done':
+                self.db.log_action(self.user_id, "توزيع المراقبين", "تم توزيع المراقبين بشكل عادل")
+                messagebox.showinfo("نجاح", "تم توزيع المراقبين بشكل عادل")
+            elif kind == 'cancelled':
+                messagebox.showinfo("إلغاء", "تم إلغاء التوزيع ولم يتغير الجدول")
+            elif kind == 'error':
+                messagebox.showerror("خطأ", payload)
+            else:
+                self.logger.error(f"خطأ أثناء التوزيع: {payload}")
+                messagebox.showerror("خطأ", f"حدث خطأ أثناء التوزيع: {payload}")
             return
+        
+        self.root.after(100, self._poll_distribution)
     
     def show_table(self):
         # إنشاء نافذة جديدة
@@ -1268,8 +1265,7 @@ class ExamSupervisionSystem:
         tree.configure(yscrollcommand=scrollbar.set)
         
         # تعبئة البيانات
-        distributions = self.db.get_distributions()
-        for dist in distributions:
+        for dist in self.db.iter_distributions():
             tree.insert("", "end", values=dist[1:])
         
         # تنسيق النافذة
@@ -1383,6 +1379,7 @@ class ExamSupervisionSystem:
                     cursor.execute('INSERT INTO distributions VALUES (?, ?, ?, ?, ?)', dist)
                 
                 self.db.conn.commit()
+                self.db.invalidate('teachers', 'rooms', 'exam_dates', 'distributions')
                 self.update_lists()
                 
                 messagebox.showinfo("نجاح", "تم استعادة النسخة الاحتياطية بنجاح")
@@ -1399,8 +1396,8 @@ class ExamSupervisionSystem:
         filename = filedialog.asksaveasfilename(defaultextension=".xlsx",
                                               filetypes=[("Excel files", "*.xlsx")])
         if filename:
-            distributions = self.db.get_distributions()
-            df = pd.DataFrame(distributions, columns=["ID", "التاريخ", "القاعة", "المراقب الأول", "المراقب الثاني"])
+            df = pd.DataFrame.from_records(self.db.iter_distributions(),
+                                           columns=["ID", "التاريخ", "القاعة", "المراقب الأول", "المراقب الثاني"])
             df = df.drop("ID", axis=1)
             df.to_excel(filename, index=False)
             
@@ -1433,14 +1430,21 @@ class ExamSupervisionSystem:
                 cursor.execute('DELETE FROM rooms')
                 cursor.execute('DELETE FROM exam_dates')
                 
-                # إضافة البيانات الجديدة
-                for _, row in df.iterrows():
-                    self.db.add_teacher(row["المراقب الأول"])
-                    self.db.add_teacher(row["المراقب الثاني"])
-                    self.db.add_room(row["القاعة"])
-                    self.db.add_exam_date(row["التاريخ"])
+                # إضافة البيانات الجديدة دفعة واحدة ثم ربط التوزيعات بالمعرفات
+                rows = [(str(row["التاريخ"])[:10], row["القاعة"],
+                         row["المراقب الأول"] if pd.notna(row["المراقب الأول"]) else None,
+                         row["المراقب الثاني"] if pd.notna(row["المراقب الثاني"]) else None)
+                        for _, row in df.iterrows()]
+                teacher_ids = self.db.bulk_upsert_teachers(
+                    name for row in rows for name in row[2:] if name is not None)
+                room_ids = self.db.bulk_upsert_rooms(row[1] for row in rows)
+                date_ids = self.db.bulk_upsert_exam_dates(row[0] for row in rows)
+                self.db.bulk_upsert_distributions(
+                    (date_ids[date], room_ids[room], teacher_ids.get(teacher1), teacher_ids.get(teacher2))
+                    for date, room, teacher1, teacher2 in rows)
                 
                 self.db.conn.commit()
+                self.db.invalidate('teachers', 'rooms', 'exam_dates', 'distributions')
                 self.update_lists()
                 
                 self.db.log_action(self.user_id, "استيراد Excel", f"تم استيراد البيانات من: {filename}")
@@ -1474,29 +1478,41 @@ class ExamSupervisionSystem:
         notebook.add(teacher_frame, text="المراقبون")
         
         teacher_tree = ttk.Treeview(teacher_frame,
-                                   columns=("المراقب", "عدد المراقبات"),
+                                   columns=("المراقب", "عدد المراقبات", "آخر مراقبة"),
                                    show="headings")
         teacher_tree.heading("المراقب", text="المراقب")
         teacher_tree.heading("عدد المراقبات", text="عدد المراقبات")
+        teacher_tree.heading("آخر مراقبة", text="آخر مراقبة")
         
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-            SELECT t.name, COUNT(*) as count
-            FROM teachers t
-            LEFT JOIN (
-                SELECT teacher1_id as teacher_id FROM distributions
-                UNION ALL
-                SELECT teacher2_id FROM distributions
-            ) d ON t.id = d.teacher_id
-            GROUP BY t.id, t.name
-            ORDER BY count DESC
-        ''')
-        
-        for row in cursor.fetchall():
-            teacher_tree.insert("", "end", values=row)
+        # صف واحد لكل مراقب من جدول العبء المجمع بدلاً من تجميع كل التوزيعات
+        for name, total, last_date, _ in self.db.get_teacher_workload():
+            teacher_tree.insert("", "end", values=(name, total, last_date or ""))
         
         teacher_tree.pack(fill='both', expand=True)
     
+    def show_query_stats(self):
+        stats = self.db.get_query_stats(limit=100)
+        if self.db.query_stats is None:
+            messagebox.showinfo("أداء الاستعلامات",
+                                "قياس الاستعلامات معطل، فعّله بالخيار query_stats في config.json")
+            return
+        
+        stats_window = tk.Toplevel(self.root)
+        stats_window.title("أداء الاستعلامات")
+        stats_window.geometry("900x400")
+        
+        columns = ("الاستعلام", "العدد", "المتوسط (مللي ثانية)", "الأقصى (مللي ثانية)", "بطيء")
+        tree = ttk.Treeview(stats_window, columns=columns, show="headings")
+        for column in columns:
+            tree.heading(column, text=column)
+        tree.column("الاستعلام", width=500)
+        
+        for row in stats:
+            tree.insert("", "end", values=(row['query'], row['count'], row['avg_ms'],
+                                           row['max_ms'], row['slow']))
+        
+        tree.pack(fill='both', expand=True)
+    
     def show_notification_settings(self):
         settings_window = tk.Toplevel(self.root)
         settings_window.title('إعدادات الإشعارات')
@@ -1707,10 +1723,10 @@ class ExamSupervisionSystem:
         tree.heading("المراقب الأول", text="المراقب الأول")
         tree.heading("المراقب الثاني", text="المراقب الثاني")
         
-        # تحميل البيانات
+        # تحميل البيانات؛ معرف الصف هو معرف التوزيع، وإصداره يُحفظ للحفظ الشرطي
         cursor = self.db.conn.cursor()
         cursor.execute("""
-            SELECT ed.date, r.name, t1.name, t2.name
+            SELECT d.id, d.version, ed.date, r.name, t1.name, t2.name
             FROM distributions d
             JOIN exam_dates ed ON d.date_id = ed.id
             JOIN rooms r ON d.room_id = r.id
@@ -1719,8 +1735,10 @@ class ExamSupervisionSystem:
             ORDER BY ed.date, r.name
         """)
         
-        for row in cursor.fetchall():
-            tree.insert("", "end", values=row)
+        versions = {}
+        for distribution_id, version, *row in cursor.fetchall():
+            tree.insert("", "end", iid=str(distribution_id), values=row)
+            versions[str(distribution_id)] = version
         
         tree.pack(fill='both', expand=True)
         
@@ -1744,11 +1762,14 @@ class ExamSupervisionSystem:
         teacher2_combo = ttk.Combobox(manual_edit_frame, textvariable=teacher2_var)
         teacher2_combo.grid(row=0, column=3, padx=5)
         
-        # تحميل أسماء المراقبين
-        cursor.execute("SELECT name FROM teachers ORDER BY name")
-        teachers = [row[0] for row in cursor.fetchall()]
+        # تحميل أسماء المراقبين ومصفوفة التوفر مرة واحدة للنافذة
+        cursor.execute("SELECT id, name FROM teachers ORDER BY name")
+        teacher_rows = cursor.fetchall()
+        teacher_ids = {name: teacher_id for teacher_id, name in teacher_rows}
+        teachers = [name for _, name in teacher_rows]
         teacher1_combo['values'] = teachers
         teacher2_combo['values'] = teachers
+        availability = self.db.get_availability()
         
         def update_selected():
             selected = tree.selection()
@@ -1760,29 +1781,62 @@ class ExamSupervisionSystem:
             date, room = item['values'][:2]
             teacher1 = teacher1_var.get()
             teacher2 = teacher2_var.get()
+            if teacher1 not in teacher_ids or teacher2 not in teacher_ids:
+                messagebox.showerror("خطأ", "يرجى اختيار المراقبين من القائمة")
+                return
             
             try:
-                cursor = self.db.conn.cursor()
-                # تحديث المراقبين
-                cursor.execute("""
-                    UPDATE distributions
-                    SET teacher1_id = (SELECT id FROM teachers WHERE name = ?),
-                        teacher2_id = (SELECT id FROM teachers WHERE name = ?)
-                    WHERE date_id = (SELECT id FROM exam_dates WHERE date = ?)
-                    AND room_id = (SELECT id FROM rooms WHERE name = ?)
-                """, (teacher1, teacher2, date, room))
-                
-                self.db.conn.commit()
+                # تحديث المراقبين بشرط ألا يكون مستخدم آخر (أو إعادة التوزيع) قد غير الصف منذ تحميله
+                if not self.db.update_distribution(int(selected[0]), teacher1_id=teacher_ids[teacher1],
+                                                   teacher2_id=teacher_ids[teacher2],
+                                                   expected_version=versions[selected[0]]):
+                    # لم يُحفظ شيء (المراقب له مقعد آخر في اليوم نفسه أو اختير للمقعدين)
+                    messagebox.showerror("خطأ", "تعذر حفظ التعديل: أحد المراقبين مكلف بمراقبة أخرى في هذا التاريخ "
+                                                "أو اختير المراقب نفسه للمقعدين.")
+                    return
+                versions[selected[0]] += 1
                 self.db.log_action(self.user_id, "تعديل التوزيع", f"تم تعديل المراقبين في {room} بتاريخ {date}")
                 
+                # تحديث مصفوفة التوفر بالمراقبين السابقين والجدد
+                for name in item['values'][2:4]:
+                    if name in teacher_ids:
+                        availability.release(teacher_ids[name], date)
+                for name in (teacher1, teacher2):
+                    if name in teacher_ids:
+                        availability.assign(teacher_ids[name], date)
+                
                 # تحديث العرض
                 tree.set(selected[0], "المراقب الأول", teacher1)
                 tree.set(selected[0], "المراقب الثاني", teacher2)
                 
                 messagebox.showinfo("نجاح", "تم تحديث التوزيع بنجاح")
+            except ConcurrentModificationError:
+                reload_row(selected[0])
+                messagebox.showwarning("تعارض", "عدّل مستخدم آخر هذا الصف أثناء التحرير. "
+                                                "تم عرض القيم الحالية، يرجى مراجعتها وإعادة المحاولة.")
             except Exception as e:
                 messagebox.showerror("خطأ", f"حدث خطأ أثناء التحديث: {str(e)}")
         
+        def reload_row(iid):
+            """إعادة قراءة صف تغير في قاعدة البيانات وتحديث التوفر والعرض به"""
+            old = tree.item(iid)['values']
+            row = self.db.get_distribution_by_id(int(iid))
+            for name in old[2:4]:
+                if name in teacher_ids:
+                    availability.release(teacher_ids[name], old[0])
+            if row is None:
+                tree.delete(iid)
+                versions.pop(iid, None)
+                return
+            date, room, teacher1, teacher2 = row[5:9]
+            for name in (teacher1, teacher2):
+                if name in teacher_ids:
+                    availability.assign(teacher_ids[name], date)
+            tree.item(iid, values=(date, room, teacher1, teacher2))
+            versions[iid] = row[9]
+            teacher1_var.set(teacher1)
+            teacher2_var.set(teacher2)
+        
         ttk.Button(manual_edit_frame, text="تحديث", command=update_selected).grid(row=0, column=4, padx=10)
         
         # عند اختيار صف
@@ -1792,6 +1846,12 @@ class ExamSupervisionSystem:
                 item = tree.item(selected[0])
                 teacher1_var.set(item['values'][2] or "")
                 teacher2_var.set(item['values'][3] or "")
+                # عرض المراقبين المتاحين في هذا التاريخ فقط مع مراقبي الصف الحالي
+                current = item['values'][2:4]
+                free = [name for teacher_id, name in teacher_rows
+                        if name in current or availability.is_free(teacher_id, item['values'][0])]
+                teacher1_combo['values'] = free
+                teacher2_combo['values'] = free
         
         tree.bind('<<TreeviewSelect>>', on_select)
     
@@ -1847,6 +1907,9 @@ class ExamSupervisionSystem:
         messagebox.showinfo("حول البرنامج", about_text)
 
 if __name__ == "__main__":
+    # مطلوب لوضع التوزيع المتوازي عند تشغيل النسخة المجمعة على ويندوز
+    import multiprocessing
+    multiprocessing.freeze_support()
     from login import LoginSystem
     login = LoginSystem()
     login.run()
\ No newline at end of file
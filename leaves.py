@@ -1,5 +1,14 @@
+import logging
 from datetime import datetime, timedelta
 from database import Database
+from distribution_engine import DistributionEngine, ChangeSet
+
+logger = logging.getLogger('leaves')
+
+
+class LeaveReseatError(Exception):
+    """حُفظت الموافقة على الإجازة لكن تعذر استبدال المراقب؛ ما زال مكلفاً بمقاعده في أيامها"""
+
 
 class LeaveManager:
     # أنواع الإجازات المتاحة
@@ -19,33 +28,8 @@ class LeaveManager:
     }
     
     def __init__(self, db):
+        # جدول الإجازات وعمود leave_type من ترحيلات المخطط التي يطبقها Database عند فتحه
         self.db = db
-        self.setup_database()
-    
-    def setup_database(self):
-        cursor = self.db.conn.cursor()
-        # حذف الجدول القديم إذا كان موجوداً
-        cursor.execute('DROP TABLE IF EXISTS leaves')
-        
-        # إنشاء الجدول مع العمود الجديد leave_type
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS leaves (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                teacher_id INTEGER NOT NULL,
-                leave_type TEXT NOT NULL,
-                start_date DATE NOT NULL,
-                end_date DATE NOT NULL,
-                reason TEXT NOT NULL,
-                status TEXT DEFAULT 'قيد المراجعة',
-                approved_by INTEGER,
-                rejection_reason TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (teacher_id) REFERENCES teachers (id),
-                FOREIGN KEY (approved_by) REFERENCES users (id)
-            )
-        ''')
-        self.db.conn.commit()
     
     def request_leave(self, teacher_id, leave_type, start_date, end_date, reason):
         # التحقق من نوع الإجازة
@@ -110,31 +94,52 @@ class LeaveManager:
         return None
     
     def approve_leave(self, leave_id, approved_by):
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
+        """الموافقة على الإجازة ثم استبدال المراقب في أيامها
+        
+        Raises:
+            LeaveReseatError: لا يوجد بديل متاح؛ الموافقة محفوظة ويجب تعديل التوزيع يدوياً
+        """
+        leave = self._set_status(leave_id, 'موافق عليها', '''
             UPDATE leaves
             SET status = 'موافق عليها', approved_by = ?
             WHERE id = ?
         ''', (approved_by, leave_id))
-        self.db.conn.commit()
+        
+        # استبدال المراقب في أيام الإجازة فقط دون إعادة توزيع الفصل كاملاً
+        if leave:
+            try:
+                DistributionEngine(self.db.conn).redistribute(
+                    ChangeSet().add_leave(leave['teacher_id'], leave['start_date'], leave['end_date']))
+                self.db.invalidate('distributions', 'assignments', 'teacher_workload')
+            except ValueError as e:
+                logger.warning(f'تعذر استبدال المراقب {leave["teacher_id"]} في أيام الإجازة {leave_id}: {e}')
+                raise LeaveReseatError(f'تمت الموافقة على الإجازة لكن تعذر استبدال المراقب في أيامها: {e}') from e
     
     def reject_leave(self, leave_id, rejected_by, rejection_reason):
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
+        self._set_status(leave_id, 'مرفوضة', '''
             UPDATE leaves
             SET status = 'مرفوضة', approved_by = ?, rejection_reason = ?
             WHERE id = ?
         ''', (rejected_by, rejection_reason, leave_id))
-        self.db.conn.commit()
     
     def cancel_leave(self, leave_id):
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
+        self._set_status(leave_id, 'ملغاة', '''
             UPDATE leaves
             SET status = 'ملغاة'
             WHERE id = ?
         ''', (leave_id,))
+    
+    def _set_status(self, leave_id, status, query, params):
+        """حفظ حالة الإجازة وتطبيق الفرق على مصفوفة التوفر المشتركة وإرجاع الإجازة"""
+        leave = self.get_leave(leave_id)
+        cursor = self.db.conn.cursor()
+        cursor.execute(query, params)
         self.db.conn.commit()
+        self.db.invalidate('leaves')
+        if leave:
+            self.db.apply_leave_status(leave['teacher_id'], leave['start_date'], leave['end_date'],
+                                       leave['status'], status)
+        return leave
     
     def get_teacher_leaves(self, teacher_id):
         cursor = self.db.conn.cursor()
@@ -5,7 +5,7 @@ import pyotp
 import smtplib
 from email.message import EmailMessage
 import random
-from database import Database
+from database import get_database_service
 from PIL import Image, ImageTk
 import os
 import json
@@ -28,6 +28,7 @@ class LoginSystem:
     
     def on_close(self):
         """معالج لإغلاق النافذة بشكل صحيح"""
+        get_database_service().stop()
         self.root.quit()
         self.root.destroy()
         os._exit(0)
@@ -113,8 +114,8 @@ class LoginSystem:
         style.configure("Custom.TLabel", font=("NotoNaskhArabic", 14))
         style.configure("Custom.TButton", font=("Cairo", 14, "bold"), padding=12)
         
-        # إنشاء قاعدة البيانات
-        self.db = Database()
+        # قاعدة البيانات المشتركة لكل مكونات النظام
+        self.db = get_database_service().start()
         
         self.create_widgets()
     
@@ -399,7 +400,7 @@ class LoginSystem:
                 new_window.withdraw()
                 
                 # تهيئة النظام
-                app = ExamSupervisionSystem(new_window, user_id, role)
+                app = ExamSupervisionSystem(new_window, user_id, role, db=self.db)
                 
                 # إخفاء نافذة تسجيل الدخول
                 self.window.withdraw()
@@ -411,6 +412,7 @@ class LoginSystem:
                         self.db.log_action(user_id, "تسجيل خروج", "تم الخروج من النظام")
                         new_window.destroy()
                         self.window.destroy()
+                        get_database_service().stop()
                         
                 new_window.protocol("WM_DELETE_WINDOW", on_closing)
                 
@@ -639,6 +641,9 @@ class LoginSystem:
         self.root.mainloop()
 
 if __name__ == "__main__":
+    # مطلوب لوضع التوزيع المتوازي عند تشغيل النسخة المجمعة على ويندوز
+    import multiprocessing
+    multiprocessing.freeze_support()
     login_system = LoginSystem()
     login_system.run()
 
@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+INSERT_RUN = '''
+    INSERT INTO maintenance_runs (started_at, duration, tasks,
+                                  db_size_before, db_size_after,
+                                  wal_size_before, wal_size_after,
+                                  freelist_before, freelist_after, error)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class MaintenanceScheduler:
+    """صيانة دورية لقاعدة البيانات في فترات الخمول
+
+    يعمل بجانب خيط النسخ الاحتياطي: كل interval ثانية، وبشرط ألا تكون هناك كتابة منذ
+    idle_seconds، ينفذ PRAGMA optimize و ANALYZE (كل analyze_interval) و incremental_vacuum
+    لتحرير صفحات الحذف ثم wal_checkpoint(TRUNCATE) لتصغير ملف WAL. حجم الملف وحجم WAL
+    وعدد الصفحات الحرة قبل كل تشغيل وبعده تُحفظ في جدول maintenance_runs.
+    """
+
+    def __init__(self, pool, interval: float = 3600, idle_seconds: float = 60,
+                 analyze_interval: float = 86400, check_interval: float = 60):
+        self.pool = pool
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.analyze_interval = analyze_interval
+        self.check_interval = check_interval
+        self.thread = None
+        self.last_run = None
+        self.last_analyze = None
+        self._stop = threading.Event()
+        self.logger = logging.getLogger('database')
+
+    def start(self) -> None:
+        if self.thread is None or not self.thread.is_alive():
+            self._stop.clear()
+            self.thread = threading.Thread(target=self._worker, name='db-maintenance', daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self._stop.set()
+        self.thread.join()
+        self.thread = None
+
+    def is_idle(self) -> bool:
+        return time.monotonic() - self.pool.last_write >= self.idle_seconds
+
+    def is_due(self) -> bool:
+        return self.last_run is None or time.monotonic() - self.last_run >= self.interval
+
+    def _worker(self) -> None:
+        # التشغيل الأول بعد فترة فحص كاملة حتى لا ينافس بدء التطبيق
+        while not self._stop.wait(self.check_interval):
+            if self.is_due() and self.is_idle():
+                try:
+                    self.run()
+                except Exception as e:
+                    # مثل قفل الملف لدى عميل آخر: last_run لم يتغير فيُعاد التشغيل في فترة الخمول التالية
+                    self.logger.error(f'تعذر تشغيل صيانة قاعدة البيانات: {e}')
+
+    def sizes(self, conn) -> Dict[str, int]:
+        """حجم ملف قاعدة البيانات وملف WAL (بالبايت) وعدد الصفحات الحرة"""
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        wal_path = self.pool.path + '-wal'
+        return {
+            'db_size': page_size * page_count,
+            'wal_size': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            'freelist': conn.execute('PRAGMA freelist_count').fetchone()[0],
+        }
+
+    def _jobs(self, conn, analyze: bool) -> List[Tuple[str, Tuple[str, ...]]]:
+        """مهام التشغيل بالترتيب: (اسم المهمة، جملها)"""
+        jobs = []
+        if analyze:
+            jobs.append(('analyze', ('ANALYZE',)))
+        jobs.append(('optimize', ('PRAGMA optimize',)))
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            # قاعدة أنشئت دون auto_vacuum: التحويل إلى INCREMENTAL يتطلب VACUUM كاملاً مرة واحدة
+            jobs.append(('vacuum', ('PRAGMA auto_vacuum = INCREMENTAL', 'VACUUM')))
+        else:
+            jobs.append(('incremental_vacuum', ('PRAGMA incremental_vacuum',)))
+        jobs.append(('checkpoint', ('PRAGMA wal_checkpoint(TRUNCATE)',)))
+        return jobs
+
+    def run(self, analyze: Optional[bool] = None) -> Dict:
+        """تشغيل واحد للصيانة وإرجاع سجله؛ analyze=None يتبع analyze_interval
+
+        فشل مهمة يُسجل ولا يوقف ما بعدها. الصيانة على كاتب المجمع الذي لا يصل إليه غيره
+        إلا عبر قفله، وتشغيل فيه خطأ لا يغير last_run فيُعاد في فترة الخمول التالية.
+        """
+        if analyze is None:
+            analyze = (self.last_analyze is None
+                       or time.monotonic() - self.last_analyze >= self.analyze_interval)
+        started_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        start = time.perf_counter()
+        tasks: List[str] = []
+        errors: List[str] = []
+        with self.pool.exclusive() as conn:
+            before = self.sizes(conn)
+            for task, statements in self._jobs(conn, analyze):
+                try:
+                    for sql in statements:
+                        rows = conn.execute(sql).fetchall()
+                except Exception as e:
+                    errors.append(f'{task}: {e}')
+                    self.logger.error(f'خطأ في صيانة قاعدة البيانات ({task}): {e}')
+                    continue
+                if task == 'analyze':
+                    self.last_analyze = time.monotonic()
+                elif task == 'checkpoint' and rows[0][0]:
+                    task = 'checkpoint_busy'
+                tasks.append(task)
+            after = self.sizes(conn)
+        duration = time.perf_counter() - start
+        error = '; '.join(errors) or None
+        if error is None:
+            self.last_run = time.monotonic()
+
+        record = {
+            'started_at': started_at,
+            'duration': duration,
+            'tasks': tasks,
+            'before': before,
+            'after': after,
+            'error': error,
+        }
+        with self.pool.write() as conn:
+            conn.execute(INSERT_RUN, (started_at, duration, ','.join(tasks),
+                                      before['db_size'], after['db_size'],
+                                      before['wal_size'], after['wal_size'],
+                                      before['freelist'], after['freelist'], error))
+        self.logger.info(f'صيانة قاعدة البيانات ({", ".join(tasks)}) في {duration:.2f} ث: '
+                         f'الحجم {before["db_size"]} → {after["db_size"]}، '
+                         f'WAL {before["wal_size"]} → {after["wal_size"]}، '
+                         f'الصفحات الحرة {before["freelist"]} → {after["freelist"]}')
+        return record
@@ -0,0 +1,514 @@
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger('database')
+
+# الصلاحيات الافتراضية لكل دور
+DEFAULT_PERMISSIONS = [
+    ('admin', 'manage_users'),
+    ('admin', 'manage_teachers'),
+    ('admin', 'manage_rooms'),
+    ('admin', 'manage_distributions'),
+    ('admin', 'manage_leaves'),
+    ('admin', 'view_reports'),
+    ('manager', 'manage_distributions'),
+    ('manager', 'manage_leaves'),
+    ('manager', 'view_reports'),
+    ('staff', 'manage_teachers'),
+    ('staff', 'manage_rooms'),
+    ('staff', 'manage_distributions'),
+    ('supervisor', 'view_distributions'),
+    ('supervisor', 'manage_notifications')
+]
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, definition: str) -> None:
+    """إضافة عمود لقواعد البيانات القديمة التي أنشئ فيها الجدول قبل وجوده"""
+    if column not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _base_schema(conn: sqlite3.Connection) -> None:
+    """الجداول الأساسية (IF NOT EXISTS لأن قواعد ما قبل الترحيلات تحتويها بالفعل)"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL,
+        last_login TIMESTAMP,
+        status TEXT DEFAULT 'active',
+        experience TEXT DEFAULT 'متوسط',
+        email TEXT,
+        phone TEXT,
+        failed_attempts INTEGER DEFAULT 0,
+        last_attempt TIMESTAMP,
+        account_locked_until TIMESTAMP DEFAULT NULL,
+        verification_code TEXT,
+        verification_code_expiry TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS permissions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        role TEXT NOT NULL,
+        permission TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(role, permission)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS teachers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        experience TEXT DEFAULT 'متوسط',
+        specialization TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS rooms (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        capacity INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS exam_dates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date DATE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS distributions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date_id INTEGER,
+        room_id INTEGER,
+        teacher1_id INTEGER,
+        teacher2_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (date_id) REFERENCES exam_dates (id),
+        FOREIGN KEY (room_id) REFERENCES rooms (id),
+        FOREIGN KEY (teacher1_id) REFERENCES teachers (id),
+        FOREIGN KEY (teacher2_id) REFERENCES teachers (id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        action TEXT NOT NULL,
+        details TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS leaves (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        teacher_id INTEGER NOT NULL,
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        reason TEXT NOT NULL,
+        status TEXT DEFAULT 'قيد المراجعة',
+        approved_by INTEGER,
+        rejection_reason TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (teacher_id) REFERENCES teachers (id),
+        FOREIGN KEY (approved_by) REFERENCES users (id)
+    )
+    ''')
+    conn.executemany('INSERT OR IGNORE INTO permissions (role, permission) VALUES (?, ?)',
+                     DEFAULT_PERMISSIONS)
+
+
+def _legacy_columns(conn: sqlite3.Connection) -> None:
+    """الأعمدة التي كانت تُضاف عند الاستخدام (get_all_rooms ومدير الإجازات وسكربت الخبرة)"""
+    _add_column(conn, 'users', 'experience', "TEXT DEFAULT 'متوسط'")
+    _add_column(conn, 'rooms', 'required_supervisors', 'INTEGER DEFAULT 2')
+    _add_column(conn, 'leaves', 'leave_type', "TEXT NOT NULL DEFAULT 'other'")
+    _add_column(conn, 'leaves', 'updated_at', 'TIMESTAMP')
+
+
+def _base_indexes(conn: sqlite3.Connection) -> None:
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_teachers_name ON teachers(name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rooms_name ON rooms(name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_exam_dates_date ON exam_dates(date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_distributions_date ON distributions(date_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leaves_teacher ON leaves(teacher_id, start_date, end_date)')
+
+
+def _tickets(conn: sqlite3.Connection) -> None:
+    """جداول نظام التذاكر"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            status TEXT NOT NULL,
+            priority TEXT NOT NULL,
+            created_by INTEGER NOT NULL,
+            assigned_to INTEGER,
+            created_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (created_by) REFERENCES users (id),
+            FOREIGN KEY (assigned_to) REFERENCES users (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            comment TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (ticket_id) REFERENCES tickets (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticket_attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL,
+            file_name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            uploaded_by INTEGER NOT NULL,
+            uploaded_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (ticket_id) REFERENCES tickets (id),
+            FOREIGN KEY (uploaded_by) REFERENCES users (id)
+        )
+    """)
+
+
+def _unique_keys(conn: sqlite3.Connection) -> None:
+    """مفاتيح فريدة للتاريخ و(التاريخ، القاعة) حتى تعمل عمليات INSERT ... ON CONFLICT
+
+    الصفوف المكررة التي تُدمج أو تُحذف تُنسخ أولاً كما هي إلى جدولي migration_removed_*
+    في المعاملة نفسها ويُسجل ملخصها، فيمكن مراجعتها أو استعادتها بعد الترقية.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS migration_removed_exam_dates (
+            id INTEGER, date DATE, created_at TIMESTAMP, merged_into INTEGER,
+            removed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS migration_removed_distributions (
+            id INTEGER, date_id INTEGER, original_date_id INTEGER, room_id INTEGER,
+            teacher1_id INTEGER, teacher2_id INTEGER, created_at TIMESTAMP, kept_id INTEGER,
+            removed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+    ''')
+    dates = conn.execute('''
+        INSERT INTO migration_removed_exam_dates (id, date, created_at, merged_into)
+        SELECT e.id, e.date, e.created_at, (SELECT MIN(id) FROM exam_dates WHERE date = e.date)
+        FROM exam_dates e
+        WHERE e.id NOT IN (SELECT MIN(id) FROM exam_dates GROUP BY date)
+    ''').rowcount
+    # التوزيعات المكررة تُحسب بعد دمج التواريخ؛ original_date_id هو التاريخ قبل الدمج
+    distributions = conn.execute('''
+        INSERT INTO migration_removed_distributions
+            (id, date_id, original_date_id, room_id, teacher1_id, teacher2_id, created_at, kept_id)
+        WITH merged AS (
+            SELECT d.*, (SELECT MIN(e2.id) FROM exam_dates e1 JOIN exam_dates e2 ON e2.date = e1.date
+                         WHERE e1.id = d.date_id) AS merged_date_id
+            FROM distributions d)
+        SELECT m.id, COALESCE(m.merged_date_id, m.date_id), m.date_id, m.room_id,
+               m.teacher1_id, m.teacher2_id, m.created_at, k.kept_id
+        FROM merged m
+        JOIN (SELECT COALESCE(merged_date_id, date_id) AS date_id, room_id, MIN(id) AS kept_id
+              FROM merged GROUP BY 1, 2) k
+          ON k.date_id IS COALESCE(m.merged_date_id, m.date_id) AND k.room_id IS m.room_id
+        WHERE m.id <> k.kept_id
+    ''').rowcount
+    if dates or distributions:
+        removed = conn.execute('''
+            SELECT id, date_id, room_id, teacher1_id, teacher2_id, kept_id
+            FROM migration_removed_distributions ORDER BY id DESC LIMIT ?
+        ''', (distributions,)).fetchall()
+        logger.warning(f'ترحيل المفاتيح الفريدة: دمج {dates} تاريخاً مكرراً وحذف {distributions} توزيعاً مكرراً '
+                       f'(محفوظة في migration_removed_exam_dates و migration_removed_distributions). '
+                       f'التوزيعات المحذوفة (id, date_id, room_id, teacher1_id, teacher2_id, kept_id): {removed}')
+
+    # دمج التواريخ المكررة في أقدم سجل قبل إنشاء الفهرس الفريد
+    conn.execute('''
+        UPDATE distributions SET date_id = (
+            SELECT MIN(e2.id) FROM exam_dates e1 JOIN exam_dates e2 ON e2.date = e1.date
+            WHERE e1.id = distributions.date_id)
+        WHERE date_id IN (SELECT id FROM exam_dates)
+    ''')
+    conn.execute('DELETE FROM exam_dates WHERE id NOT IN (SELECT MIN(id) FROM exam_dates GROUP BY date)')
+    conn.execute('''
+        DELETE FROM distributions WHERE id NOT IN (
+            SELECT MIN(id) FROM distributions GROUP BY date_id, room_id)
+    ''')
+    conn.execute('DROP INDEX IF EXISTS idx_exam_dates_date')
+    conn.execute('CREATE UNIQUE INDEX idx_exam_dates_date ON exam_dates(date)')
+    # الفهرس الجديد يبدأ بـ date_id فيغني عن idx_distributions_date
+    conn.execute('DROP INDEX IF EXISTS idx_distributions_date')
+    conn.execute('CREATE UNIQUE INDEX idx_distributions_date_room ON distributions(date_id, room_id)')
+
+
+def create_assignments(conn: sqlite3.Connection) -> None:
+    """جدول مقاعد المراقبة الموحد: صف لكل (توزيع، مقعد)
+
+    المقعدان 1 و 2 نسخة من teacher1_id و teacher2_id تحافظ عليها المشغلات، والمقاعد
+    من 3 فما فوق (قاعات تحتاج أكثر من مراقبَين) يكتبها محرك التوزيع مباشرة.
+    UNIQUE(date_id, teacher_id) يمنع إسناد مراقب مرتين في اليوم نفسه من أي مسار كتابة.
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS assignments (
+        distribution_id INTEGER NOT NULL,
+        date_id INTEGER NOT NULL,
+        teacher_id INTEGER NOT NULL,
+        seat INTEGER NOT NULL,
+        PRIMARY KEY (distribution_id, seat),
+        UNIQUE (date_id, teacher_id)
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_assignments_teacher ON assignments(teacher_id, date_id)')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_distributions_assignments_insert AFTER INSERT ON distributions
+    BEGIN
+        INSERT INTO assignments (distribution_id, date_id, teacher_id, seat)
+        SELECT NEW.id, NEW.date_id, NEW.teacher1_id, 1 WHERE NEW.teacher1_id IS NOT NULL;
+        INSERT INTO assignments (distribution_id, date_id, teacher_id, seat)
+        SELECT NEW.id, NEW.date_id, NEW.teacher2_id, 2 WHERE NEW.teacher2_id IS NOT NULL;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_distributions_assignments_update
+    AFTER UPDATE OF date_id, teacher1_id, teacher2_id ON distributions
+    BEGIN
+        DELETE FROM assignments WHERE distribution_id = OLD.id AND seat <= 2;
+        UPDATE assignments SET date_id = NEW.date_id WHERE distribution_id = NEW.id;
+        INSERT INTO assignments (distribution_id, date_id, teacher_id, seat)
+        SELECT NEW.id, NEW.date_id, NEW.teacher1_id, 1 WHERE NEW.teacher1_id IS NOT NULL;
+        INSERT INTO assignments (distribution_id, date_id, teacher_id, seat)
+        SELECT NEW.id, NEW.date_id, NEW.teacher2_id, 2 WHERE NEW.teacher2_id IS NOT NULL;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_distributions_assignments_delete AFTER DELETE ON distributions
+    BEGIN
+        DELETE FROM assignments WHERE distribution_id = OLD.id;
+    END
+    ''')
+    # نقل التوزيعات الحالية؛ الإسناد المكرر القديم في اليوم نفسه يُبقي أول صف فقط
+    conn.execute('''
+        INSERT OR IGNORE INTO assignments (distribution_id, date_id, teacher_id, seat)
+        SELECT id, date_id, teacher1_id, 1 FROM distributions WHERE teacher1_id IS NOT NULL
+        UNION ALL
+        SELECT id, date_id, teacher2_id, 2 FROM distributions WHERE teacher2_id IS NOT NULL
+        ORDER BY 1, 4
+    ''')
+
+
+WEEKDAY_COLUMNS = ('duties_sun', 'duties_mon', 'duties_tue', 'duties_wed', 'duties_thu', 'duties_fri', 'duties_sat')
+
+# تعديل صف العبء لمقعد واحد؛ {row} هو NEW أو OLD و{sign} هو + أو -
+_WORKLOAD_ADD = '''
+    INSERT OR IGNORE INTO teacher_workload (teacher_id) VALUES (NEW.teacher_id);
+    UPDATE teacher_workload SET
+        total_duties = total_duties + 1,
+        last_duty_date = MAX(COALESCE(last_duty_date, ''), e.date),
+        {weekdays}
+    FROM (SELECT date, strftime('%w', date) AS w FROM exam_dates WHERE id = NEW.date_id) AS e
+    WHERE teacher_id = NEW.teacher_id;
+'''.format(weekdays=',\n        '.join(f"{column} = {column} + (e.w = '{day}')"
+                                       for day, column in enumerate(WEEKDAY_COLUMNS)))
+
+_WORKLOAD_REMOVE = '''
+    UPDATE teacher_workload SET
+        total_duties = total_duties - 1,
+        last_duty_date = CASE WHEN last_duty_date = e.date THEN (
+            SELECT MAX(ed.date) FROM assignments a JOIN exam_dates ed ON ed.id = a.date_id
+            WHERE a.teacher_id = OLD.teacher_id) ELSE last_duty_date END,
+        {weekdays}
+    FROM (SELECT date, strftime('%w', date) AS w FROM exam_dates WHERE id = OLD.date_id) AS e
+    WHERE teacher_id = OLD.teacher_id;
+'''.format(weekdays=',\n        '.join(f"{column} = {column} - (e.w = '{day}')"
+                                       for day, column in enumerate(WEEKDAY_COLUMNS)))
+
+# إعادة حساب صفوف العبء من assignments؛ {where} يقصرها على مراقبين محددين
+_WORKLOAD_RECOMPUTE = '''
+    INSERT OR REPLACE INTO teacher_workload (teacher_id, total_duties, last_duty_date, {columns})
+    SELECT a.teacher_id, COUNT(*), MAX(ed.date), {sums}
+    FROM assignments a JOIN exam_dates ed ON ed.id = a.date_id
+    {{where}}
+    GROUP BY a.teacher_id
+'''.format(columns=', '.join(WEEKDAY_COLUMNS),
+           sums=', '.join(f"SUM(strftime('%w', ed.date) = '{day}')" for day in range(7)))
+
+
+def rebuild_teacher_workload(conn: sqlite3.Connection) -> int:
+    """إعادة بناء جدول العبء بالكامل من assignments (للاستعادة بعد أي خلل) وإرجاع عدد صفوفه"""
+    conn.execute('DELETE FROM teacher_workload')
+    conn.execute(_WORKLOAD_RECOMPUTE.format(where=''))
+    return conn.execute('SELECT COUNT(*) FROM teacher_workload').fetchone()[0]
+
+
+def create_teacher_workload(conn: sqlite3.Connection) -> None:
+    """جدول عبء المراقبين المجمع (إجمالي المراقبات وآخرها وعددها لكل يوم أسبوع)
+
+    تحدثه المشغلات على assignments (ومنها على distributions) فتقرأ لوحات الإحصاء
+    والتوزيع العادل صفاً لكل مراقب بدلاً من تجميع كل السجل.
+    """
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS teacher_workload (
+        teacher_id INTEGER PRIMARY KEY,
+        total_duties INTEGER NOT NULL DEFAULT 0,
+        last_duty_date DATE,
+        {columns}
+    )
+    '''.format(columns=',\n        '.join(f'{column} INTEGER NOT NULL DEFAULT 0' for column in WEEKDAY_COLUMNS)))
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_assignments_workload_insert AFTER INSERT ON assignments
+    BEGIN {_WORKLOAD_ADD} END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_assignments_workload_delete AFTER DELETE ON assignments
+    BEGIN {_WORKLOAD_REMOVE} END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_assignments_workload_update
+    AFTER UPDATE OF date_id, teacher_id ON assignments
+    BEGIN {_WORKLOAD_REMOVE} {_WORKLOAD_ADD} END
+    ''')
+    # تغيير تاريخ امتحان يغير آخر مراقبة ويوم الأسبوع لمن يراقب فيه
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_exam_dates_workload_update AFTER UPDATE OF date ON exam_dates
+    BEGIN {recompute}; END
+    '''.format(recompute=_WORKLOAD_RECOMPUTE.format(
+        where='WHERE a.teacher_id IN (SELECT teacher_id FROM assignments WHERE date_id = NEW.id)')))
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_teachers_workload_delete AFTER DELETE ON teachers
+    BEGIN
+        DELETE FROM teacher_workload WHERE teacher_id = OLD.id;
+    END
+    ''')
+    rebuild_teacher_workload(conn)
+
+
+# الترحيلات بالترتيب: (رقم الإصدار، الوصف، الدالة). لا تُعدل ترحيلة منشورة بل تُضاف واحدة جديدة
+def _maintenance_runs(conn: sqlite3.Connection) -> None:
+    """سجل تشغيلات الصيانة مع الأحجام قبل كل تشغيل وبعده (انظر maintenance.py)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started_at TIMESTAMP NOT NULL,
+            duration REAL NOT NULL,
+            tasks TEXT NOT NULL,
+            db_size_before INTEGER NOT NULL,
+            db_size_after INTEGER NOT NULL,
+            wal_size_before INTEGER NOT NULL,
+            wal_size_after INTEGER NOT NULL,
+            freelist_before INTEGER NOT NULL,
+            freelist_after INTEGER NOT NULL,
+            error TEXT
+        )
+    """)
+
+
+# فهارس المسارات الساخنة؛ test_query_plans.py يتحقق من أن كل استعلام يستخدمها
+HOT_PATH_INDEXES = (
+    # حذف مراقب يفحص المفاتيح الخارجية في عمودي المراقبين
+    ('idx_distributions_teacher1', 'distributions(teacher1_id)'),
+    ('idx_distributions_teacher2', 'distributions(teacher2_id)'),
+    # استعلامات التوفر: الإجازات المعتمدة التي تغطي تاريخاً معيناً
+    ('idx_leaves_status_dates', 'leaves(status, start_date, end_date)'),
+    ('idx_leaves_approved_by', 'leaves(approved_by)'),
+    # get_user_tickets: شرط OR على عمودين يُنفذ بفهرسين
+    ('idx_tickets_created_by', 'tickets(created_by, created_at)'),
+    ('idx_tickets_assigned_to', 'tickets(assigned_to, created_at)'),
+    ('idx_ticket_comments_ticket', 'ticket_comments(ticket_id, created_at)'),
+    ('idx_ticket_attachments_ticket', 'ticket_attachments(ticket_id, uploaded_at)'),
+    ('idx_logs_user', 'logs(user_id, created_at)'),
+    # تسجيل الدخول يقارن LOWER(username)
+    ('idx_users_username_lower', 'users(LOWER(username))'),
+)
+
+
+def _hot_path_indexes(conn: sqlite3.Connection) -> None:
+    # جداول إجازات ما قبل الترحيلات لا تحتوي عمودي الاعتماد الذين يستخدمهما leaves.py
+    _add_column(conn, 'leaves', 'approved_by', 'INTEGER REFERENCES users (id)')
+    _add_column(conn, 'leaves', 'rejection_reason', 'TEXT')
+    for name, target in HOT_PATH_INDEXES:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+    # إحصاءات الفهارس الجديدة حتى يختارها المخطط دون انتظار الصيانة
+    conn.execute('ANALYZE')
+
+
+# الجداول التي تُحرر من أكثر من مستخدم؛ عمود version يسمح بالحفظ الشرطي (compare-and-swap)
+VERSIONED_TABLES = ('distributions', 'teachers', 'rooms', 'leaves')
+
+
+def _row_versions(conn: sqlite3.Connection) -> None:
+    for table in VERSIONED_TABLES:
+        _add_column(conn, table, 'version', 'INTEGER NOT NULL DEFAULT 1')
+        # أي تحديث لا يرفع الإصدار بنفسه (المحرك، الاستيراد، الكتابة المباشرة) يرفعه المشغل،
+        # فيفشل الحفظ الشرطي لمن قرأ الصف قبله
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_version AFTER UPDATE ON {table}
+        WHEN NEW.version = OLD.version
+        BEGIN
+            UPDATE {table} SET version = OLD.version + 1 WHERE id = NEW.id;
+        END
+        ''')
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, 'الجداول الأساسية والصلاحيات الافتراضية', _base_schema),
+    (2, 'أعمدة الغرف والإجازات والمستخدمين', _legacy_columns),
+    (3, 'فهارس البحث الأساسية', _base_indexes),
+    (4, 'جداول التذاكر', _tickets),
+    (5, 'مفاتيح فريدة للتواريخ والتوزيعات', _unique_keys),
+    (6, 'جدول مقاعد المراقبة assignments', create_assignments),
+    (7, 'جدول عبء المراقبين teacher_workload', create_teacher_workload),
+    (8, 'سجل تشغيلات الصيانة', _maintenance_runs),
+    (9, 'فهارس المسارات الساخنة', _hot_path_indexes),
+    (10, 'إصدارات الصفوف للتحرير المتزامن', _row_versions),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """تطبيق الترحيلات الناقصة مرة واحدة وإرجاع أرقام ما طُبق منها
+
+    عند التشغيل الدافئ (user_version = آخر إصدار) تكلف قراءة PRAGMA واحدة فقط. كل
+    ترحيلة تُطبق في معاملة BEGIN IMMEDIATE مع رفع user_version داخلها، ويُعاد فحص
+    الإصدار بعد أخذ القفل حتى لا تطبق عمليتان الترحيلة نفسها.
+    """
+    applied = []
+    if schema_version(conn) >= LATEST_VERSION:
+        return applied
+    if conn.in_transaction:
+        conn.commit()
+    for version, _, step in MIGRATIONS:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
@@ -0,0 +1,100 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _freeze(value):
+    """تحويل المعاملات إلى قيم قابلة للتجزئة (القوائم تصبح tuples)"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, set):
+        return tuple(sorted(_freeze(v) for v in value))
+    return value
+
+
+class QueryCache:
+    """ذاكرة مؤقتة لنتائج الاستعلامات مع إبطال دقيق حسب الجداول
+
+    كل جدول له عداد إصدار يرفعه bump() بعد أي كتابة عليه. النتيجة المخزنة تحمل
+    إصدارات الجداول التي قرأتها وقت تحميلها، فإن تغير أحدها تُعتبر قديمة وتُعاد قراءتها.
+    الكتابات التي لا تمر بهذه العملية (اتصال آخر أو عميل آخر على الملف) لا تُعرف جداولها،
+    فيبطل invalidate_all() كل النتائج دفعة واحدة.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[Tuple, Tuple[Tuple[int, ...], Any]]' = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        # يُرفع مع كل إبطال شامل فيدخل في لقطة كل نتيجة
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(sql: str, params=()) -> Tuple:
+        """مفتاح الاستعلام: نص SQL موحد المسافات مع المعاملات"""
+        return _WHITESPACE.sub(' ', sql).strip(), _freeze(params or ())
+
+    def _snapshot(self, tables: Tuple[str, ...]) -> Tuple[int, ...]:
+        return (self._epoch,) + tuple(self._versions.get(table, 0) for table in tables)
+
+    def bump(self, *tables: str) -> None:
+        """رفع إصدار الجداول بعد الكتابة عليها"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def get_or_load(self, sql: str, params, tables: Iterable[str], loader: Callable[[], Any]) -> Any:
+        """إرجاع النتيجة المخزنة إن كانت جداولها لم تتغير، وإلا تنفيذ loader وتخزين ناتجه"""
+        tables = tuple(tables)
+        key = self.key(sql, params)
+        with self._lock:
+            snapshot = self._snapshot(tables)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == snapshot:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.invalidations += 1
+            self.misses += 1
+
+        # التحميل خارج القفل؛ اللقطة أُخذت قبله فأي كتابة أثناءه تُبطل النتيجة لاحقاً
+        value = loader()
+        with self._lock:
+            self._entries[key] = (snapshot, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate_all(self) -> None:
+        """إبطال كل النتائج، ومنها ما يُحمل الآن، بعد كتابة خارجية مجهولة الجداول"""
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+            }
@@ -0,0 +1,137 @@
+import bisect
+import logging
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+# حدود فئات مدرج زمن التنفيذ بالمللي ثانية (الفئة الأخيرة لكل ما يزيد عن آخر حد)
+BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+# الجمل التي يمكن عرض خطة تنفيذها في سجل الاستعلامات البطيئة
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def normalize(sql: str) -> str:
+    """شكل موحد للجملة: مسافات مضغوطة والقيم الحرفية وقوائم IN مستبدلة بـ ?"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(?)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryStats:
+    """عدادات زمن التنفيذ لكل جملة موحدة مع سجل للاستعلامات البطيئة
+
+    الزمن المقاس هو زمن execute() نفسه (للاستعلامات يشمل إيجاد الصف الأول). كل جملة
+    تتجاوز slow_threshold ثانية تُكتب في سجل slow_queries مع EXPLAIN QUERY PLAN.
+    عند enabled = False لا يُقاس شيء، والاتصالات المنشأة دون QueryStats لا تمر بهذه
+    الطبقة أصلاً.
+    """
+
+    def __init__(self, slow_threshold: float = 0.1, enabled: bool = True,
+                 logger: Optional[logging.Logger] = None):
+        self.slow_threshold = slow_threshold
+        self.enabled = enabled
+        self.logger = logger or logging.getLogger('slow_queries')
+        self._stats: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, conn: sqlite3.Connection, sql: str, params, seconds: float) -> None:
+        key = normalize(sql)
+        bucket = bisect.bisect_left(BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {'count': 0, 'total': 0.0, 'max': 0.0, 'slow': 0,
+                                            'histogram': [0] * (len(BUCKETS_MS) + 1)}
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['histogram'][bucket] += 1
+            slow = seconds >= self.slow_threshold
+            if slow:
+                entry['slow'] += 1
+        if slow:
+            self.logger.warning(f'استعلام بطيء ({seconds * 1000:.1f} مللي ثانية): {key}\n'
+                                f'{self.explain(conn, sql, params)}')
+
+    @staticmethod
+    def explain(conn: sqlite3.Connection, sql: str, params) -> str:
+        """خطة التنفيذ نصاً (عبر execute الأصلي حتى لا تُقاس هي نفسها)"""
+        if params is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return ''
+        try:
+            rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        except sqlite3.Error as e:
+            return f'تعذر عرض الخطة: {e}'
+        return '\n'.join(f'  {row[3]}' for row in rows)
+
+    def report(self, limit: Optional[int] = None) -> List[Dict]:
+        """الجمل مرتبة حسب الزمن الكلي تنازلياً"""
+        with self._lock:
+            items = [(key, dict(entry, histogram=list(entry['histogram'])))
+                     for key, entry in self._stats.items()]
+        rows = []
+        for key, entry in sorted(items, key=lambda item: item[1]['total'], reverse=True)[:limit]:
+            rows.append({
+                'query': key,
+                'count': entry['count'],
+                'total_ms': round(entry['total'] * 1000, 3),
+                'avg_ms': round(entry['total'] * 1000 / entry['count'], 3),
+                'max_ms': round(entry['max'] * 1000, 3),
+                'slow': entry['slow'],
+                'histogram': dict(zip([f'<={bound}ms' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}ms'],
+                                      entry['histogram'])),
+            })
+        return rows
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        stats = self.connection.stats
+        if not stats.enabled:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            stats.record(self.connection, sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        stats = self.connection.stats
+        if not stats.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            # معاملات executemany قائمة صفوف، فلا تُعرض خطتها
+            stats.record(self.connection, sql, None, time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """اتصال تُقاس كل جمله؛ يُمرر إلى sqlite3.connect(factory=...) ثم تُسند له stats"""
+
+    stats: QueryStats
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -11,7 +11,8 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_ALIGN_VERTICAL, WD_TABLE_ALIGNMENT
 from docx.oxml import parse_xml
 from docx.oxml.ns import nsdecls
-from database import Database
+from database import get_database_service
+from archive import attached_archives
 from datetime import datetime
 import os
 import smtplib
@@ -20,8 +21,9 @@ from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 
 class ReportGenerator:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db=None):
+        # استخدام قاعدة البيانات الممررة أو المشتركة بدلاً من فتح اتصال جديد
+        self.db = db or get_database_service().start()
         self.setup_fonts()
         self.smtp_settings = None
         self.verify_smtp_settings()
@@ -393,7 +395,11 @@ class ReportGenerator:
             return False
     
     def get_distribution_data(self, date_filter=None):
-        cursor = self.db.conn.cursor()
+        # لقطة قراءة فقط مستقلة عن اتصال الكتابة الذي تستخدمه الواجهة
+        with self.db.snapshot() as conn:
+            return self._distribution_rows(conn.cursor(), date_filter)
+    
+    def _distribution_rows(self, cursor, date_filter):
         query = '''
             SELECT ed.date, r.name, t1.name, t2.name
             FROM distributions d
@@ -411,22 +417,46 @@ class ReportGenerator:
         
         return cursor.fetchall()
     
+    def get_distribution_history(self, years=None):
+        """التوزيعات عبر الأعوام: العام الحالي مع ملفات الأرشيف المرفقة عند الطلب
+        
+        Args:
+            years: أعوام الأرشيف المطلوبة (None = كل الملفات الموجودة)
+        """
+        directory = os.path.dirname(os.path.abspath(self.db.pool.path))
+        with self.db.snapshot() as conn, attached_archives(conn, directory, years) as schemas:
+            # كل عام يربط الأسماء من نسخته من المراقبين والقاعات
+            query = ' UNION ALL '.join(f'''
+                SELECT ed.date, r.name, t1.name, t2.name
+                FROM {schema}.distributions d
+                JOIN {schema}.exam_dates ed ON d.date_id = ed.id
+                JOIN {schema}.rooms r ON d.room_id = r.id
+                LEFT JOIN {schema}.teachers t1 ON d.teacher1_id = t1.id
+                LEFT JOIN {schema}.teachers t2 ON d.teacher2_id = t2.id
+            ''' for schema in ['main'] + schemas)
+            return conn.execute(query + ' ORDER BY 1, 2').fetchall()
+    
     def get_statistics_data(self):
-        cursor = self.db.conn.cursor()
+        # الإحصائيات الثلاث من لقطة واحدة فتبقى أرقامها متسقة فيما بينها
+        with self.db.snapshot() as conn:
+            return self._statistics(conn.cursor())
+    
+    def _statistics(self, cursor):
         
-        # إحصائيات المراقبين
+        # إحصائيات المراقبين (جدول assignments يسمح بالبحث بالفهرس بدلاً من شرط OR)
         cursor.execute('''
             SELECT 
                 t.name,
-                COUNT(d.id) as supervision_count,
+                COUNT(a.distribution_id) as supervision_count,
                 GROUP_CONCAT(DISTINCT r.name) as rooms,
-                ROUND(AVG(CASE WHEN d.teacher1_id = t.id OR d.teacher2_id = t.id THEN 1 ELSE 0 END) * 100, 2) as supervision_rate,
+                ROUND(AVG(CASE WHEN a.teacher_id IS NOT NULL THEN 1 ELSE 0 END) * 100, 2) as supervision_rate,
                 COUNT(DISTINCT date(ed.date)) as unique_days,
                 GROUP_CONCAT(DISTINCT strftime('%A', ed.date)) as weekdays
             FROM teachers t
-            LEFT JOIN distributions d ON t.id = d.teacher1_id OR t.id = d.teacher2_id
+            LEFT JOIN assignments a ON a.teacher_id = t.id
+            LEFT JOIN distributions d ON d.id = a.distribution_id
             LEFT JOIN rooms r ON d.room_id = r.id
-            LEFT JOIN exam_dates ed ON d.date_id = ed.id
+            LEFT JOIN exam_dates ed ON a.date_id = ed.id
             GROUP BY t.id
             ORDER BY supervision_count DESC
         ''')
@@ -436,12 +466,13 @@ class ReportGenerator:
         cursor.execute('''
             SELECT 
                 r.name,
-                COUNT(d.id) as exam_count,
+                COUNT(DISTINCT d.id) as exam_count,
                 r.capacity,
                 GROUP_CONCAT(DISTINCT t.name) as supervisors
             FROM rooms r
             LEFT JOIN distributions d ON r.id = d.room_id
-            LEFT JOIN teachers t ON d.teacher1_id = t.id OR d.teacher2_id = t.id
+            LEFT JOIN assignments a ON a.distribution_id = d.id
+            LEFT JOIN teachers t ON t.id = a.teacher_id
             GROUP BY r.id
             ORDER BY exam_count DESC
         ''')
@@ -451,13 +482,13 @@ class ReportGenerator:
         cursor.execute('''
             SELECT 
                 strftime('%A', ed.date) as weekday,
-                COUNT(d.id) as exam_count,
+                COUNT(DISTINCT d.id) as exam_count,
                 COUNT(DISTINCT r.id) as room_count,
-                COUNT(DISTINCT t.id) as teacher_count
+                COUNT(DISTINCT a.teacher_id) as teacher_count
             FROM exam_dates ed
             LEFT JOIN distributions d ON ed.id = d.date_id
             LEFT JOIN rooms r ON d.room_id = r.id
-            LEFT JOIN teachers t ON d.teacher1_id = t.id OR d.teacher2_id = t.id
+            LEFT JOIN assignments a ON a.distribution_id = d.id
             GROUP BY weekday
             ORDER BY exam_count DESC
         ''')
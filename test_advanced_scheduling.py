@@ -0,0 +1,97 @@
+import unittest
+from advanced_scheduling import AdvancedScheduler
+
+
+class TestOptimalDistribution(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = AdvancedScheduler()
+        self.exams = [{'id': i, 'date': f'2025-01-{i + 1:02d}'} for i in range(6)]
+        self.rooms = [{'id': 1}, {'id': 2}]
+        self.teachers = [{'id': i, 'previous_supervisions': 0} for i in range(8)]
+
+    def _loads(self, distribution):
+        loads = self.scheduler.calculate_workload(self.teachers)
+        for entry in distribution:
+            for teacher_id in entry['supervisors']:
+                loads[teacher_id] += 1
+        return loads
+
+    def test_balances_accumulated_workload(self):
+        # مراقبان لديهما عبء سابق كبير يجب أن يحصلا على مراقبات أقل
+        self.teachers[0]['previous_supervisions'] = 3
+        self.teachers[1]['previous_supervisions'] = 3
+
+        distribution = self.scheduler.distribute_supervisors(
+            self.exams, self.teachers, self.rooms, mode='optimal')
+
+        loads = self._loads(distribution)
+        self.assertTrue(self.scheduler.last_solve_info['optimal'])
+        self.assertLessEqual(max(loads.values()) - min(loads.values()), 1)
+
+    def test_no_teacher_twice_on_same_date_and_leaves_respected(self):
+        self.teachers[3]['leaves'] = [{'date': '2025-01-02'}]
+
+        distribution = self.scheduler.distribute_supervisors(
+            self.exams, self.teachers, self.rooms, mode='optimal')
+
+        per_date = {}
+        for entry in distribution:
+            self.assertEqual(len(entry['supervisors']), 2)
+            for teacher_id in entry['supervisors']:
+                self.assertNotIn(teacher_id, per_date.setdefault(entry['date'], set()))
+                per_date[entry['date']].add(teacher_id)
+        self.assertNotIn(3, per_date['2025-01-02'])
+
+    def test_infeasible_date_raises(self):
+        with self.assertRaises(ValueError):
+            self.scheduler.distribute_supervisors(
+                self.exams, self.teachers[:3], self.rooms, mode='optimal')
+
+    def test_greedy_never_repeats_teacher_on_same_date(self):
+        # امتحانان في اليوم نفسه يجب ألا يتشاركا المراقبين
+        exams = [{'id': 1, 'date': '2025-01-01'}, {'id': 2, 'date': '2025-01-01'}]
+        self.teachers[0]['leaves'] = [{'date': '2025-01-01'}]
+
+        distribution = self.scheduler.distribute_supervisors(exams, self.teachers, self.rooms[:1])
+
+        supervisors = [t for entry in distribution for t in entry['supervisors']]
+        self.assertEqual(len(supervisors), 4)
+        self.assertEqual(len(set(supervisors)), 4)
+        self.assertNotIn(0, supervisors)
+
+
+class TestOptimizeSchedule(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = AdvancedScheduler()
+        self.teachers = [{'id': i} for i in range(6)]
+        self.teachers[2]['leaves'] = [{'date': '2025-01-01'}]
+        # جدول غير متوازن: المراقبان 0 و 1 في كل الأيام المتتالية
+        self.distribution = [
+            {'exam_id': d, 'room_id': 1, 'date': f'2025-01-0{d}', 'supervisors': [0, 1]} for d in range(1, 5)
+        ]
+
+    def test_anneal_balances_and_respects_hard_constraints(self):
+        reports = []
+        result = self.scheduler.optimize_schedule(
+            self.distribution, self.teachers, time_budget=None, max_iterations=4000, seed=3,
+            progress=lambda iteration, current, best: reports.append(best))
+
+        info = self.scheduler.last_solve_info
+        self.assertLess(info['objective'], info['initial_objective'])
+        self.assertEqual(info['objective'], self.scheduler._calculate_schedule_score(result, self.teachers))
+        self.assertEqual(reports, sorted(reports, reverse=True))
+
+        loads = {t['id']: 0 for t in self.teachers}
+        for entry in result:
+            self.assertEqual(len(set(entry['supervisors'])), 2)
+            if entry['date'] == '2025-01-01':
+                self.assertNotIn(2, entry['supervisors'])
+            for teacher_id in entry['supervisors']:
+                loads[teacher_id] += 1
+        self.assertLessEqual(max(loads.values()) - min(loads.values()), 1)
+        # الجدول الأصلي لا يتغير
+        self.assertEqual(self.distribution[0]['supervisors'], [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
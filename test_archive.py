@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+from archive import ArchiveError, academic_year, archive_academic_year, archived_years, attached_archives
+from connection_pool import ConnectionPool, snapshot
+from migrations import migrate
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'exam_system.db')
+        self.pool = ConnectionPool(self.path)
+        migrate(self.pool.writer)
+        with self.pool.write() as conn:
+            conn.execute("INSERT INTO users (id, username, password, role) VALUES (1, 'admin', 'hash', 'admin')")
+            conn.executemany('INSERT INTO teachers (id, name) VALUES (?, ?)', [(i, f'مراقب {i}') for i in (1, 2, 3)])
+            conn.execute("INSERT INTO rooms (id, name) VALUES (1, 'قاعة 1')")
+            # عامان دراسيان: 2023 (منته) و 2024 (الحالي)
+            conn.executemany('INSERT INTO exam_dates (id, date) VALUES (?, ?)',
+                             [(1, '2024-01-10'), (2, '2024-06-01'), (3, '2025-01-12')])
+            conn.executemany('INSERT INTO distributions (date_id, room_id, teacher1_id, teacher2_id) '
+                             'VALUES (?, 1, ?, ?)', [(1, 1, 2), (2, 2, 3), (3, 1, 3)])
+            conn.executemany("INSERT INTO leaves (teacher_id, start_date, end_date, reason, status, approved_by) "
+                             "VALUES (?, ?, ?, 'سبب', 'approved', 1)",
+                             [(1, '2024-03-01', '2024-03-02'), (2, '2024-08-30', '2024-09-03')])
+            conn.executemany('INSERT INTO logs (user_id, action, created_at) VALUES (1, ?, ?)',
+                             [('قديم', '2024-02-01 10:00:00'), ('حديث', '2024-10-01 10:00:00')])
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmpdir.cleanup()
+
+    def count(self, table):
+        with self.pool.read() as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def test_moves_closed_year_and_keeps_history_queryable(self):
+        counts = archive_academic_year(self.pool, 2023, today=date(2025, 2, 1))
+
+        self.assertEqual(counts, {'exam_dates': 2, 'distributions': 2, 'assignments': 4, 'leaves': 1, 'logs': 1})
+        self.assertEqual(archived_years(self.tmpdir.name), [2023])
+        # الإجازة الممتدة إلى العام التالي تبقى في الملف الرئيسي
+        self.assertEqual([self.count(t) for t in ('exam_dates', 'distributions', 'assignments', 'leaves', 'logs')],
+                         [1, 1, 2, 1, 1])
+        with self.pool.read() as conn:
+            self.assertEqual(conn.execute('SELECT teacher_id, total_duties FROM teacher_workload '
+                                          'WHERE total_duties > 0 ORDER BY teacher_id').fetchall(), [(1, 1), (3, 1)])
+
+        with snapshot(self.path) as conn, attached_archives(conn, self.tmpdir.name) as schemas:
+            self.assertEqual(schemas, ['archive_2023'])
+            self.assertEqual(conn.execute("SELECT password FROM archive_2023.users").fetchall(), [('',)])
+            rows = conn.execute('SELECT ed.date, t.name FROM archive_2023.assignments a '
+                                'JOIN archive_2023.exam_dates ed ON ed.id = a.date_id '
+                                'JOIN archive_2023.teachers t ON t.id = a.teacher_id '
+                                'WHERE a.seat = 1 ORDER BY ed.date').fetchall()
+            self.assertEqual(rows, [('2024-01-10', 'مراقب 1'), ('2024-06-01', 'مراقب 2')])
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute('DELETE FROM archive_2023.logs')
+
+        # إعادة التشغيل لا تجد ما تنقله ولا تكرر الصفوف
+        self.assertEqual(sum(archive_academic_year(self.pool, 2023, today=date(2025, 2, 1)).values()), 0)
+
+    def test_open_year_is_refused(self):
+        self.assertEqual(academic_year('2025-01-12'), 2024)
+        with self.assertRaises(ValueError):
+            archive_academic_year(self.pool, 2024, today=date(2025, 2, 1))
+        self.assertEqual(archived_years(self.tmpdir.name), [])
+
+    def test_mismatch_keeps_main_database(self):
+        # صف بالمعرف نفسه موجود مسبقاً في الأرشيف بمحتوى مختلف: INSERT OR IGNORE يتجاهله فيفشل التحقق
+        archive = sqlite3.connect(os.path.join(self.tmpdir.name, 'archive_2023.db'))
+        archive.execute('CREATE TABLE exam_dates (id INTEGER PRIMARY KEY, date DATE NOT NULL, created_at TIMESTAMP)')
+        archive.execute("INSERT INTO exam_dates (id, date) VALUES (1, '2030-01-01')")
+        archive.commit()
+        archive.close()
+
+        with self.assertRaises(ArchiveError):
+            archive_academic_year(self.pool, 2023, today=date(2025, 2, 1))
+        self.assertEqual(self.count('exam_dates'), 3)
+        self.assertEqual(self.count('distributions'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
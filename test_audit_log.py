@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from audit_log import AuditLogger
+from connection_pool import ConnectionPool
+from migrations import migrate
+
+
+class TestAuditLogger(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.tmpdir.name, 'audit.db'))
+        migrate(self.pool.writer)
+        with self.pool.write() as conn:
+            conn.executemany('INSERT INTO users (id, username, password, role) VALUES (?, ?, ?, ?)',
+                             [(1, 'admin', 'x', 'admin'), (2, 'staff', 'x', 'staff')])
+        self.audit = AuditLogger(self.pool, batch_size=50, flush_interval=60)
+        self.audit.start()
+
+    def tearDown(self):
+        self.audit.stop()
+        self.pool.close()
+        self.tmpdir.cleanup()
+
+    def count_logs(self):
+        with self.pool.read() as conn:
+            return conn.execute('SELECT COUNT(*) FROM logs').fetchone()[0]
+
+    def test_batches_are_written_and_stop_flushes(self):
+        for i in range(120):
+            self.assertTrue(self.audit.log(1 + i % 2, 'إجراء', str(i)))
+        self.assertFalse(self.audit.log(99, 'إجراء'))
+
+        self.audit.stop()
+        self.assertEqual(self.count_logs(), 120)
+        self.assertEqual(self.audit.written, 120)
+
+    def test_deleted_user_does_not_lose_the_batch(self):
+        self.audit.log(1, 'قبل الحذف')
+        self.audit.log(2, 'قبل الحذف')
+        with self.pool.write() as conn:
+            conn.execute('DELETE FROM users WHERE id = 2')
+        self.audit.forget_user(2)
+
+        self.audit.flush()
+        self.assertEqual(self.count_logs(), 1)
+        self.assertEqual(self.audit.dropped, 1)
+        self.assertFalse(self.audit.log(2, 'بعد الحذف'))
+
+
+if __name__ == '__main__':
+    unittest.main()
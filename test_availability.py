@@ -0,0 +1,49 @@
+import unittest
+import sqlite3
+from availability import AvailabilityMatrix
+from test_distribution_engine import create_school
+
+
+class TestAvailabilityMatrix(unittest.TestCase):
+    def setUp(self):
+        self.matrix = AvailabilityMatrix([1, 2, 3], ['2025-01-05', '2025-01-06', '2025-01-07'])
+
+    def test_overlapping_leaves_survive_single_removal(self):
+        self.matrix.add_leave(1, '2025-01-05', '2025-01-06')
+        self.matrix.add_leave(1, '2025-01-06', '2025-01-07')
+
+        self.matrix.remove_leave(1, '2025-01-05', '2025-01-06')
+
+        self.assertTrue(self.matrix.is_free(1, '2025-01-05'))
+        self.assertFalse(self.matrix.is_free(1, '2025-01-06'))
+        self.assertEqual(self.matrix.teachers_on_leave('2025-01-07'), [1])
+
+    def test_assign_and_release(self):
+        self.matrix.assign(2, '2025-01-06')
+        self.assertFalse(self.matrix.is_free(2, '2025-01-06'))
+        self.assertEqual(self.matrix.free_teachers('2025-01-06'), [1, 3])
+
+        self.matrix.release(2, '2025-01-06')
+        self.assertTrue(self.matrix.is_free(2, '2025-01-06'))
+
+    def test_from_db_loads_approved_leaves_and_assignments(self):
+        conn = sqlite3.connect(':memory:')
+        create_school(conn, teachers=4, rooms=1, days=2)
+        conn.execute("INSERT INTO leaves (teacher_id, start_date, end_date, reason, status) "
+                     "VALUES (1, '2025-01-05', '2025-01-05', 'مرض', 'موافق عليها')")
+        conn.execute("INSERT INTO leaves (teacher_id, start_date, end_date, reason) "
+                     "VALUES (2, '2025-01-05', '2025-01-06', 'مرض')")
+        conn.execute('UPDATE distributions SET teacher1_id = 3, teacher2_id = 4 WHERE date_id = 2')
+
+        matrix = AvailabilityMatrix.from_db(conn)
+
+        self.assertTrue(matrix.on_leave(1, '2025-01-05'))
+        # الإجازة غير المعتمدة لا تمنع المراقبة
+        self.assertFalse(matrix.on_leave(2, '2025-01-05'))
+        self.assertFalse(matrix.is_free(3, '2025-01-06'))
+        self.assertTrue(matrix.is_free(3, '2025-01-05'))
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
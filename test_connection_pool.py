@@ -0,0 +1,170 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from connection_pool import ConnectionPool, retry_on_busy
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.pool = ConnectionPool(os.path.join(self.directory, 'pool.db'))
+        with self.pool.write() as conn:
+            conn.execute('CREATE TABLE teachers (id INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+    def test_wal_and_thread_local_readers(self):
+        with self.pool.read() as conn:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+        readers = []
+        def read():
+            readers.append(self.pool.reader())
+        threads = [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(conn) for conn in readers}), 3)
+        self.assertIs(self.pool.reader(), self.pool.reader())
+
+    def test_write_rolls_back_on_error(self):
+        with self.assertRaises(sqlite3.IntegrityError):
+            with self.pool.write() as conn:
+                conn.execute("INSERT INTO teachers (name) VALUES ('أحمد')")
+                conn.execute("INSERT INTO teachers (name) VALUES ('أحمد')")
+
+        with self.pool.read() as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM teachers').fetchone()[0], 0)
+
+    def test_readers_not_blocked_by_open_write(self):
+        with self.pool.write() as conn:
+            conn.execute("INSERT INTO teachers (name) VALUES ('سالم')")
+
+        counts = []
+        with self.pool.write() as conn:
+            conn.execute("INSERT INTO teachers (name) VALUES ('خالد')")
+            # القارئ في خيط آخر يرى آخر نسخة محفوظة دون انتظار الكاتب
+            thread = threading.Thread(target=lambda: counts.append(
+                self.pool.reader().execute('SELECT COUNT(*) FROM teachers').fetchone()[0]))
+            thread.start()
+            thread.join(timeout=5)
+        self.assertEqual(counts, [1])
+
+    def test_write_joins_only_its_own_transaction(self):
+        with self.pool.write() as outer:
+            with self.pool.write() as inner:
+                self.assertIs(inner, outer)
+                inner.execute("INSERT INTO teachers (name) VALUES ('سالم')")
+
+        # معاملة فُتحت على الكاتب خارج write() لا يُنضم إليها
+        self.pool.writer.execute("INSERT INTO teachers (name) VALUES ('خالد')")
+        with self.assertRaises(sqlite3.ProgrammingError):
+            with self.pool.write():
+                pass
+        self.pool.writer.rollback()
+
+    def test_separate_connection_rollback_keeps_pool_writes(self):
+        # اتصال مستقل (مثل Database.conn) يلغي معاملته دون أن يمس ما حفظه write()
+        other = self.pool.connection()
+        try:
+            other.execute("INSERT INTO teachers (name) VALUES ('خالد')")
+            other.rollback()
+            with self.pool.write() as conn:
+                conn.execute("INSERT INTO teachers (name) VALUES ('سالم')")
+            other.execute("INSERT INTO teachers (name) VALUES ('أحمد')")
+            other.rollback()
+        finally:
+            other.close()
+        with self.pool.read() as conn:
+            self.assertEqual(conn.execute('SELECT name FROM teachers').fetchall(), [('سالم',)])
+
+    def test_snapshot_is_read_only_and_frozen(self):
+        with self.pool.write() as conn:
+            conn.execute("INSERT INTO teachers (name) VALUES ('سالم')")
+
+        with self.pool.snapshot() as snap:
+            with self.pool.write() as conn:
+                conn.execute("INSERT INTO teachers (name) VALUES ('خالد')")
+            # الكاتب لم ينتظر اللقطة، واللقطة لا ترى ما حُفظ بعد فتحها
+            self.assertEqual(snap.execute('SELECT COUNT(*) FROM teachers').fetchone()[0], 1)
+            with self.assertRaises(sqlite3.OperationalError):
+                snap.execute("INSERT INTO teachers (name) VALUES ('x')")
+
+        with self.pool.read() as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM teachers').fetchone()[0], 2)
+
+    def test_write_retries_while_another_client_holds_the_lock(self):
+        # عميل آخر على الملف المشترك يحتجز قفل الكتابة أطول من busy_timeout ثم يحرره
+        other = sqlite3.connect(self.pool.path, isolation_level=None, check_same_thread=False)
+        other.execute('BEGIN IMMEDIATE')
+        release = threading.Timer(0.5, other.commit)
+        release.start()
+        try:
+            start = time.monotonic()
+            with self.pool.write() as conn:
+                conn.execute("INSERT INTO teachers (name) VALUES ('سالم')")
+            self.assertGreaterEqual(time.monotonic() - start, 0.4)
+        finally:
+            release.join()
+            other.close()
+        with self.pool.read() as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM teachers').fetchone()[0], 1)
+        # الكاتب لا يُستخدم إلا عبر write() فيكفيه الانتظار القصير مع إعادة المحاولة
+        self.assertEqual(self.pool.writer.execute('PRAGMA busy_timeout').fetchone()[0], 250)
+
+    def test_retry_gives_up_and_ignores_other_errors(self):
+        other = sqlite3.connect(self.pool.path, isolation_level=None)
+        other.execute('BEGIN IMMEDIATE')
+        pool = ConnectionPool(self.pool.path, timeout=0.05, retries=2)
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                with pool.write():
+                    pass
+        finally:
+            pool.close()
+            other.rollback()
+            other.close()
+
+        calls = []
+        def fail():
+            calls.append(1)
+            raise sqlite3.OperationalError('no such table: x')
+        with self.assertRaises(sqlite3.OperationalError):
+            retry_on_busy(fail)
+        self.assertEqual(len(calls), 1)
+
+    def test_data_version_changes_only_for_other_connections(self):
+        version = self.pool.data_version()
+        with self.pool.write() as conn:
+            conn.execute("INSERT INTO teachers (name) VALUES ('سالم')")
+        self.assertEqual(self.pool.data_version(), version)
+
+        other = sqlite3.connect(self.pool.path)
+        other.execute("INSERT INTO teachers (name) VALUES ('خالد')")
+        other.commit()
+        other.close()
+        self.assertNotEqual(self.pool.data_version(), version)
+
+        # الكاتب مشغول بمعاملة في خيط آخر: لا انتظار ولا قيمة
+        with self.pool.write():
+            results = []
+            thread = threading.Thread(target=lambda: results.append(self.pool.data_version()))
+            thread.start()
+            thread.join(timeout=5)
+        self.assertEqual(results, [None])
+
+    def test_readers_are_query_only(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            with self.pool.read() as conn:
+                conn.execute("INSERT INTO teachers (name) VALUES ('x')")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,301 @@
+import multiprocessing
+import os
+import unittest
+import sqlite3
+import tempfile
+import threading
+from datetime import date, timedelta
+from distribution_engine import (DistributionCancelled, DistributionEngine, DistributionWorker, ChangeSet,
+                                 score_plan, _init_portfolio_worker, _solve_seeded)
+from migrations import migrate
+
+
+def create_school(conn, teachers=12, rooms=3, days=4):
+    """إنشاء مدرسة اختبارية صغيرة في قاعدة بيانات مؤقتة"""
+    # المخطط المرحل نفسه الذي يعمل عليه التطبيق (المشغلات و assignments و version)
+    migrate(conn)
+    cursor = conn.cursor()
+    for i in range(teachers):
+        cursor.execute('INSERT INTO teachers (name) VALUES (?)', (f'مراقب {i}',))
+    for i in range(rooms):
+        cursor.execute('INSERT INTO rooms (name) VALUES (?)', (str(i + 1),))
+    start = date(2025, 1, 5)
+    for d in range(days):
+        cursor.execute('INSERT INTO exam_dates (date) VALUES (?)', ((start + timedelta(days=d)).isoformat(),))
+        date_id = cursor.lastrowid
+        for room_id in range(1, rooms + 1):
+            cursor.execute('INSERT INTO distributions (date_id, room_id) VALUES (?, ?)', (date_id, room_id))
+    conn.commit()
+
+
+class TestDistributionEngine(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        create_school(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_every_room_gets_two_distinct_supervisors(self):
+        DistributionEngine(self.conn, seed=1).run()
+
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT date_id, teacher1_id, teacher2_id FROM distributions')
+        seen = {}
+        for date_id, teacher1, teacher2 in cursor.fetchall():
+            self.assertIsNotNone(teacher1)
+            self.assertIsNotNone(teacher2)
+            # لا يراقب المعلم مرتين في اليوم نفسه
+            for teacher_id in (teacher1, teacher2):
+                self.assertNotIn(teacher_id, seen.setdefault(date_id, set()))
+                seen[date_id].add(teacher_id)
+
+    def test_workload_is_balanced(self):
+        plan = DistributionEngine(self.conn, seed=7).run()
+
+        counts = {}
+        for seats in plan.seats.values():
+            for teacher_id in seats:
+                counts[teacher_id] = counts.get(teacher_id, 0) + 1
+        # 4 أيام × 3 قاعات × 2 = 24 مراقبة على 12 مراقباً، ونافذة السماح +1 تسمح بفارق 2 كحد أقصى
+        self.assertEqual(len(counts), 12)
+        self.assertLessEqual(max(counts.values()) - min(counts.values()), 2)
+
+    def test_approved_leave_is_respected(self):
+        self.conn.execute("INSERT INTO leaves (teacher_id, start_date, end_date, reason, status) "
+                          "VALUES (1, '2025-01-05', '2025-01-06', 'مرض', 'approved')")
+        plan = DistributionEngine(self.conn, seed=3).run()
+
+        for distribution_id, seats in plan.seats.items():
+            if plan.date_of[distribution_id] in (1, 2):
+                self.assertNotIn(1, seats)
+
+    def test_insufficient_teachers_leaves_table_untouched(self):
+        self.conn.execute('UPDATE distributions SET teacher1_id = 1, teacher2_id = 2 WHERE room_id = 1')
+        self.conn.execute('DELETE FROM teachers WHERE id > 5')
+        self.conn.commit()
+
+        with self.assertRaises(ValueError):
+            DistributionEngine(self.conn, seed=1).run()
+
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM distributions WHERE teacher1_id IS NOT NULL')
+        self.assertEqual(cursor.fetchone()[0], 4)
+
+    def test_preflight_reports_every_infeasible_date(self):
+        # 12 مراقباً و 6 مقاعد يومياً: إجازة 7 مراقبين تجعل اليومين الأولين غير ممكنين
+        for teacher_id in range(1, 8):
+            self.conn.execute("INSERT INTO leaves (teacher_id, start_date, end_date, reason, status) "
+                              "VALUES (?, '2025-01-05', '2025-01-06', 'مرض', 'approved')", (teacher_id,))
+        self.conn.commit()
+
+        infeasible = DistributionEngine(self.conn).preflight()
+
+        self.assertEqual([(item['date'], item['shortfall']) for item in infeasible],
+                         [('2025-01-05', 1), ('2025-01-06', 1)])
+        with self.assertRaises(ValueError) as error:
+            DistributionEngine(self.conn, seed=1).run()
+        self.assertIn('2025-01-06', str(error.exception))
+
+    def test_required_supervisors_per_room(self):
+        self.conn.execute('UPDATE rooms SET required_supervisors = 1 WHERE id = 1')
+        self.conn.commit()
+
+        DistributionEngine(self.conn, seed=6).run()
+
+        for date_id, teacher1, teacher2 in self._rows().values():
+            self.assertIsNotNone(teacher1)
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT room_id, teacher2_id IS NULL FROM distributions')
+        for room_id, empty in cursor.fetchall():
+            self.assertEqual(bool(empty), room_id == 1)
+
+    def test_single_supervisor_room_with_one_free_teacher(self):
+        conn = sqlite3.connect(':memory:')
+        create_school(conn, teachers=2, rooms=1, days=1)
+        conn.execute('UPDATE rooms SET required_supervisors = 1')
+        conn.execute("INSERT INTO leaves (teacher_id, start_date, end_date, reason, status) "
+                     "VALUES (2, '2025-01-05', '2025-01-05', 'مرض', 'approved')")
+        conn.commit()
+
+        # مقعد واحد ومراقب متاح واحد: ممكن دون حد أدنى ثابت من مراقبَين
+        self.assertEqual(DistributionEngine(conn).preflight(), [])
+        DistributionEngine(conn, seed=1).run()
+        self.assertEqual(conn.execute('SELECT teacher1_id, teacher2_id FROM distributions').fetchall(),
+                         [(1, None)])
+        conn.close()
+
+    def test_room_with_three_supervisors(self):
+        self.conn.execute('UPDATE rooms SET required_supervisors = 3 WHERE id = 1')
+        self.conn.commit()
+
+        plan = DistributionEngine(self.conn, seed=8).run()
+
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT d.room_id, COUNT(*) FROM assignments a JOIN distributions d ON d.id = a.distribution_id
+            GROUP BY a.distribution_id
+        ''')
+        for room_id, seats in cursor.fetchall():
+            self.assertEqual(seats, 3 if room_id == 1 else 2)
+        # إعادة التطبيق لا تكتب شيئاً لأن المقعد الثالث محفوظ في assignments
+        self.assertEqual(DistributionEngine(self.conn).apply(plan), 0)
+
+    def test_double_booking_is_rejected_by_the_database(self):
+        self.conn.execute('UPDATE distributions SET teacher1_id = 1 WHERE id = 1')
+        with self.assertRaises(sqlite3.IntegrityError):
+            # القاعة الثانية في اليوم نفسه
+            self.conn.execute('UPDATE distributions SET teacher2_id = 1 WHERE id = 2')
+
+    def test_same_seed_gives_same_plan(self):
+        engine = DistributionEngine(self.conn, seed=11)
+        problem = engine.load()
+        first = engine.solve(problem)
+        second = DistributionEngine(self.conn, seed=11).solve(problem)
+        self.assertEqual(first.seats, second.seats)
+
+    def test_commit_writes_only_changed_rows(self):
+        engine = DistributionEngine(self.conn, seed=4)
+        plan = engine.run()
+        self.assertEqual(engine.apply(plan), 0)
+
+        self.conn.execute('UPDATE distributions SET teacher1_id = NULL WHERE id = 3')
+        self.conn.commit()
+        self.assertEqual(engine.apply(plan), 1)
+        self.assertEqual(self._rows()[3][1:], tuple(plan.seats[3]))
+
+    def _rows(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT id, date_id, teacher1_id, teacher2_id FROM distributions ORDER BY id')
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+    def test_redistribute_replaces_only_teacher_on_new_leave(self):
+        DistributionEngine(self.conn, seed=5).run()
+        before = self._rows()
+        teacher_id = before[1][1]
+        self.conn.execute("INSERT INTO leaves (teacher_id, start_date, end_date, reason, status) "
+                          "VALUES (?, '2025-01-05', '2025-01-05', 'مرض', 'approved')", (teacher_id,))
+
+        changed = DistributionEngine(self.conn, seed=5).redistribute(
+            ChangeSet().add_leave(teacher_id, '2025-01-05', '2025-01-05'))
+
+        after = self._rows()
+        self.assertEqual(list(changed), [1])
+        self.assertNotIn(teacher_id, after[1][1:])
+        # بقية المقاعد لم تتغير
+        self.assertEqual({k: v for k, v in before.items() if k != 1}, {k: v for k, v in after.items() if k != 1})
+
+    def test_redistribute_fills_added_room_and_deleted_teacher(self):
+        DistributionEngine(self.conn, seed=9).run()
+        self.conn.execute("INSERT INTO rooms (name) VALUES ('مختبر')")
+        removed = self._rows()[2][1]
+
+        changes = ChangeSet().add_room(1, 4).delete_teacher(removed)
+        DistributionEngine(self.conn, seed=9).redistribute(changes)
+
+        after = self._rows()
+        for date_id, teacher1, teacher2 in after.values():
+            self.assertNotIn(removed, (teacher1, teacher2))
+            self.assertIsNotNone(teacher1)
+            self.assertIsNotNone(teacher2)
+        day_one = [t for date_id, t1, t2 in after.values() if date_id == 1 for t in (t1, t2)]
+        self.assertEqual(len(day_one), 8)
+        self.assertEqual(len(set(day_one)), 8)
+
+    def test_portfolio_commits_fairest_plan(self):
+        engine = DistributionEngine(self.conn, seed=2)
+        problem = engine.load()
+
+        plan, metrics = engine.solve_portfolio(problem, runs=4, workers=2, deadline=30)
+
+        self.assertEqual(engine.last_portfolio['runs'], 4)
+        self.assertEqual(metrics, score_plan(problem, plan))
+        # الخطة المختارة يمكن إعادة إنتاجها من بذرتها
+        single = DistributionEngine(None, seed=engine.last_portfolio['seed']).solve(problem)
+        self.assertEqual(score_plan(problem, single), metrics)
+
+    def test_portfolio_stops_losing_runs_at_the_deadline(self):
+        engine = DistributionEngine(self.conn, seed=2)
+        problem = engine.load()
+
+        engine.solve_portfolio(problem, runs=16, workers=2, deadline=0)
+
+        # المهلة انتهت عند أول خطة ولم تبق أي عملية تعمل بعد الإرجاع
+        self.assertGreaterEqual(engine.last_portfolio['completed'], 1)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+        # التشغيل الجاري داخل العملية يتوقف عند ضبط حدث الإيقاف
+        stop = multiprocessing.Event()
+        stop.set()
+        _init_portfolio_worker(stop)
+        try:
+            with self.assertRaises(DistributionCancelled):
+                _solve_seeded(problem, 1)
+        finally:
+            _init_portfolio_worker(None)
+
+
+
+class TestDistributionWorker(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        conn = sqlite3.connect(self.path)
+        create_school(conn)
+        conn.close()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _events(self, worker):
+        worker.join(timeout=30)
+        events = []
+        while not worker.events.empty():
+            events.append(worker.events.get_nowait())
+        return events
+
+    def _assigned(self):
+        conn = sqlite3.connect(self.path)
+        count = conn.execute('SELECT COUNT(teacher1_id) FROM distributions').fetchone()[0]
+        conn.close()
+        return count
+
+    def test_reports_progress_per_date_then_done(self):
+        worker = DistributionWorker(self.path, seed=1)
+        worker.start()
+        events = self._events(worker)
+
+        progress = [payload for kind, payload in events if kind == 'progress']
+        self.assertEqual([done for done, _, _ in progress], [1, 2, 3, 4])
+        self.assertEqual(events[-1], ('done', None))
+        self.assertEqual(self._assigned(), 12)
+
+    def test_cancel_leaves_table_untouched(self):
+        worker = DistributionWorker(self.path, seed=1)
+        worker.cancel()
+        worker.start()
+        events = self._events(worker)
+
+        self.assertEqual(events[-1], ('cancelled', None))
+        self.assertEqual(self._assigned(), 0)
+
+    def test_save_retries_while_another_client_holds_the_lock(self):
+        # عميل آخر يحتجز قفل الكتابة أطول من انتظار الجملة الواحدة ثم يحرره
+        other = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        other.execute('BEGIN IMMEDIATE')
+        release = threading.Timer(0.5, other.commit)
+        release.start()
+        try:
+            worker = DistributionWorker(self.path, seed=1)
+            worker.start()
+            events = self._events(worker)
+        finally:
+            release.join()
+            other.close()
+
+        self.assertEqual(events[-1], ('done', None))
+        self.assertEqual(self._assigned(), 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
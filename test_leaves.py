@@ -1,5 +1,5 @@
 import unittest
-from leaves import LeaveManager
+from leaves import LeaveManager, LeaveReseatError
 from database import Database
 from datetime import datetime, timedelta
 import sqlite3
@@ -12,9 +12,8 @@ class TestLeaveManager(unittest.TestCase):
         if os.path.exists(self.test_db_path):
             os.remove(self.test_db_path)
             
-        self.db = Database()
-        self.db.conn = sqlite3.connect(self.test_db_path)
-        self.db.create_tables()
+        # Database يطبق الترحيلات ويكتب عبر مجمع الاتصالات على قاعدة الاختبار نفسها
+        self.db = Database(self.test_db_path, start_backups=False)
         
         self.leave_manager = LeaveManager(self.db)
         self.test_user_id = 1
@@ -27,9 +26,10 @@ class TestLeaveManager(unittest.TestCase):
         self.db.conn.commit()
     
     def tearDown(self):
-        self.db.conn.close()
-        if os.path.exists(self.test_db_path):
-            os.remove(self.test_db_path)
+        self.db.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.test_db_path + suffix):
+                os.remove(self.test_db_path + suffix)
     
     def test_request_leave(self):
         # اختبار طلب إجازة
@@ -72,6 +72,25 @@ class TestLeaveManager(unittest.TestCase):
         self.assertEqual(leave['status'], 'موافق عليها')
         self.assertEqual(leave['approved_by'], self.test_user_id)
     
+    def test_approve_leave_without_substitute_raises(self):
+        # المراقب الوحيد مكلف بقاعة في أول أيام الإجازة ولا يوجد بديل
+        start_date = datetime.now().date()
+        cursor = self.db.conn.cursor()
+        cursor.execute('INSERT INTO exam_dates (date) VALUES (?)', (start_date.isoformat(),))
+        date_id = cursor.lastrowid
+        cursor.execute("INSERT INTO rooms (name) VALUES ('قاعة اختبار')")
+        cursor.execute('INSERT INTO distributions (date_id, room_id, teacher1_id) VALUES (?, ?, ?)',
+                       (date_id, cursor.lastrowid, self.test_teacher_id))
+        self.db.conn.commit()
+        leave_id = self.leave_manager.request_leave(
+            self.test_teacher_id, 'annual', start_date, start_date + timedelta(days=1), 'إجازة عادية')
+        
+        with self.assertRaises(LeaveReseatError):
+            self.leave_manager.approve_leave(leave_id, self.test_user_id)
+        
+        # الموافقة محفوظة رغم تعذر الاستبدال
+        self.assertEqual(self.leave_manager.get_leave(leave_id)['status'], 'موافق عليها')
+    
     def test_reject_leave(self):
         # إنشاء طلب إجازة
         start_date = datetime.now().date()
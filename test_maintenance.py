@@ -0,0 +1,72 @@
+import os
+import tempfile
+import time
+import unittest
+from connection_pool import ConnectionPool
+from maintenance import MaintenanceScheduler
+from migrations import migrate
+
+
+class TestMaintenanceScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.tmpdir.name, 'maintenance.db'))
+        migrate(self.pool.writer)
+        with self.pool.write() as conn:
+            conn.executemany('INSERT INTO teachers (name, specialization) VALUES (?, ?)',
+                             [(f'مراقب {i}', 'x' * 500) for i in range(2000)])
+            conn.execute('DELETE FROM teachers')
+        self.scheduler = MaintenanceScheduler(self.pool, idle_seconds=0)
+
+    def tearDown(self):
+        self.scheduler.stop()
+        self.pool.close()
+        self.tmpdir.cleanup()
+
+    def test_run_reclaims_pages_truncates_wal_and_is_recorded(self):
+        first = self.scheduler.run()
+        self.assertIn('analyze', first['tasks'])
+        self.assertGreater(first['before']['freelist'], 0)
+        self.assertEqual(first['after']['freelist'], 0)
+        self.assertLess(first['after']['db_size'], first['before']['db_size'])
+        self.assertEqual(first['after']['wal_size'], 0)
+        self.assertIsNone(first['error'])
+
+        # التشغيل الثاني يستخدم incremental_vacuum ولا يعيد ANALYZE قبل موعده
+        second = self.scheduler.run()
+        self.assertIn('incremental_vacuum', second['tasks'])
+        self.assertNotIn('analyze', second['tasks'])
+
+        with self.pool.read() as conn:
+            rows = conn.execute('SELECT tasks, freelist_before, freelist_after FROM maintenance_runs '
+                                'ORDER BY id').fetchall()
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][1:], (first['before']['freelist'], 0))
+
+    def test_waits_for_idle_window(self):
+        self.scheduler.idle_seconds = 3600
+        with self.pool.write() as conn:
+            conn.execute("INSERT INTO teachers (name) VALUES ('سالم')")
+        self.assertTrue(self.scheduler.is_due())
+        self.assertFalse(self.scheduler.is_idle())
+
+
+    def test_worker_survives_failed_run_and_retries(self):
+        self.scheduler.check_interval = 0.01
+        # معاملة متروكة على الكاتب تجعل exclusive() يرفع ProgrammingError
+        self.pool.writer.execute("INSERT INTO teachers (name) VALUES ('سالم')")
+        with self.assertLogs('database', 'ERROR'):
+            self.scheduler.start()
+            time.sleep(0.2)
+        self.assertTrue(self.scheduler.thread.is_alive())
+        self.assertIsNone(self.scheduler.last_run)
+
+        self.pool.writer.rollback()
+        deadline = time.monotonic() + 10
+        while self.scheduler.last_run is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertIsNotNone(self.scheduler.last_run)
+
+
+if __name__ == '__main__':
+    unittest.main()
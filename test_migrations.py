@@ -0,0 +1,112 @@
+import unittest
+import sqlite3
+from migrations import LATEST_VERSION, MIGRATIONS, migrate, rebuild_teacher_workload, schema_version
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_cold_start_applies_all_then_warm_start_is_noop(self):
+        self.assertEqual(migrate(self.conn), [version for version in range(1, LATEST_VERSION + 1)])
+        self.assertEqual(schema_version(self.conn), LATEST_VERSION)
+
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        self.assertEqual(migrate(self.conn), [])
+        # التشغيل الدافئ لا ينفذ إلا قراءة user_version
+        self.assertEqual(statements, ['PRAGMA user_version'])
+
+    def test_legacy_database_keeps_data_and_gains_columns(self):
+        # قاعدة أنشئت قبل الترحيلات: جدول إجازات قديم بلا leave_type وغرف بلا required_supervisors
+        self.conn.execute('CREATE TABLE rooms (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, '
+                          'capacity INTEGER DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+        self.conn.execute('CREATE TABLE leaves (id INTEGER PRIMARY KEY AUTOINCREMENT, teacher_id INTEGER NOT NULL, '
+                          'start_date DATE NOT NULL, end_date DATE NOT NULL, reason TEXT NOT NULL, '
+                          "status TEXT DEFAULT 'قيد المراجعة')")
+        self.conn.execute("INSERT INTO rooms (name) VALUES ('قاعة 1')")
+        self.conn.execute("INSERT INTO leaves (teacher_id, start_date, end_date, reason) "
+                          "VALUES (1, '2025-01-05', '2025-01-06', 'سبب')")
+        self.conn.commit()
+
+        migrate(self.conn)
+
+        self.assertEqual(self.conn.execute('SELECT name, required_supervisors FROM rooms').fetchall(),
+                         [('قاعة 1', 2)])
+        self.assertEqual(self.conn.execute('SELECT reason, leave_type FROM leaves').fetchall(),
+                         [('سبب', 'other')])
+
+
+    def test_duplicate_dates_are_merged_before_unique_index(self):
+        # قاعدة على الإصدار 4 فيها تاريخ مكرر
+        for version, _, step in MIGRATIONS[:4]:
+            step(self.conn)
+        self.conn.execute('PRAGMA user_version = 4')
+        self.conn.executemany('INSERT INTO exam_dates (id, date) VALUES (?, ?)',
+                              [(1, '2025-01-05'), (2, '2025-01-05'), (3, '2025-01-06')])
+        self.conn.execute("INSERT INTO rooms (id, name) VALUES (1, 'قاعة 1')")
+        # التوزيعان 1 و 2 يصبحان مكررين بعد دمج التاريخين 1 و 2
+        self.conn.executemany('INSERT INTO distributions (id, date_id, room_id, teacher1_id) VALUES (?, ?, 1, ?)',
+                              [(1, 1, 7), (2, 2, 8), (3, 3, 9)])
+        self.conn.commit()
+
+        with self.assertLogs('database', 'WARNING') as logs:
+            self.assertIn(5, migrate(self.conn))
+        self.assertIn('دمج 1 تاريخاً مكرراً وحذف 1 توزيعاً مكرراً', logs.output[0])
+
+        self.assertEqual(self.conn.execute('SELECT id FROM exam_dates ORDER BY id').fetchall(), [(1,), (3,)])
+        self.assertEqual(self.conn.execute('SELECT date_id FROM distributions ORDER BY date_id').fetchall(),
+                         [(1,), (3,)])
+        # الصفوف المحذوفة محفوظة مع ما دُمجت فيه
+        self.assertEqual(self.conn.execute('SELECT id, date, merged_into FROM migration_removed_exam_dates').fetchall(),
+                         [(2, '2025-01-05', 1)])
+        self.assertEqual(self.conn.execute('SELECT id, date_id, original_date_id, teacher1_id, kept_id '
+                                           'FROM migration_removed_distributions').fetchall(), [(2, 1, 2, 8, 1)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.conn.execute("INSERT INTO exam_dates (date) VALUES ('2025-01-06')")
+
+    def test_workload_triggers_match_full_rebuild(self):
+        migrate(self.conn)
+        self.conn.executemany('INSERT INTO teachers (id, name) VALUES (?, ?)', [(i, f'مراقب {i}') for i in (1, 2, 3)])
+        self.conn.executemany("INSERT INTO rooms (id, name) VALUES (?, ?)", [(1, 'قاعة 1'), (2, 'قاعة 2')])
+        self.conn.executemany('INSERT INTO exam_dates (id, date) VALUES (?, ?)', [(1, '2025-01-05'), (2, '2025-01-06')])
+        self.conn.executemany('INSERT INTO distributions (date_id, room_id, teacher1_id, teacher2_id) VALUES (?, ?, ?, ?)',
+                              [(1, 1, 1, 2), (1, 2, 3, None), (2, 1, 2, 1)])
+        # تبديل مراقب، تغيير تاريخ، ثم حذف توزيع
+        self.conn.execute('UPDATE distributions SET teacher2_id = 3 WHERE id = 3')
+        self.conn.execute("UPDATE exam_dates SET date = '2025-01-07' WHERE id = 2")
+        self.conn.execute('DELETE FROM distributions WHERE id = 2')
+
+        query = 'SELECT * FROM teacher_workload WHERE total_duties > 0 ORDER BY teacher_id'
+        incremental = self.conn.execute(query).fetchall()
+        rebuild_teacher_workload(self.conn)
+        self.assertEqual(incremental, self.conn.execute(query).fetchall())
+        self.assertEqual(self.conn.execute('SELECT teacher_id, total_duties, last_duty_date FROM teacher_workload '
+                                           'ORDER BY teacher_id').fetchall(),
+                         [(1, 1, '2025-01-05'), (2, 2, '2025-01-07'), (3, 1, '2025-01-07')])
+
+    def test_row_versions_bump_on_any_update(self):
+        migrate(self.conn)
+        self.conn.executemany('INSERT INTO teachers (id, name) VALUES (?, ?)', [(i, f'مراقب {i}') for i in (1, 2)])
+        self.conn.execute("INSERT INTO rooms (id, name) VALUES (1, 'قاعة 1')")
+        self.conn.execute("INSERT INTO exam_dates (id, date) VALUES (1, '2025-01-05')")
+        self.conn.execute('INSERT INTO distributions (id, date_id, room_id, teacher1_id) VALUES (1, 1, 1, 1)')
+        version = 'SELECT version FROM distributions WHERE id = 1'
+        self.assertEqual(self.conn.execute(version).fetchone()[0], 1)
+
+        # كتابة لا تعرف العمود (المحرك أو كتابة مباشرة) ترفع الإصدار عبر المشغل
+        self.conn.execute('UPDATE distributions SET teacher2_id = 2 WHERE id = 1')
+        self.assertEqual(self.conn.execute(version).fetchone()[0], 2)
+
+        # الحفظ الشرطي يرفعه مرة واحدة، ومن يحمل إصداراً قديماً لا يعدل شيئاً
+        cas = 'UPDATE distributions SET teacher2_id = NULL, version = version + 1 WHERE id = 1 AND version = ?'
+        self.assertEqual(self.conn.execute(cas, (2,)).rowcount, 1)
+        self.assertEqual(self.conn.execute(cas, (2,)).rowcount, 0)
+        self.assertEqual(self.conn.execute(version).fetchone()[0], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
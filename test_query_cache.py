@@ -0,0 +1,62 @@
+import unittest
+from query_cache import QueryCache
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = QueryCache(maxsize=2)
+        self.loads = 0
+
+    def load(self, value='rows'):
+        def loader():
+            self.loads += 1
+            return value
+        return loader
+
+    def test_hit_until_table_version_changes(self):
+        sql = 'SELECT id, name\n    FROM teachers'
+        self.cache.get_or_load(sql, (), ('teachers',), self.load())
+        # المسافات المختلفة لا تغير المفتاح
+        self.cache.get_or_load('SELECT id, name FROM teachers', (), ('teachers',), self.load())
+        self.assertEqual(self.loads, 1)
+
+        # الكتابة على جدول آخر لا تبطل النتيجة
+        self.cache.bump('rooms')
+        self.cache.get_or_load(sql, (), ('teachers',), self.load())
+        self.assertEqual(self.loads, 1)
+
+        self.cache.bump('teachers')
+        self.cache.get_or_load(sql, (), ('teachers',), self.load())
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+    def test_invalidate_all_drops_entries_and_inflight_loads(self):
+        sql = 'SELECT id FROM rooms'
+        self.cache.get_or_load(sql, (), ('rooms',), self.load())
+
+        # تحميل بدأ قبل كتابة خارجية لا يُخزن بلقطة صالحة بعدها
+        def stale_loader():
+            self.cache.invalidate_all()
+            return 'old'
+        self.cache.get_or_load('SELECT id FROM teachers', (), ('teachers',), stale_loader)
+
+        self.assertEqual(self.cache.get_or_load(sql, (), ('rooms',), self.load('new')), 'new')
+        self.assertEqual(self.cache.get_or_load('SELECT id FROM teachers', (), ('teachers',), self.load('fresh')),
+                         'fresh')
+        self.assertEqual(self.loads, 3)
+
+    def test_list_params_and_eviction(self):
+        sql = 'SELECT id FROM teachers WHERE id IN (?, ?)'
+        self.cache.get_or_load(sql, [1, 2], ('teachers',), self.load())
+        self.cache.get_or_load(sql, (1, 2), ('teachers',), self.load())
+        self.cache.get_or_load(sql, [3, 4], ('teachers',), self.load())
+        self.cache.get_or_load(sql, [5, 6], ('teachers',), self.load())
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import ast
+import os
+import re
+import sqlite3
+import unittest
+from migrations import migrate
+from query_stats import normalize
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODULES = ('database.py', 'reports.py', 'ticket_system.py', 'leaves.py')
+
+# الجداول التي تكبر مع الاستخدام؛ المسح الكامل لها مقبول فقط في جملة بلا WHERE (قراءة الجدول كله عمداً)
+LARGE_TABLES = {'distributions', 'assignments', 'logs', 'leaves', 'tickets',
+                'ticket_comments', 'ticket_attachments', 'teacher_workload'}
+
+SQL_START = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b', re.IGNORECASE)
+ALIAS = re.compile(r'\b(?:FROM|JOIN|UPDATE)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+SCAN = re.compile(r'^SCAN (\w+)')
+
+# الصيغ الفعلية للجمل المبنية بـ f-string أو بإلحاق شروط، لكل دالة تبنيها
+RENDERED = {
+    ('database.py', '_ids_by'): [
+        'SELECT id, name FROM teachers WHERE name IN (?, ?, ?)',
+        'SELECT id, date FROM exam_dates WHERE date IN (?, ?, ?)',
+    ],
+    ('database.py', 'get_distributions'): [
+        'SELECT d.id, ed.date, r.name, t1.name, t2.name FROM exam_dates ed '
+        'JOIN distributions d ON d.date_id = ed.id JOIN rooms r ON d.room_id = r.id '
+        'LEFT JOIN teachers t1 ON d.teacher1_id = t1.id LEFT JOIN teachers t2 ON d.teacher2_id = t2.id '
+        'WHERE d.date_id = ? ORDER BY ed.date, r.name, d.id LIMIT ? OFFSET ?',
+        'SELECT d.id, ed.date, r.name, t1.name, t2.name FROM exam_dates ed '
+        'JOIN distributions d ON d.date_id = ed.id JOIN rooms r ON d.room_id = r.id '
+        'LEFT JOIN teachers t1 ON d.teacher1_id = t1.id LEFT JOIN teachers t2 ON d.teacher2_id = t2.id '
+        'WHERE ed.date >= ? AND (ed.date, r.name, d.id) > (?, ?, ?) ORDER BY ed.date, r.name, d.id LIMIT ? OFFSET ?',
+    ],
+    ('database.py', 'get_teacher_workload'): [
+        'SELECT t.name, COALESCE(w.total_duties, 0), w.last_duty_date, COALESCE(w.duties_sun, 0) '
+        'FROM teachers t LEFT JOIN teacher_workload w ON w.teacher_id = t.id ORDER BY 2 DESC, t.name',
+    ],
+    ('database.py', '_versioned_update'): [
+        'UPDATE teachers SET name = ?, experience = ? WHERE id = ?',
+        'UPDATE rooms SET name = ?, capacity = ?, version = version + 1 WHERE id = ? AND version = ?',
+        'UPDATE distributions SET teacher1_id = ?, teacher2_id = ?, version = version + 1 WHERE id = ? AND version = ?',
+        'UPDATE leaves SET status = ?, version = version + 1 WHERE id = ? AND version = ?',
+    ],
+    ('reports.py', '_distribution_rows'): [
+        'SELECT ed.date, r.name, t1.name, t2.name FROM distributions d JOIN exam_dates ed ON d.date_id = ed.id '
+        'JOIN rooms r ON d.room_id = r.id JOIN teachers t1 ON d.teacher1_id = t1.id '
+        'JOIN teachers t2 ON d.teacher2_id = t2.id WHERE ed.date = ?',
+    ],
+    ('reports.py', 'get_distribution_history'): [
+        'SELECT ed.date, r.name, t1.name, t2.name FROM main.distributions d '
+        'JOIN main.exam_dates ed ON d.date_id = ed.id JOIN main.rooms r ON d.room_id = r.id '
+        'LEFT JOIN main.teachers t1 ON d.teacher1_id = t1.id LEFT JOIN main.teachers t2 ON d.teacher2_id = t2.id '
+        'ORDER BY 1, 2',
+    ],
+    ('ticket_system.py', 'get_user_tickets'): [
+        'SELECT t.*, u1.username as creator_name, u2.username as assignee_name FROM tickets t '
+        'LEFT JOIN users u1 ON t.created_by = u1.id LEFT JOIN users u2 ON t.assigned_to = u2.id '
+        'WHERE (t.created_by = ? OR t.assigned_to = ?) AND t.status = ? ORDER BY t.created_at DESC',
+    ],
+}
+
+
+def collect_statements():
+    """(الملف، الدالة، السطر، الجملة) لكل نص SQL ثابت، ومجموعة الدوال التي تبني SQL بـ f-string"""
+    statements, dynamic = [], set()
+    for module in MODULES:
+        with open(os.path.join(ROOT, module), encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for function in ast.walk(tree):
+            if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for node in ast.walk(function):
+                if isinstance(node, ast.Constant) and isinstance(node.value, str) and SQL_START.match(node.value):
+                    statements.append((module, function.name, node.lineno, node.value))
+                elif isinstance(node, ast.JoinedStr):
+                    text = ''.join(part.value for part in node.values if isinstance(part, ast.Constant))
+                    if SQL_START.match(text):
+                        dynamic.add((module, function.name))
+    # الدوال المتداخلة تُرى مرتين عبر ast.walk
+    return sorted(set(statements)), dynamic
+
+
+def seed(conn):
+    """بيانات بأحجام فصل دراسي كبير ثم ANALYZE حتى تطابق خطط المخطط الإنتاج"""
+    conn.executemany('INSERT INTO users (id, username, password, role) VALUES (?, ?, ?, ?)',
+                     [(i, f'user{i}', 'x', 'staff') for i in range(1, 51)])
+    conn.executemany('INSERT INTO teachers (id, name) VALUES (?, ?)', [(i, f'مراقب {i}') for i in range(1, 301)])
+    conn.executemany('INSERT INTO rooms (id, name) VALUES (?, ?)', [(i, f'قاعة {i}') for i in range(1, 41)])
+    conn.executemany('INSERT INTO exam_dates (id, date) VALUES (?, ?)',
+                     [(i, f'2025-{1 + i // 28:02d}-{1 + i % 28:02d}') for i in range(1, 121)])
+    conn.executemany('INSERT INTO distributions (date_id, room_id, teacher1_id, teacher2_id) VALUES (?, ?, ?, ?)',
+                     [(d, r, 1 + (d * 7 + r * 2) % 300, 1 + (d * 7 + r * 2 + 1) % 300)
+                      for d in range(1, 121) for r in range(1, 41)])
+    conn.executemany('INSERT INTO logs (user_id, action, created_at) VALUES (?, ?, ?)',
+                     [(1 + i % 50, 'إجراء', f'2025-01-01 00:{i % 60:02d}:00') for i in range(20000)])
+    conn.executemany("INSERT INTO leaves (teacher_id, start_date, end_date, reason, status, approved_by) "
+                     "VALUES (?, ?, ?, 'سبب', ?, ?)",
+                     [(1 + i % 300, f'2025-01-{1 + i % 28:02d}', f'2025-02-{1 + i % 28:02d}',
+                       ('approved', 'قيد المراجعة', 'مرفوضة')[i % 3], 1 + i % 50) for i in range(3000)])
+    conn.executemany("INSERT INTO tickets (title, description, status, priority, created_by, assigned_to, "
+                     "created_at, updated_at) VALUES ('t', 'd', 'open', 'low', ?, ?, '2025', '2025')",
+                     [(1 + i % 50, 1 + (i * 3) % 50) for i in range(2000)])
+    conn.executemany("INSERT INTO ticket_comments (ticket_id, user_id, comment, created_at) VALUES (?, ?, 'c', '2025')",
+                     [(1 + i % 2000, 1 + i % 50) for i in range(6000)])
+    conn.executemany("INSERT INTO ticket_attachments (ticket_id, file_name, file_path, uploaded_by, uploaded_at) "
+                     "VALUES (?, 'f', 'p', ?, '2025')", [(1 + i % 2000, 1 + i % 50) for i in range(4000)])
+    conn.commit()
+    conn.execute('ANALYZE')
+
+
+def full_scans(conn, sql):
+    """الجداول الكبيرة التي تُمسح بالكامل في خطة الجملة"""
+    plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, [None] * sql.count('?')).fetchall()
+    aliases = {}
+    for table, alias in ALIAS.findall(sql):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.upper() not in ('ON', 'SET', 'WHERE', 'JOIN', 'LEFT', 'INNER', 'ORDER', 'GROUP'):
+            aliases[alias.lower()] = table.lower()
+    scanned = []
+    for row in plan:
+        match = SCAN.match(row[3])
+        if match and aliases.get(match.group(1).lower(), match.group(1).lower()) in LARGE_TABLES:
+            scanned.append(row[3])
+    return scanned
+
+
+class TestQueryPlans(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.conn = sqlite3.connect(':memory:')
+        migrate(cls.conn)
+        seed(cls.conn)
+        cls.statements, cls.dynamic = collect_statements()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+
+    def test_every_dynamic_statement_has_a_rendered_form(self):
+        self.assertEqual(self.dynamic - set(RENDERED), set())
+
+    def test_no_full_scan_on_large_tables(self):
+        checked = [(module, function, line, sql) for module, function, line, sql in self.statements
+                   if (module, function) not in self.dynamic]
+        checked += [(module, function, 0, sql) for (module, function), forms in RENDERED.items() for sql in forms]
+        self.assertGreater(len(checked), 50)
+
+        failures = []
+        for module, function, line, sql in checked:
+            if not re.search(r'\bWHERE\b', sql, re.IGNORECASE):
+                # قراءة الجدول كله مقصودة (تصدير أو إحصائيات شاملة)
+                continue
+            try:
+                scans = full_scans(self.conn, sql)
+            except sqlite3.OperationalError as e:
+                failures.append(f'{module}:{line} {function}: {e}: {normalize(sql)}')
+                continue
+            if scans:
+                failures.append(f'{module}:{line} {function}: {", ".join(scans)}: {normalize(sql)}')
+        self.assertEqual(failures, [], '\n'.join(failures))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import logging
+import os
+import tempfile
+import unittest
+from connection_pool import ConnectionPool
+from query_stats import QueryStats, normalize
+
+
+class TestQueryStats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stats = QueryStats(slow_threshold=60)
+        self.pool = ConnectionPool(os.path.join(self.tmpdir.name, 'stats.db'), stats=self.stats)
+        with self.pool.write() as conn:
+            conn.execute('CREATE TABLE teachers (id INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+            conn.executemany('INSERT INTO teachers (name) VALUES (?)', [(f'مراقب {i}',) for i in range(10)])
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmpdir.cleanup()
+
+    def by_query(self):
+        return {row['query']: row for row in self.stats.report()}
+
+    def test_normalize_merges_literals_and_in_lists(self):
+        self.assertEqual(normalize("SELECT *  FROM t\n WHERE id IN (?, ?, ?) AND name = 'x' LIMIT 5"),
+                         'SELECT * FROM t WHERE id IN (?) AND name = ? LIMIT ?')
+
+    def test_counts_every_path_through_the_pool(self):
+        for teacher_id in range(1, 4):
+            with self.pool.read() as conn:
+                conn.cursor().execute('SELECT name FROM teachers WHERE id = ?', (teacher_id,)).fetchone()
+        with self.pool.snapshot() as conn:
+            conn.execute('SELECT name FROM teachers WHERE id = ?', (4,)).fetchone()
+
+        row = self.by_query()['SELECT name FROM teachers WHERE id = ?']
+        self.assertEqual(row['count'], 4)
+        self.assertEqual(sum(row['histogram'].values()), 4)
+        self.assertEqual(self.by_query()['INSERT INTO teachers (name) VALUES (?)']['count'], 1)
+
+    def test_slow_query_is_logged_with_plan(self):
+        self.stats.slow_threshold = 0
+        with self.assertLogs('slow_queries', logging.WARNING) as logs:
+            with self.pool.read() as conn:
+                conn.execute('SELECT id FROM teachers WHERE name = ?', ('مراقب 1',)).fetchone()
+        self.assertTrue(any('SEARCH teachers USING' in line for line in logs.output))
+
+    def test_disabled_records_nothing(self):
+        self.stats.reset()
+        self.stats.enabled = False
+        with self.pool.read() as conn:
+            conn.execute('SELECT COUNT(*) FROM teachers').fetchone()
+        self.assertEqual(self.stats.report(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from database import Database
+from database import Database, DatabaseService
 from backup_manager import BackupManager
 import os
 import tempfile
@@ -15,15 +15,15 @@ class TestDatabase(unittest.TestCase):
         self.test_db_path = 'test_exam_system.db'
         if os.path.exists(self.test_db_path):
             os.remove(self.test_db_path)
-        self.db = Database()
-        self.db.conn = sqlite3.connect(self.test_db_path)
-        self.db.create_tables()
+        # توابع Database تكتب عبر مجمع الاتصالات فيجب أن يشير إلى قاعدة الاختبار نفسها
+        self.db = Database(self.test_db_path, start_backups=False)
     
     def tearDown(self):
-        # إغلاف الاتصال وحذف قاعدة البيانات المؤقتة
-        self.db.conn.close()
-        if os.path.exists(self.test_db_path):
-            os.remove(self.test_db_path)
+        # إغلاق الاتصالات وحذف قاعدة البيانات المؤقتة
+        self.db.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.test_db_path + suffix):
+                os.remove(self.test_db_path + suffix)
     
     def test_create_user(self):
         # اختبار إنشاء مستخدم جديد
@@ -49,6 +49,61 @@ class TestDatabase(unittest.TestCase):
         self.assertIsNotNone(result)
         self.assertEqual(result[0], name)
 
+class TestDatabaseService(unittest.TestCase):
+    def setUp(self):
+        self.test_db_path = 'test_service_system.db'
+        self.service = DatabaseService(self.test_db_path)
+    
+    def tearDown(self):
+        while self.service.running:
+            self.service.stop()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.test_db_path + suffix):
+                os.remove(self.test_db_path + suffix)
+    
+    def test_shared_instance_and_single_backup_thread(self):
+        first = self.service.start()
+        second = self.service.start()
+        self.assertIs(first, second)
+        self.assertTrue(self.service.backup_manager.backup_thread.is_alive())
+        
+        # يبقى الاتصال مفتوحاً حتى تحرير آخر مرجع
+        self.service.stop()
+        self.assertTrue(self.service.running)
+        backup_thread = self.service.backup_manager.backup_thread
+        self.service.stop()
+        self.assertFalse(self.service.running)
+        self.assertFalse(backup_thread.is_alive())
+
+class TestDistributionPaging(unittest.TestCase):
+    def setUp(self):
+        self.test_db_path = 'test_paging_system.db'
+        self.db = Database(self.test_db_path, start_backups=False)
+        with self.db.pool.write() as conn:
+            conn.executemany('INSERT INTO exam_dates (date) VALUES (?)', [('2025-01-06',), ('2025-01-05',)])
+            conn.executemany('INSERT INTO rooms (name) VALUES (?)', [('قاعة %d' % i,) for i in range(1, 4)])
+            conn.executemany('INSERT INTO teachers (name) VALUES (?)', [('مراقب %d' % i,) for i in range(1, 4)])
+            # مراقب مختلف لكل قاعة لأن assignments تمنع إسناد المراقب مرتين في اليوم نفسه
+            conn.execute('INSERT INTO distributions (date_id, room_id, teacher1_id) '
+                         'SELECT e.id, r.id, r.id FROM exam_dates e, rooms r')
+    
+    def tearDown(self):
+        self.db.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.test_db_path + suffix):
+                os.remove(self.test_db_path + suffix)
+    
+    def test_keyset_pages_match_full_order(self):
+        everything = self.db.get_distributions(per_page=100)
+        self.assertEqual(len(everything), 6)
+        # المراقب الثاني الفارغ لا يخفي الصف
+        self.assertIsNone(everything[0][4])
+        
+        first = self.db.get_distributions(per_page=4)
+        second = self.db.get_distributions(per_page=4, after=first[-1])
+        self.assertEqual(first + second, everything)
+        self.assertEqual(list(self.db.iter_distributions(batch_size=2)), everything)
+
 class TestBackupManager(unittest.TestCase):
     def setUp(self):
         self.test_db_path = 'test_backup_system.db'
@@ -57,17 +112,16 @@ class TestBackupManager(unittest.TestCase):
         self.backup_manager = BackupManager(self.test_db_path)
         
         # إنشاء بيانات اختبار
-        self.db = Database()
-        self.db.conn = sqlite3.connect(self.test_db_path)
-        self.db.create_tables()
+        self.db = Database(self.test_db_path, start_backups=False)
         cursor = self.db.conn.cursor()
         cursor.execute('INSERT INTO teachers (name, experience) VALUES (?, ?)', ('مراقب اختبار', 'متوسط'))
         self.db.conn.commit()
     
     def tearDown(self):
-        self.db.conn.close()
-        if os.path.exists(self.test_db_path):
-            os.remove(self.test_db_path)
+        self.db.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.test_db_path + suffix):
+                os.remove(self.test_db_path + suffix)
     
     def test_backup_restore(self):
         # إنشاء نسخة احتياطية
@@ -97,6 +151,27 @@ class TestBackupManager(unittest.TestCase):
         
         # تنظيف
         os.remove(backup_path)
+    
+    def test_backup_restore_keeps_extra_seats(self):
+        # المقعد الثالث موجود في assignments فقط وليس في أعمدة distributions
+        cursor = self.db.conn.cursor()
+        cursor.executemany('INSERT INTO teachers (name) VALUES (?)', [('مراقب 2',), ('مراقب 3',)])
+        cursor.execute("INSERT INTO exam_dates (date) VALUES ('2025-01-05')")
+        cursor.execute("INSERT INTO rooms (name) VALUES ('قاعة 1')")
+        cursor.execute('INSERT INTO distributions (date_id, room_id, teacher1_id, teacher2_id) VALUES (1, 1, 1, 2)')
+        cursor.execute('INSERT INTO assignments (distribution_id, date_id, teacher_id, seat) VALUES (1, 1, 3, 3)')
+        self.db.conn.commit()
+        
+        success, backup_path = self.backup_manager.create_backup()
+        self.assertTrue(success)
+        cursor.execute('DELETE FROM distributions')
+        self.db.conn.commit()
+        
+        success, message = self.backup_manager.restore_backup(backup_path)
+        self.assertTrue(success, message)
+        cursor.execute('SELECT seat, teacher_id FROM assignments ORDER BY seat')
+        self.assertEqual(cursor.fetchall(), [(1, 1), (2, 2), (3, 3)])
+        os.remove(backup_path)
 
 class TestExamSupervisionSystem(unittest.TestCase):
     def setUp(self):
@@ -20,7 +20,7 @@ class TicketSystem:
         self.db = db
         self.logger = logging.getLogger('ticket_system')
         self._setup_logging()
-        self._setup_database()
+        # جداول التذاكر من ترحيلات المخطط التي يطبقها Database عند فتحه
     
     def _setup_logging(self):
         """إعداد نظام التسجيل"""
@@ -31,56 +31,6 @@ class TicketSystem:
             self.logger.addHandler(handler)
             self.logger.setLevel(logging.INFO)
     
-    def _setup_database(self):
-        """إعداد جداول قاعدة البيانات"""
-        cursor = self.db.conn.cursor()
-        
-        # جدول التذاكر
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS tickets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                description TEXT NOT NULL,
-                status TEXT NOT NULL,
-                priority TEXT NOT NULL,
-                created_by INTEGER NOT NULL,
-                assigned_to INTEGER,
-                created_at TIMESTAMP NOT NULL,
-                updated_at TIMESTAMP NOT NULL,
-                FOREIGN KEY (created_by) REFERENCES users (id),
-                FOREIGN KEY (assigned_to) REFERENCES users (id)
-            )
-        """)
-        
-        # جدول التعليقات على التذاكر
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS ticket_comments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ticket_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                comment TEXT NOT NULL,
-                created_at TIMESTAMP NOT NULL,
-                FOREIGN KEY (ticket_id) REFERENCES tickets (id),
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # جدول المرفقات
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS ticket_attachments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ticket_id INTEGER NOT NULL,
-                file_name TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                uploaded_by INTEGER NOT NULL,
-                uploaded_at TIMESTAMP NOT NULL,
-                FOREIGN KEY (ticket_id) REFERENCES tickets (id),
-                FOREIGN KEY (uploaded_by) REFERENCES users (id)
-            )
-        """)
-        
-        self.db.conn.commit()
-    
     def create_ticket(self, title: str, description: str, created_by: int,
                       priority: TicketPriority = TicketPriority.MEDIUM) -> Optional[int]:
         """إنشاء تذكرة جديدة"""
@@ -240,7 +190,7 @@ class TicketSystem:
                 FROM tickets t
                 LEFT JOIN users u1 ON t.created_by = u1.id
                 LEFT JOIN users u2 ON t.assigned_to = u2.id
-                WHERE t.created_by = ? OR t.assigned_to = ?
+                WHERE (t.created_by = ? OR t.assigned_to = ?)
             """
             
             params = [user_id, user_id]